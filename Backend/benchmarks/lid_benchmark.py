@@ -0,0 +1,361 @@
+"""
+Offline benchmark for the language detection pipeline.
+
+Runs prelangid_clean -> bv2.detect_languages -> postlangid_process over a
+synthetic code-mixed corpus (benchmarks/lid_corpus.py) and reports, per stage,
+docs/sec, tokens/sec, p50/p99 latency and memory. The detector's internal stages
+come from bv2's stage sink:
+
+    tokenize      tokenize()
+    script_census script-decided documents short-circuit here (_script_census)
+    doc_classify  document-level fastText early exit (_document_fast_path)
+    pre_fuse      _pre_fuse_token() over every token
+    fuse          _apply_models_and_fuse() (model lookups + fusion)
+    disambiguate  low-confidence fallback, unknown injection, _enhanced_disambiguate()
+    dp            _enhanced_dp()
+    postprocess   sentence guess, _fill_unknowns(), _latin_consolidation(), span merge
+
+--profile writes bv2's finer-grained per-stage profile (bv2.StageProfiler) for
+the same run, as JSON or as folded stacks for flamegraph.pl.
+
+Memory columns are the largest resident set seen at the end of the stage and how
+much the process high-water mark (ru_maxrss) grew while the stage was running.
+
+Nothing is downloaded: the transformer is off unless --transformer is given (and
+then only loads from the local Hugging Face cache); fastText scores with the
+vendored lid.176.ftz through the engine POLYLANGID_FASTTEXT_ENGINE selects:
+"fasttext" (the fasttext package), "numpy" (bv2's NumPy .ftz reader) or "auto"
+(the default: the package when installed, else the NumPy reader).
+
+Run from Backend/. Examples:
+    python benchmarks/lid_benchmark.py --docs 2000
+    python benchmarks/lid_benchmark.py --docs 500 --json out.json
+    python benchmarks/lid_benchmark.py --docs 500 --profile stages.folded
+    python benchmarks/lid_benchmark.py --docs 500 --compare HEAD~3 HEAD
+    python benchmarks/lid_benchmark.py --docs 500 --compare HEAD WORKTREE
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+
+import lid_corpus
+
+# Report order; 'detect' is the whole detect_languages() call and bv2's sink
+# stages break it down (revisions without the sink only report 'detect')
+STAGES = ['prelangid_clean', 'detect', 'tokenize', 'script_census', 'doc_classify', 'pre_fuse', 'fuse', 'disambiguate',
+          'dp', 'postprocess', 'postlangid', 'total']
+SINK_STAGES = {
+    'tokenize': 'tokenize', 'script_census': 'script_census', 'doc_classify': 'doc_classify', 'prefuse': 'pre_fuse',
+    'inference': 'fuse',
+    'fallback': 'disambiguate', 'unknown_injection': 'disambiguate', 'disambiguate': 'disambiguate',
+    'dp': 'dp',
+    'sentence_guess': 'postprocess', 'fill_unknowns': 'postprocess', 'latin_consolidation': 'postprocess',
+    'span_merge': 'postprocess', 'postprocess': 'postprocess',
+}
+
+WORKTREE = 'WORKTREE'
+
+
+def _page_size():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return 4096
+
+
+PAGE_SIZE = _page_size()
+
+
+def current_rss_kb():
+    """Resident set size of this process in kB (Linux); falls back to the high-water mark."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE // 1024
+    except (OSError, ValueError, IndexError):
+        return max_rss_kb()
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageRecorder:
+    """bv2 stage sink that keeps one document's timings and memory samples."""
+
+    def __init__(self, forward=None):
+        self.forward = forward
+        self.timings = {}
+        self.tokens = 0
+        self.rss_kb = {}
+        self.hwm_growth_kb = {}
+        self._hwm = max_rss_kb()
+
+    def record(self, stage, seconds):
+        if self.forward is not None and stage in SINK_STAGES:
+            self.forward.record(stage, seconds)
+        name = SINK_STAGES.get(stage, stage)
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.sample(name)
+
+    def count(self, name, n=1):
+        if self.forward is not None:
+            self.forward.count(name, n)
+        if name == 'tokens':
+            self.tokens += n
+
+    def sample(self, name):
+        rss = current_rss_kb()
+        hwm = max_rss_kb()
+        self.rss_kb[name] = max(self.rss_kb.get(name, 0), rss)
+        self.hwm_growth_kb[name] = self.hwm_growth_kb.get(name, 0) + (hwm - self._hwm)
+        self._hwm = hwm
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def load_pipeline(source, enable_transformer):
+    """Import the pipeline modules from ``source`` (a Backend directory)."""
+    sys.path.insert(0, source)
+    from src.services.languagedetectionandpreprocessing import bv2
+    from src.services.languagedetectionandpreprocessing.prelangidprocessing import prelangid_clean
+    from src.services.languagedetectionandpreprocessing.postlangidprocessing import (
+        postlangid_process, lang_preprocessors
+    )
+    detector = bv2.get_detector(enable_transformer=enable_transformer)
+    return bv2, detector, prelangid_clean, postlangid_process, lang_preprocessors
+
+
+def run_benchmark(docs=1000, seed=13, source=BACKEND_DIR, enable_transformer=False, warmup=50, cold=False,
+                  profile_path=None):
+    """Benchmark the pipeline in this process and return a JSON-serialisable report."""
+    # Synthetic corpora repeat documents; measure the pipeline, not the result cache
+    os.environ['POLYLANGID_DOC_CACHE_SIZE'] = '0'
+    if not enable_transformer:
+        os.environ.setdefault('HF_HUB_OFFLINE', '1')
+        os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+
+    started = time.perf_counter()
+    bv2, detector, prelangid_clean, postlangid_process, lang_preprocessors = load_pipeline(source, enable_transformer)
+    load_seconds = time.perf_counter() - started
+    has_sink = hasattr(bv2, 'set_stage_sink')
+    profiler = bv2.StageProfiler() if profile_path and hasattr(bv2, 'StageProfiler') else None
+
+    corpus = lid_corpus.make_corpus(docs, seed)
+    for text in corpus[:warmup]:
+        detector.detect_languages(prelangid_clean(text))
+    if not cold and hasattr(detector, 'invalidate_caches'):
+        # Warm-up only primes imports and lazy models; token caches start empty either way
+        detector.invalidate_caches()
+
+    per_stage = {stage: [] for stage in STAGES}
+    rss_kb = {stage: 0 for stage in STAGES}
+    hwm_growth_kb = {stage: 0 for stage in STAGES}
+    total_tokens = 0
+
+    for text in corpus:
+        if cold and hasattr(detector, 'invalidate_caches'):
+            detector.invalidate_caches()
+        rec = StageRecorder(profiler)
+        t_doc = time.perf_counter()
+
+        t0 = time.perf_counter()
+        cleaned = prelangid_clean(text)
+        rec.record('prelangid_clean', time.perf_counter() - t0)
+
+        token = bv2.set_stage_sink(rec) if has_sink else None
+        try:
+            t0 = time.perf_counter()
+            segments = detector.detect_languages(cleaned)
+            detect_seconds = time.perf_counter() - t0
+        finally:
+            if token is not None:
+                bv2.reset_stage_sink(token)
+        rec.record('detect', detect_seconds)
+        if not has_sink:
+            rec.tokens += len(bv2.tokenize(cleaned))
+
+        t0 = time.perf_counter()
+        for segment, lang in segments:
+            if lang in bv2.TOP_20_LANGS:
+                postlangid_process(segment, lang, lang_preprocessors)
+        rec.record('postlangid', time.perf_counter() - t0)
+        rec.timings['total'] = time.perf_counter() - t_doc
+        rec.sample('total')
+
+        total_tokens += rec.tokens
+        for stage, seconds in rec.timings.items():
+            per_stage.setdefault(stage, []).append(seconds)
+        for stage, kb in rec.rss_kb.items():
+            rss_kb[stage] = max(rss_kb.get(stage, 0), kb)
+        for stage, kb in rec.hwm_growth_kb.items():
+            hwm_growth_kb[stage] = hwm_growth_kb.get(stage, 0) + kb
+
+    stages = {}
+    for stage, values in per_stage.items():
+        if not values:
+            continue
+        busy = sum(values)
+        ordered = sorted(values)
+        stages[stage] = {
+            'docs_per_sec': len(values) / busy if busy else 0.0,
+            'tokens_per_sec': total_tokens / busy if busy else 0.0,
+            'p50_ms': percentile(ordered, 50) * 1000.0,
+            'p99_ms': percentile(ordered, 99) * 1000.0,
+            'total_s': busy,
+            'peak_rss_mb': rss_kb.get(stage, 0) / 1024.0,
+            'rss_hwm_growth_mb': hwm_growth_kb.get(stage, 0) / 1024.0,
+        }
+
+    if profiler is not None:
+        profiler.dump(profile_path)
+
+    models = {
+        'transformer': bool(getattr(detector.model_mgr, 'transformer', None)),
+        'fasttext': bool(getattr(detector.model_mgr, 'fasttext', None)),
+    }
+    return {
+        'source': source,
+        'docs': docs,
+        'seed': seed,
+        'tokens': total_tokens,
+        'cold_caches': cold,
+        'models': models,
+        'load_s': load_seconds,
+        'peak_rss_mb': max_rss_kb() / 1024.0,
+        'stages': stages,
+    }
+
+
+def format_report(report):
+    lines = [
+        f"source: {report['source']}",
+        f"docs={report['docs']} tokens={report['tokens']} seed={report['seed']} "
+        f"models={','.join(k for k, v in report['models'].items() if v) or 'heuristics only'} "
+        f"load={report['load_s']:.2f}s peak_rss={report['peak_rss_mb']:.0f}MB",
+        f"{'stage':<16}{'docs/s':>11}{'tokens/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'rss MB':>9}{'+hwm MB':>9}",
+    ]
+    for stage in STAGES + sorted(set(report['stages']) - set(STAGES)):
+        s = report['stages'].get(stage)
+        if s is None:
+            continue
+        lines.append(
+            f"{stage:<16}{s['docs_per_sec']:>11.1f}{s['tokens_per_sec']:>12.0f}{s['p50_ms']:>10.3f}"
+            f"{s['p99_ms']:>10.3f}{s['peak_rss_mb']:>9.0f}{s['rss_hwm_growth_mb']:>9.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def format_comparison(base, head, base_name, head_name):
+    lines = [
+        f"{base_name} -> {head_name} ({head['docs']} docs)",
+        f"{'stage':<16}{'base p50':>10}{'head p50':>10}{'base p99':>10}{'head p99':>10}{'speedup':>9}",
+    ]
+    for stage in STAGES + sorted((set(base['stages']) | set(head['stages'])) - set(STAGES)):
+        b, h = base['stages'].get(stage), head['stages'].get(stage)
+        if b is None or h is None:
+            continue
+        speedup = (b['total_s'] / h['total_s']) if h['total_s'] else float('inf')
+        lines.append(f"{stage:<16}{b['p50_ms']:>10.3f}{h['p50_ms']:>10.3f}{b['p99_ms']:>10.3f}"
+                     f"{h['p99_ms']:>10.3f}{speedup:>8.2f}x")
+    lines.append(f"peak rss: {base['peak_rss_mb']:.0f}MB -> {head['peak_rss_mb']:.0f}MB")
+    return '\n'.join(lines)
+
+
+def export_revision(rev, dest):
+    """Extract Backend/ at ``rev`` into ``dest`` and return the Backend path there."""
+    top = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=BACKEND_DIR, text=True).strip()
+    prefix = os.path.relpath(BACKEND_DIR, top)
+    os.makedirs(dest, exist_ok=True)
+    archive = os.path.join(dest, 'src.tar')
+    subprocess.check_call(['git', 'archive', '--format=tar', '-o', archive, rev, prefix], cwd=top)
+    with tarfile.open(archive) as tar:
+        tar.extractall(dest)
+    os.remove(archive)
+    return os.path.join(dest, prefix)
+
+
+def run_isolated(source, args):
+    """Benchmark ``source`` in a fresh interpreter so imports and memory don't leak between runs."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        out = f.name
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__), '--source', source, '--json', out,
+               '--docs', str(args.docs), '--seed', str(args.seed), '--warmup', str(args.warmup), '--quiet']
+        if args.transformer:
+            cmd.append('--transformer')
+        if args.cold:
+            cmd.append('--cold')
+        subprocess.check_call(cmd)
+        with open(out) as f:
+            return json.load(f)
+    finally:
+        os.remove(out)
+
+
+def compare(args):
+    base_rev, head_rev = args.compare
+    reports = {}
+    with tempfile.TemporaryDirectory(prefix='lid-bench-') as tmp:
+        for rev in (base_rev, head_rev):
+            if rev == WORKTREE:
+                source = BACKEND_DIR
+            else:
+                source = export_revision(rev, os.path.join(tmp, rev.replace('/', '_').replace('~', '_')))
+            print(f"benchmarking {rev} ...", file=sys.stderr)
+            reports[rev] = run_isolated(source, args)
+            reports[rev]['revision'] = rev
+    return reports[base_rev], reports[head_rev]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark for the language detection pipeline')
+    parser.add_argument('--docs', type=int, default=1000, help='documents in the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=13, help='corpus seed')
+    parser.add_argument('--warmup', type=int, default=50, help='documents run before timing starts')
+    parser.add_argument('--cold', action='store_true', help='clear token caches before every document')
+    parser.add_argument('--transformer', action='store_true', help='enable the transformer (local HF cache only)')
+    parser.add_argument('--source', default=BACKEND_DIR, help='Backend directory to import the pipeline from')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'),
+                        help=f'compare two git revisions ({WORKTREE} = uncommitted tree)')
+    parser.add_argument('--json', help='also write the report(s) to this file')
+    parser.add_argument('--profile', help='write the per-stage detector profile here (.json, or .folded for flamegraphs)')
+    parser.add_argument('--quiet', action='store_true', help='no table on stdout')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        base, head = compare(args)
+        result = {'base': base, 'head': head}
+        if not args.quiet:
+            print(format_report(base))
+            print()
+            print(format_report(head))
+            print()
+            print(format_comparison(base, head, args.compare[0], args.compare[1]))
+    else:
+        result = run_benchmark(args.docs, args.seed, os.path.abspath(args.source), args.transformer,
+                               args.warmup, args.cold, args.profile)
+        if not args.quiet:
+            print(format_report(result))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
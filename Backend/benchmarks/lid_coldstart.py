@@ -0,0 +1,164 @@
+"""
+Cold-start cost of bv2 and of the service: module import, model loading and the first request.
+
+Every run is a fresh interpreter (the only way to measure an import), started
+with ``-X importtime``. Per run it reports:
+
+    import s      ``import bv2`` wall time
+    detector s    get_detector(): loading the transformer, fastText, lexicon, ...
+    first ms      first detect_languages call (lazily imported tokenizers load here)
+    second ms     a second, different request, for comparison
+
+and, from the importtime log of the first run, the modules with the largest
+cumulative import time. Heavy optional packages (transformers, torch,
+onnxruntime, fastText, jieba, Janome, PyThaiNLP, pyvi, Sastrawi) are imported
+on first use, so they should show up under "detector" or "first", not "import".
+--eager calls bv2.load_dependencies() right after the import, as lid_server's
+preload does, to compare.
+
+--service measures the Flask service instead: "import" is ``import
+languagedectection`` (lid_handlers, bv2, pre/postlangidprocessing and Flask),
+"detector" the wait until /ready answers 200, and "first"/"second" are
+POST /detect_and_preprocess requests through the test client, so they include
+postlangidprocessing's lazily imported spaCy, jieba, MeCab and KoNLPy.
+
+Run from Backend/. Examples:
+    python benchmarks/lid_coldstart.py --runs 5
+    python benchmarks/lid_coldstart.py --no-transformer --json coldstart.json
+    python benchmarks/lid_coldstart.py --service --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+SERVICE_DIR = os.path.join(BACKEND_DIR, 'src', 'python')
+
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {backend!r})
+started = time.perf_counter()
+from src.services.languagedetectionandpreprocessing import bv2
+imported = time.perf_counter()
+if {eager!r}:
+    bv2.load_dependencies()
+det = bv2.get_detector(enable_transformer={transformer!r})
+built = time.perf_counter()
+det.detect_languages({first!r})
+first = time.perf_counter()
+det.detect_languages({second!r})
+second = time.perf_counter()
+print(json.dumps({{
+    'import_s': imported - started,
+    'detector_s': built - imported,
+    'first_ms': (first - built) * 1000.0,
+    'second_ms': (second - first) * 1000.0,
+    'missing': sorted(bv2.missing),
+}}))
+"""
+
+SERVICE_CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {backend!r})
+sys.path.insert(0, {service!r})
+started = time.perf_counter()
+import languagedectection
+imported = time.perf_counter()
+from src.services.languagedetectionandpreprocessing import bv2, postlangidprocessing
+if {eager!r}:
+    bv2.load_dependencies()
+    postlangidprocessing.load_dependencies()
+client = languagedectection.app.test_client()
+while client.get('/ready').status_code != 200:
+    time.sleep(0.005)
+ready = time.perf_counter()
+assert client.post('/detect_and_preprocess', json={{'text': {first!r}}}).status_code == 200
+first = time.perf_counter()
+assert client.post('/detect_and_preprocess', json={{'text': {second!r}}}).status_code == 200
+second = time.perf_counter()
+print(json.dumps({{
+    'import_s': imported - started,
+    'detector_s': ready - imported,
+    'first_ms': (first - ready) * 1000.0,
+    'second_ms': (second - first) * 1000.0,
+    'missing': sorted(set(bv2.missing) | set(postlangidprocessing.load_dependencies())),
+}}), flush=True)
+"""
+
+FIRST = "I think this stream is great tonight, je pense que c'est vraiment très belle 我觉得今天的比赛真的非常好"
+SECOND = "ich glaube dass dieses spiel heute wirklich sehr gut ist とても良いと思います"
+
+
+def parse_importtime(stderr):
+    """(cumulative us, module) per line of ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|', 2)
+        rows.append((int(cumulative), name.rstrip()))
+    return rows
+
+
+def run_once(eager, transformer, service=False):
+    if service:
+        code = SERVICE_CHILD.format(backend=BACKEND_DIR, service=SERVICE_DIR, eager=eager, first=FIRST, second=SECOND)
+    else:
+        code = CHILD.format(backend=BACKEND_DIR, eager=eager, transformer=transformer, first=FIRST, second=SECOND)
+    env = dict(os.environ, HF_HUB_OFFLINE='1', TRANSFORMERS_OFFLINE='1')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, env=env, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(proc.stderr)
+
+
+def top_imports(rows, count):
+    """Largest cumulative import times among top-level imports (bv2 itself and
+    anything imported lazily later) and bv2's direct imports; the log indents
+    nested imports by two spaces per level."""
+    top = [(us, name) for us, name in rows if len(name) - len(name.lstrip()) <= 3]
+    return sorted(top, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure bv2 import and first-request latency')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--eager', action='store_true', help='call bv2.load_dependencies() after the import')
+    parser.add_argument('--no-transformer', action='store_true', help='get_detector(enable_transformer=False)')
+    parser.add_argument('--service', action='store_true',
+                        help='time the Flask service import, /ready and the first HTTP requests')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    parser.add_argument('--json', help='write the report here')
+    args = parser.parse_args(argv)
+    if args.service and args.no_transformer:
+        parser.error('--no-transformer does not apply to --service (the service builds the default detector)')
+
+    runs, rows = [], None
+    for i in range(args.runs):
+        result, imports = run_once(args.eager, not args.no_transformer, args.service)
+        runs.append(result)
+        rows = rows or imports
+    keys = ('import_s', 'detector_s', 'first_ms', 'second_ms')
+    best = {k: min(r[k] for r in runs) for k in keys}
+
+    print(f"runs={len(runs)}  service={args.service}  eager={args.eager}  transformer={not args.no_transformer}  "
+          f"missing={runs[0]['missing']}")
+    print(f"{'':<8}{'import s':>10}{'ready s' if args.service else 'detector s':>12}{'first ms':>10}{'second ms':>11}")
+    for label, r in [(f"run {i + 1}", r) for i, r in enumerate(runs)] + [('best', best)]:
+        print(f"{label:<8}{r['import_s']:>10.3f}{r['detector_s']:>12.3f}{r['first_ms']:>10.1f}{r['second_ms']:>11.1f}")
+    print('slowest imports (cumulative ms):')
+    for us, name in top_imports(rows, args.top):
+        print(f"  {us / 1000.0:>9.1f}  {name.strip()}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'service': args.service, 'eager': args.eager, 'transformer': not args.no_transformer, 'runs': runs, 'best': best,
+                       'imports_ms': [[name.strip(), us / 1000.0] for us, name in top_imports(rows, args.top)]}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Deterministic synthetic corpora for the language detection benchmarks.
+
+Documents mimic live-chat traffic: one to three languages per message, switched
+mid-sentence, with the URLs, mentions, hashtags and emoji that prelangid_clean
+strips. The same (size, seed) always produces the same corpus, so numbers from
+different runs and revisions are comparable.
+"""
+import random
+
+
+# A couple dozen common words per supported language; enough to exercise the
+# script checks, pattern hints and model lookups without shipping a dataset.
+WORDS = {
+    'en': "the people really think this stream is going to be great tonight because everyone here loves the music".split(),
+    'fr': "je pense que cette vidéo est vraiment très belle mais nous avons besoin de plus de temps pour regarder".split(),
+    'de': "ich glaube dass dieses spiel heute wirklich sehr gut ist aber wir brauchen noch mehr zeit zum schauen".split(),
+    'es': "creo que este partido de hoy es muy bueno pero necesitamos más tiempo para ver todo con mis amigos".split(),
+    'it': "penso che questa partita di oggi sia davvero molto bella ma abbiamo bisogno di più tempo per guardare".split(),
+    'pt': "eu acho que esse jogo de hoje está muito bom mas precisamos de mais tempo para assistir com você".split(),
+    'ru': "я думаю что эта игра сегодня очень хорошая но нам нужно больше времени чтобы посмотреть всё".split(),
+    'tr': "bence bugünkü oyun gerçekten çok güzel ama izlemek için daha fazla zamana ihtiyacımız var".split(),
+    'vi': "tôi nghĩ rằng trận đấu hôm nay thật sự rất hay nhưng chúng ta cần thêm thời gian để xem".split(),
+    'ar': "أعتقد أن هذه المباراة اليوم جميلة جدا لكننا نحتاج إلى مزيد من الوقت للمشاهدة مع الأصدقاء".split(),
+    'ur': "میں سمجھتا ہوں کہ آج کا میچ بہت اچھا ہے لیکن ہمیں دیکھنے کے لیے مزید وقت چاہیے".split(),
+    'hi': "मुझे लगता है कि आज का मैच सच में बहुत अच्छा है लेकिन हमें देखने के लिए और समय चाहिए".split(),
+    'bn': "আমি মনে করি আজকের খেলা সত্যিই খুব ভালো কিন্তু দেখার জন্য আমাদের আরও সময় দরকার".split(),
+    'id': "saya pikir pertandingan hari ini benar benar sangat bagus tapi kami butuh lebih banyak waktu untuk menonton".split(),
+    'pl': "myślę że dzisiejszy mecz jest naprawdę bardzo dobry ale potrzebujemy więcej czasu żeby obejrzeć wszystko".split(),
+    'nl': "ik denk dat de wedstrijd van vandaag echt heel goed is maar we hebben meer tijd nodig om te kijken".split(),
+    'ko': "오늘 경기는 정말 아주 좋은 것 같아요 하지만 우리는 보려면 시간이 더 필요해요 친구들과 함께".split(),
+    # No spaces in Chinese/Japanese/Thai, so these are phrase-sized chunks
+    'zh': ["我觉得", "今天的", "比赛", "真的", "非常好", "但是", "我们", "需要", "更多", "时间", "来看", "朋友们"],
+    'ja': ["今日の", "試合は", "本当に", "とても", "良いと", "思います", "でも", "見るために", "もっと", "時間が", "必要です"],
+    'th': ["ฉันคิดว่า", "การแข่งขัน", "วันนี้", "ดีมาก", "จริงๆ", "แต่เรา", "ต้องการ", "เวลา", "มากขึ้น", "เพื่อดู"],
+}
+
+NOISE = [
+    "https://example.com/watch?v=abc123", "@streamer", "#live", "#worldcup", "😂😂", "🔥", "!!!", "lol", "123",
+]
+
+# Rough mix of a multilingual live chat: mostly Latin-script pairs with a tail of everything else
+LANG_WEIGHTS = {
+    'en': 30, 'es': 10, 'fr': 6, 'de': 5, 'it': 4, 'pt': 5, 'hi': 8, 'ur': 4, 'ar': 4, 'ru': 4,
+    'tr': 3, 'vi': 3, 'bn': 2, 'id': 3, 'pl': 1, 'nl': 2, 'th': 1, 'zh': 3, 'ja': 3, 'ko': 2,
+}
+
+
+def make_document(rng, max_langs=3, min_words=4, max_words=40, noise_rate=0.15):
+    """One synthetic code-mixed document and its (segment, language) ground truth."""
+    langs = list(LANG_WEIGHTS)
+    weights = [LANG_WEIGHTS[lang] for lang in langs]
+    n_words = rng.randint(min_words, max_words)
+    n_switches = rng.randint(1, max_langs)
+    chosen = [rng.choices(langs, weights)[0] for _ in range(n_switches)]
+
+    parts, truth = [], []
+    remaining = n_words
+    for i, lang in enumerate(chosen):
+        count = remaining if i == len(chosen) - 1 else max(1, remaining // (len(chosen) - i))
+        remaining -= count
+        words = [rng.choice(WORDS[lang]) for _ in range(count)]
+        sep = '' if lang in ('zh', 'ja', 'th') else ' '
+        segment = sep.join(words)
+        parts.append(segment)
+        truth.append((segment, lang))
+        if rng.random() < noise_rate:
+            parts.append(rng.choice(NOISE))
+        if remaining <= 0:
+            break
+    return ' '.join(parts), truth
+
+
+def make_corpus(size=1000, seed=13, **kwargs):
+    """``size`` documents as a list of strings."""
+    rng = random.Random(seed)
+    return [make_document(rng, **kwargs)[0] for _ in range(size)]
+
+
+def make_labeled_corpus(size=1000, seed=13, **kwargs):
+    """``size`` (document, ground-truth segments) pairs."""
+    rng = random.Random(seed)
+    return [make_document(rng, **kwargs) for _ in range(size)]
@@ -0,0 +1,267 @@
+"""
+Distil bv2's fused per-token distribution into the "fast" tier's DistilledTokenModel.
+
+    label     run the full ensemble (EnhancedDetector.token_distributions) over the
+              distinct tokens of a local corpus and store them with their soft labels
+    train     fit the char n-gram linear model to those soft labels (NumPy only,
+              Adagrad on frequency-weighted cross-entropy) and save it as .npz
+    evaluate  run held-out documents through the ensemble and through the fast
+              tier and report agreement and throughput
+
+Corpus files hold one document per line (UTF-8); --synthetic N uses the
+benchmark corpus generator instead. Soft labels cover the 20 supported
+languages plus "", which takes whatever mass the ensemble left unassigned
+(empty or thresholded distributions). Training weights each token by
+1 + log(count), so frequent tokens matter more without drowning the tail.
+
+evaluate reports:
+    token agree   top-1 agreement of the per-token distributions (tokens the ensemble labels)
+    token TV      mean total-variation distance between them
+    char agree    share of non-space characters given the same language (as lid_golden)
+    docs/s        for each tier, with the document cache off
+
+Run from Backend/. Examples:
+    python benchmarks/lid_distill.py label chats.txt -o labels.npz
+    python benchmarks/lid_distill.py train labels.npz -o distilled.npz
+    python benchmarks/lid_distill.py evaluate distilled.npz --corpus held_out.txt
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import unicodedata
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+
+import lid_corpus
+from lid_golden import char_labels
+from lid_onnx import load_bv2
+
+
+def read_corpus(paths, synthetic=0, seed=13):
+    docs = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            docs.extend(line.strip() for line in f if line.strip())
+    if synthetic:
+        docs.extend(lid_corpus.make_corpus(synthetic, seed))
+    return docs
+
+
+def label_langs(bv2):
+    return sorted(bv2.TOP_20_LANGS) + ['']
+
+
+def soft_labels(detector, tokens, langs, batch_size=512):
+    """(tokens x langs) targets from the ensemble; "" gets the unassigned remainder."""
+    import numpy as np
+    col = {lang: j for j, lang in enumerate(langs) if lang}
+    targets = np.zeros((len(tokens), len(langs)), dtype=np.float32)
+    for start in range(0, len(tokens), batch_size):
+        dists = detector.token_distributions(tokens[start:start + batch_size])
+        for i, dist in enumerate(dists, start):
+            for lang, p in dist.items():
+                if lang in col:
+                    targets[i, col[lang]] = p
+    mass = targets.sum(axis=1)
+    over = mass > 1.0
+    targets[over] /= mass[over][:, None]
+    targets[:, -1] = np.clip(1.0 - targets.sum(axis=1), 0.0, 1.0)
+    return targets
+
+
+def label(bv2, docs, max_tokens):
+    import numpy as np
+    counts = Counter(t for doc in docs for t in bv2.tokenize(unicodedata.normalize('NFC', doc)))
+    tokens = [t for t, _ in counts.most_common(max_tokens)]
+    detector = bv2.EnhancedDetector()
+    langs = label_langs(bv2)
+    started = time.perf_counter()
+    targets = soft_labels(detector, tokens, langs)
+    seconds = time.perf_counter() - started
+    return {
+        'tokens': np.array(tokens),
+        'counts': np.array([counts[t] for t in tokens], dtype=np.int64),
+        'targets': targets,
+        'langs': np.array(langs),
+    }, seconds
+
+
+def train(bv2, tokens, targets, weights, langs, dim=1 << 18, minn=1, maxn=4,
+          epochs=20, lr=0.5, batch_size=256, seed=13, log=print):
+    """Fit a DistilledTokenModel to soft targets with Adagrad on weighted cross-entropy."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    prior = (targets * weights[:, None]).sum(axis=0) / weights.sum()
+    model = bv2.DistilledTokenModel(np.zeros((dim, len(langs)), dtype=np.float32),
+                                    np.log(prior + 1e-4), langs, minn, maxn)
+    W, b = model.weights, model.bias
+    GW = np.full(W.shape, 1e-8, dtype=np.float32)
+    Gb = np.full(b.shape, 1e-8, dtype=np.float32)
+
+    for epoch in range(epochs):
+        loss = 0.0
+        order = rng.permutation(len(tokens))
+        for start in range(0, len(tokens), batch_size):
+            idx = order[start:start + batch_size]
+            batch = [tokens[i] for i in idx]
+            y, w = targets[idx], weights[idx] / weights[idx].sum()
+            probs = model.predict_probs(batch)
+            loss -= float((w[:, None] * y * np.log(probs + 1e-9)).sum()) * len(idx)
+            grad_z = (probs - y) * w[:, None]
+
+            ids, lengths = model.feature_batch(batch)
+            rows = np.repeat(np.arange(len(batch)), lengths)
+            uniq, inv = np.unique(ids, return_inverse=True)
+            gW = np.zeros((len(uniq), len(langs)), dtype=np.float32)
+            np.add.at(gW, inv, grad_z[rows] / lengths[rows][:, None])
+            GW[uniq] += gW * gW
+            W[uniq] -= lr * gW / np.sqrt(GW[uniq])
+            gb = grad_z.sum(axis=0)
+            Gb += gb * gb
+            b -= lr * gb / np.sqrt(Gb)
+        log(f"epoch {epoch + 1}/{epochs}  loss {loss / len(tokens):.4f}")
+    return model
+
+
+def token_report(model, tokens, targets):
+    """Top-1 agreement and mean total variation of the model against soft targets."""
+    import numpy as np
+    probs = model.predict_probs(tokens)
+    labelled = targets[:, :-1].sum(axis=1) > 0
+    agree = (probs[:, :-1].argmax(axis=1) == targets[:, :-1].argmax(axis=1))[labelled]
+    tv = 0.5 * np.abs(probs - targets).sum(axis=1)
+    return {
+        'tokens': len(tokens),
+        'token_agreement': float(agree.mean()) if agree.size else 1.0,
+        'token_tv': float(tv.mean()) if tv.size else 0.0,
+    }
+
+
+def _run_docs(detector, docs):
+    started = time.perf_counter()
+    outputs = [detector.detect_languages(doc) for doc in docs]
+    return outputs, time.perf_counter() - started
+
+
+def evaluate(bv2, model_path, docs):
+    """Ensemble vs fast tier on ``docs``: token and character agreement, throughput."""
+    os.environ['POLYLANGID_DOC_CACHE_SIZE'] = '0'
+    bv2.DOC_CACHE_MAX_ENTRIES = 0
+    full = bv2.EnhancedDetector()
+    bv2.TOKEN_BACKEND, bv2.DISTILLED_PATH = 'fast', model_path
+    fast = bv2.EnhancedDetector(enable_transformer=False)
+    if fast.model_mgr.distilled is None:
+        raise SystemExit(f"could not load {model_path}")
+
+    langs = fast.model_mgr.distilled.langs
+    tokens = sorted({t for doc in docs for t in bv2.tokenize(unicodedata.normalize('NFC', doc))})
+    report = token_report(fast.model_mgr.distilled, tokens, soft_labels(full, tokens, langs))
+
+    ref, full_s = _run_docs(full, docs)
+    cand, fast_s = _run_docs(fast, docs)
+    chars = agree = 0
+    for r, c in zip(ref, cand):
+        rl, _ = char_labels(r)
+        cl, _ = char_labels(c)
+        chars += max(len(rl), len(cl))
+        agree += sum(1 for a, b in zip(rl, cl) if a == b)
+    ntok = sum(len(bv2.tokenize(d)) for d in docs)
+    report.update({
+        'docs': len(docs),
+        'char_agreement': agree / chars if chars else 1.0,
+        'identical_docs': sum(1 for r, c in zip(ref, cand) if r == c) / len(docs) if docs else 1.0,
+        'ensemble_docs_per_sec': len(docs) / full_s if full_s else 0.0,
+        'fast_docs_per_sec': len(docs) / fast_s if fast_s else 0.0,
+        'ensemble_tokens_per_sec': ntok / full_s if full_s else 0.0,
+        'fast_tokens_per_sec': ntok / fast_s if fast_s else 0.0,
+        'models': {
+            'transformer': bool(full.model_mgr.transformer),
+            'fasttext': bool(full.model_mgr.fasttext),
+        },
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Distil the bv2 ensemble into the fast-tier token model')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('label', help='soft-label the distinct tokens of a corpus with the ensemble')
+    p.add_argument('corpus', nargs='*', help='text files, one document per line')
+    p.add_argument('--synthetic', type=int, default=0, help='add N generated benchmark documents')
+    p.add_argument('--seed', type=int, default=13)
+    p.add_argument('--max-tokens', type=int, default=200_000, help='most frequent tokens to keep')
+    p.add_argument('-o', '--output', required=True)
+
+    p = sub.add_parser('train', help='fit the distilled model to soft labels')
+    p.add_argument('labels')
+    p.add_argument('-o', '--output', required=True)
+    p.add_argument('--dim', type=int, default=1 << 18, help='hash buckets')
+    p.add_argument('--minn', type=int, default=1)
+    p.add_argument('--maxn', type=int, default=4)
+    p.add_argument('--epochs', type=int, default=20)
+    p.add_argument('--lr', type=float, default=0.5)
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--holdout', type=float, default=0.1, help='share of tokens kept out for the report')
+    p.add_argument('--seed', type=int, default=13)
+
+    p = sub.add_parser('evaluate', help='compare the fast tier with the ensemble on documents')
+    p.add_argument('model')
+    p.add_argument('--corpus', nargs='*', default=[], help='text files, one document per line')
+    p.add_argument('--synthetic', type=int, default=0)
+    p.add_argument('--seed', type=int, default=29)
+    p.add_argument('--json', help='write the report here')
+    args = parser.parse_args(argv)
+
+    bv2 = load_bv2()
+    import numpy as np
+
+    if args.cmd == 'label':
+        docs = read_corpus(args.corpus, args.synthetic, args.seed)
+        if not docs:
+            parser.error('no documents: give corpus files or --synthetic N')
+        data, seconds = label(bv2, docs, args.max_tokens)
+        np.savez_compressed(args.output, **data)
+        print(f"{len(docs)} docs, {len(data['tokens'])} distinct tokens labelled in {seconds:.1f}s -> {args.output}")
+        return 0
+
+    if args.cmd == 'train':
+        with np.load(args.labels, allow_pickle=False) as data:
+            tokens = [str(t) for t in data['tokens']]
+            targets, counts, langs = data['targets'], data['counts'], [str(l) for l in data['langs']]
+        order = np.random.default_rng(args.seed).permutation(len(tokens))
+        cut = int(len(tokens) * (1.0 - args.holdout))
+        fit, held = order[:cut], order[cut:]
+        weights = 1.0 + np.log(counts.astype(np.float64))
+        started = time.perf_counter()
+        model = train(bv2, [tokens[i] for i in fit], targets[fit], weights[fit].astype(np.float32), langs,
+                      args.dim, args.minn, args.maxn, args.epochs, args.lr, args.batch_size, args.seed)
+        print(f"trained on {len(fit)} tokens in {time.perf_counter() - started:.1f}s")
+        for name, idx in (('train', fit), ('holdout', held)):
+            r = token_report(model, [tokens[i] for i in idx], targets[idx])
+            print(f"{name:<8} tokens={r['tokens']}  agree {r['token_agreement']:.4f}  TV {r['token_tv']:.4f}")
+        model.save(args.output)
+        print(f"saved {args.output} ({os.path.getsize(args.output) / (1024 * 1024):.1f} MB)")
+        return 0
+
+    docs = read_corpus(args.corpus, args.synthetic, args.seed)
+    if not docs:
+        parser.error('no documents: give --corpus files or --synthetic N')
+    report = evaluate(bv2, args.model, docs)
+    print(f"docs={report['docs']}  tokens={report['tokens']}  models={report['models']}")
+    print(f"token agree {report['token_agreement']:.4f}  token TV {report['token_tv']:.4f}  "
+          f"char agree {report['char_agreement']:.4f}  identical docs {report['identical_docs']:.4f}")
+    print(f"docs/s  ensemble {report['ensemble_docs_per_sec']:.1f}  fast {report['fast_docs_per_sec']:.1f}  "
+          f"(x{report['fast_docs_per_sec'] / max(report['ensemble_docs_per_sec'], 1e-9):.1f})")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
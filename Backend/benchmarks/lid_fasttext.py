@@ -0,0 +1,95 @@
+"""
+Agreement/throughput check of bv2's NumPy fastText engine against the fastText binding.
+
+Scores the same labelled tokens with NumpyFastText (supported languages only)
+and with the compiled fastText library (all labels, then filtered to the same
+languages), and reports:
+
+    max/mean |dp|  absolute difference of the raw per-language probabilities
+    agree          top-1 agreement over the supported languages
+    tokens/s       cold (empty per-word cache) and warm for NumPy, per-token calls for the binding
+
+The binding is called through its low-level ``f.predict`` with the trailing
+newline its Python wrapper would add: the wrapper's ``np.array(..., copy=False)``
+fails under NumPy 2.
+
+Run from Backend/. Example:
+    python benchmarks/lid_fasttext.py --tokens 20000 --json fasttext.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+
+from lid_onnx import labelled_tokens, load_bv2
+
+
+def library_probs(model, tokens, langs):
+    import numpy as np
+    col = {lang: i for i, lang in enumerate(langs)}
+    out = np.zeros((len(tokens), len(langs)), dtype=np.float32)
+    nlabels = len(model.get_labels())
+    started = time.perf_counter()
+    for row, token in enumerate(tokens):
+        for prob, label in model.f.predict(token + '\n', nlabels, 0.0, 'strict'):
+            j = col.get(label.replace('__label__', ''))
+            if j is not None:
+                out[row, j] = prob
+    return out, time.perf_counter() - started
+
+
+def run(bv2, path, tokens):
+    import fasttext
+    started = time.perf_counter()
+    engine = bv2.NumpyFastText(path, bv2.TOP_20_LANGS)
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ours = engine.predict_probs(tokens)
+    cold_s = time.perf_counter() - started
+    started = time.perf_counter()
+    engine.predict_probs(tokens)
+    warm_s = time.perf_counter() - started
+
+    ref, lib_s = library_probs(fasttext.load_model(path), tokens, engine.labels)
+    diff = abs(ours - ref)
+    return {
+        'load_s': load_s,
+        'max_abs_diff': float(diff.max()) if diff.size else 0.0,
+        'mean_abs_diff': float(diff.mean()) if diff.size else 0.0,
+        'agreement': float((ours.argmax(axis=1) == ref.argmax(axis=1)).mean()) if len(tokens) else 1.0,
+        'numpy_cold_tokens_per_sec': len(tokens) / cold_s if cold_s else 0.0,
+        'numpy_warm_tokens_per_sec': len(tokens) / warm_s if warm_s else 0.0,
+        'library_tokens_per_sec': len(tokens) / lib_s if lib_s else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare bv2 NumpyFastText with the fastText binding')
+    parser.add_argument('--model', help='fastText model (default: bv2.FASTTEXT_PATH_DEFAULT)')
+    parser.add_argument('--tokens', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--json', help='write the report here')
+    args = parser.parse_args(argv)
+
+    bv2 = load_bv2()
+    path = args.model or bv2.FASTTEXT_PATH_DEFAULT
+    tokens = [t for t, _ in labelled_tokens(args.tokens, args.seed)]
+    report = run(bv2, path, tokens)
+
+    print(f"model: {path}  tokens={len(tokens)}  load {report['load_s']:.2f}s")
+    print(f"max|dp| {report['max_abs_diff']:.2e}  mean|dp| {report['mean_abs_diff']:.2e}  agree {report['agreement']:.4f}")
+    print(f"tokens/s  numpy cold {report['numpy_cold_tokens_per_sec']:.0f}  warm {report['numpy_warm_tokens_per_sec']:.0f}"
+          f"  library {report['library_tokens_per_sec']:.0f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'model': path, 'tokens': len(tokens), **report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
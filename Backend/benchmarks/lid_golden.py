@@ -0,0 +1,324 @@
+"""
+Golden-output regression harness for bv2.detect_languages.
+
+Records the detector's segmentation of a fixed multilingual, code-mixed corpus
+and diffs another engine or revision against it, so a faster implementation
+can be accepted only when it segments the same way. Divergence is measured on
+characters (whitespace ignored), which keeps the diff meaningful even when a
+candidate tokenizes differently:
+
+    identical docs    documents whose (segment, language) list is unchanged
+    label agreement   share of characters that keep their language
+    boundary P/R/F1   segment start positions found by the candidate vs the reference
+
+Golden files depend on which models were loaded (transformer, fastText or
+heuristics only); they are stored with the run and a mismatch is reported.
+
+The detector breaks some score ties by set iteration order, so its output
+changes with string hash randomization. Recording always runs with a pinned
+PYTHONHASHSEED (the script re-executes itself if needed) and the seed is stored
+with the run; runs recorded under different seeds are not comparable.
+
+Run from Backend/. Examples:
+    python benchmarks/lid_golden.py record -o golden.json
+    python benchmarks/lid_golden.py compare golden.json --engine many
+    python benchmarks/lid_golden.py compare golden.json --revision HEAD~1
+    python benchmarks/lid_golden.py diff golden.json candidate.json
+
+compare and diff exit with status 1 when label agreement falls below
+--min-agreement (default 1.0, i.e. any divergence fails).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+
+import lid_corpus
+from lid_benchmark import export_revision
+
+# Hand-picked cases the synthetic corpus doesn't cover: romanized Hindi/Urdu,
+# short chat replies, loanwords, script-mixed tokens and digits among text whose
+# script alone decides the language.
+HANDPICKED = [
+    "Hello my friend, ¿cómo estás hoy? I hope you're doing well.",
+    "yaar this match is too good, kya khel raha hai bhai",
+    "Je suis très content aujourd'hui but I need coffee",
+    "Ich habe keine Zeit, lo siento mucho amigo",
+    "Selamat pagi semua, good morning everyone!",
+    "今天天气很好, let's go to the park",
+    "東京に行きたい but it's so expensive",
+    "안녕하세요 everyone, welcome to the stream",
+    "Привет всем, how are you doing?",
+    "مرحبا بكم في البث المباشر thank you for watching",
+    "आज का मैच बहुत अच्छा था bro",
+    "ok", "lol 😂😂", "gg wp", "ciao", "merci beaucoup", "danke schön",
+    "Bom dia! Tudo bem? Estou aprendendo inglês, it's hard",
+    "Bugün çok yorgunum ama stream güzel",
+    "Xin chào các bạn, chúc một ngày tốt lành",
+    "Dzień dobry, jak się masz? good thanks",
+    "Goedemorgen allemaal, lekker weer vandaag",
+    "สวัสดีครับ welcome to my channel",
+    "안녕 하세요 123", "Привет как дела 2024", "こんにちは 123 テスト", "123",
+]
+
+ENGINES = ('detect', 'many')
+DEFAULT_DOCS = 500
+DEFAULT_SEED = 7
+HASH_SEED = '0'
+
+
+def golden_corpus(docs=DEFAULT_DOCS, seed=DEFAULT_SEED):
+    return HANDPICKED + lid_corpus.make_corpus(docs, seed)
+
+
+def load_detector(source, enable_transformer):
+    # Measure the engine, not the result cache
+    os.environ['POLYLANGID_DOC_CACHE_SIZE'] = '0'
+    if not enable_transformer:
+        os.environ.setdefault('HF_HUB_OFFLINE', '1')
+        os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    sys.path.insert(0, source)
+    from src.services.languagedetectionandpreprocessing import bv2
+    return bv2, bv2.get_detector(enable_transformer=enable_transformer)
+
+
+def record(docs=DEFAULT_DOCS, seed=DEFAULT_SEED, engine='detect', source=BACKEND_DIR,
+           enable_transformer=False, batch_size=32):
+    """Run ``engine`` over the golden corpus and return its outputs with timing."""
+    bv2, detector = load_detector(source, enable_transformer)
+    corpus = golden_corpus(docs, seed)
+
+    started = time.perf_counter()
+    if engine == 'detect':
+        outputs = [detector.detect_languages(text) for text in corpus]
+    elif engine == 'many':
+        outputs = []
+        for i in range(0, len(corpus), batch_size):
+            outputs.extend(detector.detect_languages_many(corpus[i:i + batch_size]))
+    else:
+        raise ValueError(f"unknown engine {engine!r}")
+    seconds = time.perf_counter() - started
+
+    return {
+        'engine': engine,
+        'source': source,
+        'docs': docs,
+        'seed': seed,
+        'models': {
+            'transformer': bool(getattr(detector.model_mgr, 'transformer', None)),
+            'fasttext': bool(getattr(detector.model_mgr, 'fasttext', None)),
+        },
+        'hash_seed': os.environ.get('PYTHONHASHSEED'),
+        'seconds': seconds,
+        'texts': corpus,
+        'outputs': [[list(seg) for seg in out] for out in outputs],
+    }
+
+
+def record_revision(rev, args):
+    """Record ``rev`` in a fresh interpreter from an exported copy of its tree."""
+    with tempfile.TemporaryDirectory(prefix='lid-golden-') as tmp:
+        source = export_revision(rev, os.path.join(tmp, 'tree'))
+        out = os.path.join(tmp, 'out.json')
+        cmd = [sys.executable, os.path.abspath(__file__), 'record', '-o', out, '--source', source,
+               '--docs', str(args.docs), '--seed', str(args.seed), '--engine', args.engine]
+        if args.transformer:
+            cmd.append('--transformer')
+        subprocess.check_call(cmd)
+        with open(out, encoding='utf-8') as f:
+            run = json.load(f)
+    run['revision'] = rev
+    return run
+
+
+def char_labels(segments):
+    """Language of every non-space character, plus the character offsets where segments start."""
+    labels, starts = [], set()
+    for segment, lang in segments:
+        if labels:
+            starts.add(len(labels))
+        labels.extend(lang for ch in segment if not ch.isspace())
+    return labels, starts
+
+
+def diff_runs(ref, cand, show=5):
+    """Compare two recorded runs document by document."""
+    if ref['texts'] != cand['texts']:
+        raise ValueError("runs were recorded on different corpora (check --docs/--seed)")
+
+    identical = 0
+    chars = agree = 0
+    tp = fp = fn = 0
+    confusion = Counter()
+    examples = []
+    mismatched_text = 0
+
+    for text, r_out, c_out in zip(ref['texts'], ref['outputs'], cand['outputs']):
+        if r_out == c_out:
+            identical += 1
+        r_labels, r_starts = char_labels(r_out)
+        c_labels, c_starts = char_labels(c_out)
+        if len(r_labels) != len(c_labels):
+            # Segments cover different characters; count every reference character as a miss
+            mismatched_text += 1
+            chars += len(r_labels)
+            fn += len(r_starts)
+        else:
+            chars += len(r_labels)
+            for a, b in zip(r_labels, c_labels):
+                if a == b:
+                    agree += 1
+                else:
+                    confusion[(a, b)] += 1
+            tp += len(r_starts & c_starts)
+            fp += len(c_starts - r_starts)
+            fn += len(r_starts - c_starts)
+        if r_out != c_out and len(examples) < show:
+            examples.append({'text': text, 'reference': r_out, 'candidate': c_out})
+
+    precision = tp / (tp + fp) if (tp + fp) else 1.0
+    recall = tp / (tp + fn) if (tp + fn) else 1.0
+    f1 = (2 * precision * recall / (precision + recall)) if (precision + recall) else 0.0
+    n = len(ref['texts'])
+    return {
+        'documents': n,
+        'identical': identical,
+        'identical_rate': identical / n if n else 1.0,
+        'label_agreement': agree / chars if chars else 1.0,
+        'boundary_precision': precision,
+        'boundary_recall': recall,
+        'boundary_f1': f1,
+        'coverage_mismatches': mismatched_text,
+        'top_confusions': [[a, b, c] for (a, b), c in confusion.most_common(10)],
+        'models_match': ref.get('models') == cand.get('models'),
+        'hash_seed_match': ref.get('hash_seed') == cand.get('hash_seed'),
+        'reference_seconds': ref['seconds'],
+        'candidate_seconds': cand['seconds'],
+        'speedup': (ref['seconds'] / cand['seconds']) if cand['seconds'] else float('inf'),
+        'examples': examples,
+    }
+
+
+def _describe(run):
+    name = run.get('revision') or run.get('source')
+    models = ','.join(k for k, v in run.get('models', {}).items() if v) or 'heuristics only'
+    return f"{run['engine']} @ {name} ({models})"
+
+
+def format_diff(report, ref, cand):
+    lines = [
+        f"reference: {_describe(ref)}",
+        f"candidate: {_describe(cand)}",
+    ]
+    if not report['models_match']:
+        lines.append("WARNING: runs loaded different models; divergence is expected")
+    if not report['hash_seed_match']:
+        lines.append("WARNING: runs used different PYTHONHASHSEED values; tie-breaks may differ")
+    lines += [
+        f"identical docs   {report['identical']}/{report['documents']} ({report['identical_rate']:.2%})",
+        f"label agreement  {report['label_agreement']:.4%}",
+        f"boundary P/R/F1  {report['boundary_precision']:.4f} / {report['boundary_recall']:.4f} / "
+        f"{report['boundary_f1']:.4f}",
+    ]
+    if report['coverage_mismatches']:
+        lines.append(f"coverage mismatches {report['coverage_mismatches']} (segments cover different text)")
+    if report['top_confusions']:
+        lines.append("top confusions (reference -> candidate, chars): " +
+                     ', '.join(f"{a}->{b} {c}" for a, b, c in report['top_confusions']))
+    lines.append(f"time             {report['reference_seconds']:.2f}s -> {report['candidate_seconds']:.2f}s "
+                 f"({report['speedup']:.2f}x)")
+    for ex in report['examples']:
+        lines.append('')
+        lines.append(f"  text:      {ex['text']}")
+        lines.append(f"  reference: {ex['reference']}")
+        lines.append(f"  candidate: {ex['candidate']}")
+    return '\n'.join(lines)
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _dump(run, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(run, f, ensure_ascii=False, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Golden-output regression harness for bv2')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_run_args(p):
+        p.add_argument('--engine', choices=ENGINES, default='detect',
+                       help='detect: detect_languages per document; many: detect_languages_many batches')
+        p.add_argument('--docs', type=int, default=DEFAULT_DOCS, help='synthetic documents after the hand-picked ones')
+        p.add_argument('--seed', type=int, default=DEFAULT_SEED)
+        p.add_argument('--transformer', action='store_true', help='enable the transformer (local HF cache only)')
+
+    p_record = sub.add_parser('record', help='record golden outputs')
+    add_run_args(p_record)
+    p_record.add_argument('--source', default=BACKEND_DIR, help='Backend directory to import bv2 from')
+    p_record.add_argument('--revision', help='record a git revision instead of the working tree')
+    p_record.add_argument('-o', '--output', required=True)
+
+    p_compare = sub.add_parser('compare', help='run a candidate and diff it against a golden file')
+    add_run_args(p_compare)
+    p_compare.add_argument('golden')
+    p_compare.add_argument('--revision', help='candidate is this git revision instead of the working tree')
+    p_compare.add_argument('-o', '--output', help='also save the candidate run')
+
+    p_diff = sub.add_parser('diff', help='diff two recorded runs')
+    p_diff.add_argument('reference')
+    p_diff.add_argument('candidate')
+
+    for p in (p_compare, p_diff):
+        p.add_argument('--min-agreement', type=float, default=1.0,
+                       help='fail when character label agreement is below this (0-1)')
+        p.add_argument('--show', type=int, default=5, help='diverging documents to print')
+        p.add_argument('--json', help='write the diff report here')
+
+    args = parser.parse_args(argv)
+
+    if args.command in ('record', 'compare') and os.environ.get('PYTHONHASHSEED') != HASH_SEED:
+        os.environ['PYTHONHASHSEED'] = HASH_SEED
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__)] + (argv or sys.argv[1:]))
+
+    if args.command == 'record':
+        if args.revision:
+            run = record_revision(args.revision, args)
+        else:
+            run = record(args.docs, args.seed, args.engine, os.path.abspath(args.source), args.transformer)
+        _dump(run, args.output)
+        print(f"recorded {len(run['texts'])} documents in {run['seconds']:.2f}s -> {args.output}")
+        return 0
+
+    if args.command == 'compare':
+        ref = _load(args.golden)
+        if args.revision:
+            cand = record_revision(args.revision, args)
+        else:
+            cand = record(args.docs, args.seed, args.engine, BACKEND_DIR, args.transformer)
+        if args.output:
+            _dump(cand, args.output)
+    else:
+        ref, cand = _load(args.reference), _load(args.candidate)
+
+    report = diff_runs(ref, cand, args.show)
+    print(format_diff(report, ref, cand))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report['label_agreement'] >= args.min_agreement else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
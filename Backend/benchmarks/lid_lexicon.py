@@ -0,0 +1,108 @@
+"""
+Build bv2's memory-mapped token lexicon from a frequency list.
+
+Runs the full ensemble (EnhancedDetector.token_distributions, with any existing
+lexicon switched off) over the most frequent tokens and writes them with
+build_lexicon. At runtime ModelManager maps the file read-only and
+token_distributions answers listed tokens from it before any model runs.
+
+Inputs, combined:
+    --freq FILE     "token<TAB>count" per line (a bare token counts 1)
+    --corpus FILE   text, one document per line, tokenized with bv2.tokenize
+    --synthetic N   generated benchmark documents
+
+After writing, the file is reopened and checked: every token must round-trip
+within float16 precision. The report gives entries, file size, build time and
+the mean lookup time.
+
+Run from Backend/. Examples:
+    python benchmarks/lid_lexicon.py --freq top_tokens.tsv --top 200000
+    python benchmarks/lid_lexicon.py --corpus chats.txt -o /srv/lid/lexicon.bin
+"""
+import argparse
+import os
+import sys
+import time
+import unicodedata
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+
+from lid_distill import read_corpus
+from lid_onnx import load_bv2
+
+
+def read_frequencies(paths):
+    counts = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                token, _, count = line.rstrip('\n').partition('\t')
+                if token.strip():
+                    counts[token.strip()] += int(count) if count.strip() else 1
+    return counts
+
+
+def build(bv2, tokens, path, batch_size=512):
+    """Label ``tokens`` with the ensemble and write the lexicon; returns (entries, seconds)."""
+    bv2.LEXICON_PATH = ''
+    detector = bv2.EnhancedDetector()
+    mgr = detector.model_mgr
+    started = time.perf_counter()
+    entries = []
+    for i in range(0, len(tokens), batch_size):
+        batch = tokens[i:i + batch_size]
+        entries.extend(zip(batch, detector.token_distributions(batch)))
+    meta = {
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'transformer': bv2.TRANSFORMER_MODEL if mgr.transformer else None,
+        'transformer_backend': mgr.transformer_backend,
+        'fasttext': mgr.fasttext_path if mgr.fasttext else None,
+        'token_backend': 'fast' if mgr.distilled is not None else 'ensemble',
+    }
+    count = bv2.build_lexicon(path, entries, meta)
+    return entries, count, time.perf_counter() - started
+
+
+def verify(bv2, path, entries):
+    """Reopen ``path``; returns (entries that do not round-trip, seconds per lookup)."""
+    lexicon = bv2.TokenLexicon(path)
+    bad = 0
+    started = time.perf_counter()
+    for token, dist in entries:
+        got = lexicon.get(token)
+        if got is None or any(abs(got.get(k, 0.0) - v) > 1e-3 * max(1.0, v) for k, v in dist.items()):
+            bad += 1
+    seconds = time.perf_counter() - started
+    return bad, seconds / len(entries) if entries else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the bv2 token lexicon')
+    parser.add_argument('--freq', nargs='*', default=[], help='token<TAB>count files')
+    parser.add_argument('--corpus', nargs='*', default=[], help='text files, one document per line')
+    parser.add_argument('--synthetic', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--top', type=int, default=200_000, help='most frequent tokens to keep')
+    parser.add_argument('-o', '--output', help='default: bv2.LEXICON_PATH')
+    args = parser.parse_args(argv)
+
+    bv2 = load_bv2()
+    output = args.output or bv2.LEXICON_PATH
+    counts = read_frequencies(args.freq)
+    for doc in read_corpus(args.corpus, args.synthetic, args.seed):
+        counts.update(bv2.tokenize(unicodedata.normalize('NFC', doc)))
+    if not counts:
+        parser.error('no tokens: give --freq, --corpus or --synthetic')
+    tokens = [t for t, _ in counts.most_common(args.top)]
+
+    entries, count, seconds = build(bv2, tokens, output)
+    bad, lookup_s = verify(bv2, output, entries)
+    print(f"{count} tokens in {seconds:.1f}s -> {output} ({os.path.getsize(output) / (1024 * 1024):.2f} MB)")
+    print(f"round-trip mismatches: {bad}  lookup {lookup_s * 1e6:.1f} us/token")
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Accuracy/latency comparison of bv2's transformer inference backends.
+
+Runs the same labelled tokens through each backend (PyTorch, ONNX Runtime fp32,
+ONNX Runtime with dynamic int8 quantization) exactly as the direct-logits path
+in ModelManager does, and reports per backend:
+
+    load s        construction time, including the ONNX export/quantization on first use
+    tokens/s      throughput over the whole token list
+    p50/p99 ms    per-batch latency
+    accuracy      top-1 against the corpus labels, over tokens the model has a label for
+    agree         top-1 agreement with the reference (first) backend
+    max/mean |dp| absolute probability difference from the reference backend
+
+Nothing is downloaded: --model takes a local directory or a model already in
+the Hugging Face cache. --tiny DIR instead builds a small randomly initialised
+XLM-R classifier, with a tokenizer trained on the benchmark vocabulary. Its
+accuracy is meaningless, but it checks the export, quantization and backend
+agreement without the real weights or network access.
+
+Run from Backend/. Examples:
+    python benchmarks/lid_onnx.py --tiny /tmp/lid-tiny
+    python benchmarks/lid_onnx.py --tokens 5000 --backends torch onnx-int8 --json onnx.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+
+import lid_corpus
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def load_bv2():
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    sys.path.insert(0, BACKEND_DIR)
+    from src.services.languagedetectionandpreprocessing import bv2
+    return bv2
+
+
+def labelled_tokens(count, seed=13):
+    """``count`` (token, language) pairs drawn from the benchmark vocabulary with its language mix."""
+    rng = random.Random(seed)
+    langs = list(lid_corpus.LANG_WEIGHTS)
+    weights = [lid_corpus.LANG_WEIGHTS[lang] for lang in langs]
+    pairs = []
+    for lang in rng.choices(langs, weights, k=count):
+        pairs.append((rng.choice(lid_corpus.WORDS[lang]), lang))
+    return pairs
+
+
+def build_tiny_model(path, seed=0):
+    """Save a small random XLM-R sequence classifier over the corpus languages to ``path``."""
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast, XLMRobertaConfig, XLMRobertaForSequenceClassification
+
+    specials = ['<s>', '<pad>', '</s>', '<unk>']
+    tok = Tokenizer(models.WordPiece(unk_token='<unk>'))
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    words = [w for ws in lid_corpus.WORDS.values() for w in ws]
+    tok.train_from_iterator(words, trainers.WordPieceTrainer(vocab_size=2000, special_tokens=specials))
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok, bos_token='<s>', cls_token='<s>', pad_token='<pad>',
+        eos_token='</s>', sep_token='</s>', unk_token='<unk>',
+    )
+
+    labels = sorted(lid_corpus.WORDS)
+    config = XLMRobertaConfig(
+        vocab_size=len(tokenizer), hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+        intermediate_size=128, max_position_embeddings=160, pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+        num_labels=len(labels), id2label=dict(enumerate(labels)), label2id={l: i for i, l in enumerate(labels)},
+    )
+    torch.manual_seed(seed)
+    model = XLMRobertaForSequenceClassification(config)
+    model.eval()
+    os.makedirs(path, exist_ok=True)
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+def make_backend(bv2, name, model, onnx_dir):
+    if name == 'torch':
+        return bv2.TorchClassifier(model)
+    if name in ('onnx', 'onnx-int8'):
+        return bv2.OnnxClassifier(model, onnx_dir, quantize=name == 'onnx-int8')
+    raise ValueError(f"unknown backend {name!r}")
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run_backend(bv2, name, model, onnx_dir, tokens, batch_size, max_length):
+    started = time.perf_counter()
+    clf = make_backend(bv2, name, model, onnx_dir)
+    load_s = time.perf_counter() - started
+    cols, langs = bv2.label_columns(clf.id2label)
+
+    clf.logits(tokens[:batch_size], max_length)  # warm-up: first call allocates
+    batches, chunks = [], []
+    started = time.perf_counter()
+    for i in range(0, len(tokens), batch_size):
+        t0 = time.perf_counter()
+        chunks.append(bv2.softmax_columns(clf.logits(tokens[i:i + batch_size], max_length), cols))
+        batches.append(time.perf_counter() - t0)
+    total_s = time.perf_counter() - started
+
+    size_mb = None
+    if name != 'torch':
+        path = os.path.join(bv2.onnx_export_dir(model, onnx_dir), 'model.int8.onnx' if name == 'onnx-int8' else 'model.onnx')
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+    import numpy as np
+    return {
+        'backend': name,
+        'langs': langs,
+        'probs': np.concatenate(chunks) if chunks else np.zeros((0, len(langs)), dtype=np.float32),
+        'load_s': load_s,
+        'tokens_per_sec': len(tokens) / total_s if total_s else 0.0,
+        'p50_ms': _percentile(batches, 0.5) * 1000.0,
+        'p99_ms': _percentile(batches, 0.99) * 1000.0,
+        'model_mb': size_mb,
+    }
+
+
+def compare(runs, truth):
+    """Accuracy per run and agreement of every run with the first one."""
+    import numpy as np
+    ref = runs[0]
+    ref_top = ref['probs'].argmax(axis=1)
+    report = []
+    for run in runs:
+        langs, probs = run['langs'], run['probs']
+        top = probs.argmax(axis=1)
+        known = [i for i, lang in enumerate(truth) if lang in langs]
+        correct = sum(1 for i in known if langs[top[i]] == truth[i])
+        row = {k: v for k, v in run.items() if k not in ('probs', 'langs')}
+        row['accuracy'] = correct / len(known) if known else None
+        if run['langs'] == ref['langs']:
+            diff = np.abs(probs - ref['probs'])
+            row['agreement'] = float((top == ref_top).mean()) if len(top) else 1.0
+            row['max_abs_diff'] = float(diff.max()) if diff.size else 0.0
+            row['mean_abs_diff'] = float(diff.mean()) if diff.size else 0.0
+        report.append(row)
+    return report
+
+
+def format_report(report, reference, tokens, model):
+    lines = [
+        f"model: {model}  tokens={tokens}  reference={reference}",
+        f"{'backend':<11}{'load s':>8}{'tokens/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'MB':>8}"
+        f"{'accuracy':>10}{'agree':>8}{'max|dp|':>9}{'mean|dp|':>10}",
+    ]
+    for r in report:
+        acc = f"{r['accuracy']:.4f}" if r['accuracy'] is not None else '-'
+        mb = f"{r['model_mb']:.1f}" if r['model_mb'] is not None else '-'
+        agree = f"{r['agreement']:.4f}" if 'agreement' in r else '-'
+        maxd = f"{r['max_abs_diff']:.4f}" if 'max_abs_diff' in r else '-'
+        meand = f"{r['mean_abs_diff']:.5f}" if 'mean_abs_diff' in r else '-'
+        lines.append(
+            f"{r['backend']:<11}{r['load_s']:>8.2f}{r['tokens_per_sec']:>10.0f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+            f"{mb:>8}{acc:>10}{agree:>8}{maxd:>9}{meand:>10}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare bv2 transformer inference backends')
+    parser.add_argument('--model', help='local model directory or cached model id (default: bv2.TRANSFORMER_MODEL)')
+    parser.add_argument('--tiny', metavar='DIR', help='build a small random classifier in DIR and compare on that')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+                        help='backends to run; the first is the reference')
+    parser.add_argument('--onnx-dir', help='where ONNX exports are kept (default: bv2.TRANSFORMER_ONNX_DIR)')
+    parser.add_argument('--tokens', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--batch-size', type=int, help='default: bv2.TRANSFORMER_BATCH_SIZE')
+    parser.add_argument('--max-length', type=int, help='default: bv2.TRANSFORMER_MAX_LENGTH')
+    parser.add_argument('--json', help='write the report here')
+    args = parser.parse_args(argv)
+
+    bv2 = load_bv2()
+    if args.tiny:
+        model = build_tiny_model(os.path.abspath(args.tiny))
+        onnx_dir = args.onnx_dir or os.path.join(os.path.abspath(args.tiny), 'onnx')
+    else:
+        model = args.model or bv2.TRANSFORMER_MODEL
+        onnx_dir = args.onnx_dir or bv2.TRANSFORMER_ONNX_DIR
+    batch_size = args.batch_size or bv2.TRANSFORMER_BATCH_SIZE
+    max_length = args.max_length or bv2.TRANSFORMER_MAX_LENGTH
+
+    pairs = labelled_tokens(args.tokens, args.seed)
+    tokens = [t for t, _ in pairs]
+    truth = [lang for _, lang in pairs]
+    runs = [run_backend(bv2, name, model, onnx_dir, tokens, batch_size, max_length) for name in args.backends]
+    report = compare(runs, truth)
+
+    print(format_report(report, args.backends[0], len(tokens), model))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'model': model, 'tokens': len(tokens), 'backends': report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
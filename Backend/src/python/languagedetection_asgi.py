@@ -0,0 +1,245 @@
+"""
+ASGI serving mode for the language detection service.
+
+Serves the same routes as the Flask app (languagedectection.py), including /metrics, without blocking
+the event loop: request handling runs on a bounded thread pool, and detection
+calls from concurrent requests are coalesced into micro-batches that share one
+model pass (bv2.detect_languages_many). Requests beyond the concurrency limit
+are rejected with 429 instead of queueing without bound.
+
+Run with:
+    uvicorn languagedetection_asgi:app --app-dir src/python --host 0.0.0.0 --port 5001
+
+Environment:
+    LID_ASGI_WORKERS      handler threads (default max(8, LID_BATCH_MAX)); a
+                          handler thread waits while its text is in a batch, so
+                          batches never hold more texts than there are threads
+    LID_MAX_CONCURRENCY   in-flight requests before 429 (default 64)
+    LID_BATCH_MAX         max texts per detection micro-batch (default 32)
+    LID_BATCH_WAIT_MS     how long a batch waits to fill up (default 5)
+
+Batched detection records bv2's stage timings once per batch, both in /metrics
+and in traces (under ``batch``, shared by the requests in it).
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import lid_handlers
+import lid_metrics
+
+
+MAX_CONCURRENCY = int(os.environ.get('LID_MAX_CONCURRENCY', '64'))
+BATCH_MAX = int(os.environ.get('LID_BATCH_MAX', '32'))
+ASGI_WORKERS = int(os.environ.get('LID_ASGI_WORKERS', str(max(8, BATCH_MAX))))
+BATCH_WAIT_MS = float(os.environ.get('LID_BATCH_WAIT_MS', '5'))
+
+
+class MicroBatcher:
+    """Collects single-text detection calls into batches run on one executor thread."""
+
+    def __init__(self, batch_fn, max_batch=BATCH_MAX, max_wait_ms=BATCH_WAIT_MS):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = None
+        self._task = None
+        self._loop = None
+        # Detection is GIL-bound, so batches run one at a time on their own thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lid-batch')
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, text, sink=None):
+        fut = self._loop.create_future()
+        self._queue.put_nowait((text, sink, fut))
+        return await fut
+
+    def submit_threadsafe(self, text):
+        """Blocking entry point for handler threads; the batch's stage timings go
+        to the calling request's timer."""
+        sink = lid_handlers.current_stage_sink()
+        return asyncio.run_coroutine_threadsafe(self.submit(text, sink), self._loop).result()
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _, _ in batch]
+            sinks = [sink for _, sink, _ in batch]
+            try:
+                results = await self._loop.run_in_executor(self._executor, self.batch_fn, texts, sinks)
+            except Exception as e:
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, _, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+
+class LanguageDetectionApp:
+    """Minimal ASGI application exposing the lid_handlers routes."""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, workers=ASGI_WORKERS):
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lid-handler')
+        self.batcher = MicroBatcher(lid_handlers.detect_batch) if lid_handlers.detect_languages_many_scored else None
+        self.routes = {
+            ('GET', '/health'): lambda data, detect_fn, trace: lid_handlers.health(),
+            ('GET', '/ready'): lambda data, detect_fn, trace: lid_handlers.ready(),
+            ('POST', '/detect'): lid_handlers.detect,
+            ('POST', '/detect_and_preprocess'): lid_handlers.detect_and_preprocess,
+            ('POST', '/process_pipeline'): lid_handlers.process_pipeline,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            status = await self._handle(scope, receive, send)
+        finally:
+            # Unmatched paths share one label so scanners can't blow up the series count
+            path = scope['path'] if status != 404 else 'unmatched'
+            lid_metrics.observe_request(path, status, time.perf_counter() - started)
+
+    async def _handle(self, scope, receive, send):
+        """Serve one HTTP request and return the response status."""
+        if scope['path'] == '/metrics' and scope['method'] == 'GET':
+            await self._send(send, lid_handlers.metrics().encode('utf-8'), 200,
+                             lid_metrics.CONTENT_TYPE.encode('ascii'))
+            return 200
+
+        if scope['path'] == '/admin/reload' and scope['method'] in ('GET', 'POST'):
+            authorized = lid_handlers.admin_authorized(self._header(scope, lid_handlers.ADMIN_TOKEN_HEADER))
+            handler = lid_handlers.reload_models if scope['method'] == 'POST' else lid_handlers.reload_progress
+            payload, status = handler(authorized)
+            await self._respond(send, payload, status)
+            return status
+        
+        route = self.routes.get((scope['method'], scope['path']))
+        if route is None:
+            known = any(path == scope['path'] for _, path in self.routes)
+            status = 405 if known else 404
+            await self._respond(send, {'error': 'Method not allowed' if known else 'Not found'}, status)
+            return status
+
+        body = await self._read_body(receive)
+
+        # Probes must answer even when the service is saturated
+        if scope['path'] not in ('/health', '/ready') and self.in_flight >= self.max_concurrency:
+            self.rejected += 1
+            await self._respond(send, {'error': 'Too many concurrent requests', 'languages': []}, 429,
+                                headers=[(b'retry-after', b'1')])
+            return 429
+
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+
+        trace = lid_handlers.trace_requested(self._header(scope, lid_handlers.TRACE_HEADER))
+
+        detect_fn = None
+        if self.batcher is not None:
+            self.batcher.start()  # no-op once the lifespan startup has run
+            detect_fn = self.batcher.submit_threadsafe
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            payload, status = await loop.run_in_executor(self._executor, route, data, detect_fn, trace)
+        finally:
+            self.in_flight -= 1
+        await self._respond(send, payload, status)
+        return status
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                lid_handlers.start_loading()
+                if self.batcher is not None:
+                    self.batcher.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.batcher is not None:
+                    await self.batcher.stop()
+                self._executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def _header(scope, name):
+        name = name.lower().encode('latin-1')
+        for k, v in scope.get('headers', []):
+            if k.lower() == name:
+                return v.decode('latin-1')
+        return None
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    @classmethod
+    async def _respond(cls, send, payload, status, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        await cls._send(send, body, status, b'application/json; charset=utf-8', headers)
+
+    @staticmethod
+    async def _send(send, body, status, content_type, headers=None):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type),
+                (b'content-length', str(len(body)).encode('ascii')),
+            ] + (headers or []),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = LanguageDetectionApp()
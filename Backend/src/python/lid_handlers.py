@@ -0,0 +1,459 @@
+"""
+Framework-independent request handlers for the language detection service.
+
+Each handler takes the parsed JSON body and returns ``(payload, status)`` so the
+same logic backs the Flask app (languagedectection.py) and the ASGI app
+(languagedetection_asgi.py). ``detect_fn`` lets a server route detection through
+its own executor or micro-batcher. Stage timings are always recorded into the
+/metrics histograms; ``trace=True`` (the X-LID-Trace request header) also returns
+them, together with the intermediate texts, in the response. When a server
+coalesces detection calls (detect_batch), bv2's stages run once per batch: the
+request's own timings only show 'detect', and the trace adds the shared batch's
+size, stage timings and cascade usage under ``batch``.
+
+While bv2 is still loading the transformer in the background it serves in
+"degraded" mode (fastText and heuristics); every detection response carries
+the ``mode`` it was produced in, and /ready (unlike /health) answers 503 until
+the detector can serve at all. Without the transformers package installed the
+mode stays "no-transformer".
+
+POST /admin/reload rebuilds the detector from the model files on disk in the
+background and swaps it in without dropping requests (GET reports progress).
+It needs the X-LID-Admin-Token header to match LID_ADMIN_TOKEN; with no token
+configured the admin routes are disabled. A reload covers one process: under
+lid_server the worker that gets the request sends SIGHUP to the gunicorn master,
+which reloads its detector and replaces every worker with a fresh fork. The
+master's progress is not visible from the workers: POST answers "signalled", GET
+answers state "unknown" with the generation, mode and tunables of the detector
+the answering worker serves (a finished reload shows as a higher generation).
+Detection tunables are re-read from POLYLANGID_CONFIG on every reload.
+"""
+import hmac
+import logging
+import os
+import signal
+import sys
+
+import lid_metrics
+
+# Adjust sys.path for robust src import in any environment
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+
+# Import detection from new bv2.py location
+try:
+    from src.services.languagedetectionandpreprocessing.bv2 import (
+        detect_languages_scored, detect_languages_many_scored, detector_stats,
+        detector_status, start_detector, start_reload, reload_status,
+        set_stage_sink, reset_stage_sink, get_stage_sink, TOP_20_LANGS
+    )
+except Exception:
+    detect_languages_scored = None
+    detect_languages_many_scored = None
+    detector_stats = None
+    detector_status = start_detector = None
+    start_reload = reload_status = None
+    set_stage_sink = reset_stage_sink = get_stage_sink = None
+    TOP_20_LANGS = [
+        'en','fr','de','es','it','pt','ru','zh','ja','ko',
+        'ar','hi','bn','pa','te','mr','ta','tr','vi','ur'
+    ]
+
+# Import pre- and post-language-id processing from new locations
+from src.services.languagedetectionandpreprocessing.prelangidprocessing import prelangid_clean
+from src.services.languagedetectionandpreprocessing.postlangidprocessing import postlangid_process, lang_preprocessors
+
+logger = logging.getLogger("lid_service")
+
+TRACE_HEADER = 'X-LID-Trace'
+ADMIN_TOKEN_HEADER = 'X-LID-Admin-Token'
+ADMIN_TOKEN = os.environ.get('LID_ADMIN_TOKEN', '')
+# Set by lid_server: workers fork from one master, which owns the detector reload
+RELOAD_VIA_MASTER = False
+
+
+def trace_requested(value):
+    return str(value or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def admin_authorized(token):
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(str(token or '').encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+def _mode():
+    """Detector mode ("full", "fast", "degraded" or "no-transformer"); None before it is built."""
+    return detector_status()['mode'] if detector_status else None
+
+
+def _run_detection(detect_fn, text, timer):
+    """Run detection with bv2's stage timings routed into this request's timer.
+
+    Returns ``(result, mode)``; the mode is read before detecting, so a request
+    that straddles the end of a background load reports "degraded".
+    """
+    mode = _mode()
+    token = set_stage_sink(timer) if set_stage_sink else None
+    try:
+        with timer.stage('detect'):
+            result = detect_fn(text)
+    finally:
+        if token is not None:
+            reset_stage_sink(token)
+    lid_metrics.count_segments(r[1] for r in result)
+    return result, mode or _mode()
+
+
+def _cascade_summary(timer):
+    """Per-request transformer usage under bv2's confidence-gated cascade (None when it is off)."""
+    total = timer.counts.get('cascade_tokens', 0)
+    if not total:
+        return None
+    routed = timer.counts.get('transformer_tokens', 0)
+    return {
+        'tokens': total,
+        'transformer_tokens': routed,
+        'transformer_call_rate': routed / total,
+        'estimated_saved_ms': round(timer.counts.get('transformer_saved_seconds', 0.0) * 1000.0, 3),
+    }
+
+
+def _trace_info(timer, **extra):
+    info = dict(extra, timings_ms=timer.as_ms())
+    cascade = _cascade_summary(timer)
+    if cascade is not None:
+        info['cascade'] = cascade
+    if timer.batch is not None:
+        size, batch = timer.batch
+        info['batch'] = {'size': size, 'timings_ms': batch.as_ms()}
+        cascade = _cascade_summary(batch)
+        if cascade is not None:
+            info['batch']['cascade'] = cascade
+    return info
+
+
+def _render_detector_stats():
+    """Scrape-time view of the detector's own counters (caches, batch sizes, heuristics)."""
+    stats = detector_stats() if detector_stats else {}
+    if not stats:
+        return []
+    fmt = lid_metrics.format_labels
+    # Caches that count no lookups only report their size
+    counted = [(cache, s) for cache, s in sorted(stats['caches'].items()) if 'hits' in s and 'misses' in s]
+    lines = [
+        '# HELP lid_cache_requests_total Detector cache lookups, by cache and result.',
+        '# TYPE lid_cache_requests_total counter',
+    ]
+    for cache, s in counted:
+        lines.append(f"lid_cache_requests_total{fmt([('cache', cache), ('result', 'hit')])} {s['hits']}")
+        lines.append(f"lid_cache_requests_total{fmt([('cache', cache), ('result', 'miss')])} {s['misses']}")
+    lines += [
+        '# HELP lid_cache_hit_ratio Share of detector cache lookups that hit.',
+        '# TYPE lid_cache_hit_ratio gauge',
+    ]
+    for cache, s in counted:
+        total = s['hits'] + s['misses']
+        lines.append(f"lid_cache_hit_ratio{fmt([('cache', cache)])} {(s['hits'] / total) if total else 0.0}")
+    lines += [
+        '# HELP lid_cache_entries Entries currently held, by cache.',
+        '# TYPE lid_cache_entries gauge',
+    ]
+    for cache, s in sorted(stats['caches'].items()):
+        lines.append(f"lid_cache_entries{fmt([('cache', cache)])} {s['entries']}")
+    lines += [
+        '# HELP lid_detector_mode Serving mode of the detector (1 for the current one).',
+        '# TYPE lid_detector_mode gauge',
+    ]
+    for mode in ('full', 'fast', 'degraded', 'no-transformer'):
+        lines.append(f"lid_detector_mode{fmt([('mode', mode)])} {1 if stats.get('mode') == mode else 0}")
+    lines += [
+        '# HELP lid_model_batch_size Inputs per model inference call.',
+        '# TYPE lid_model_batch_size histogram',
+    ]
+    for model, sizes in sorted(stats['batch_sizes'].items()):
+        lines += lid_metrics.histogram_lines('lid_model_batch_size', [('model', model)], sizes,
+                                             lid_metrics.BATCH_SIZE_BUCKETS)
+    cascade = stats.get('cascade', {})
+    if cascade.get('tokens'):
+        skipped = cascade['tokens'] - cascade['transformer_tokens']
+        lines += [
+            '# HELP lid_cascade_tokens_total Tokens seen by the confidence-gated cascade, by where they went.',
+            '# TYPE lid_cascade_tokens_total counter',
+            f"lid_cascade_tokens_total{fmt([('route', 'transformer')])} {cascade['transformer_tokens']}",
+            f"lid_cascade_tokens_total{fmt([('route', 'skipped')])} {skipped}",
+            '# HELP lid_cascade_saved_seconds_total Transformer time skipped by the cascade (estimated).',
+            '# TYPE lid_cascade_saved_seconds_total counter',
+            f"lid_cascade_saved_seconds_total {skipped * cascade['transformer_seconds_per_token']}",
+        ]
+    lines += [
+        '# HELP lid_detector_events_total Heuristic corrections applied by the detector.',
+        '# TYPE lid_detector_events_total counter',
+    ]
+    for name, value in sorted(stats['debug_counters'].items()):
+        lines.append(f"lid_detector_events_total{fmt([('event', name)])} {value}")
+    return lines
+
+
+lid_metrics.REGISTRY.register_collector(_render_detector_stats)
+
+
+def detect_batch(texts, sinks=()):
+    """Micro-batch entry point for servers that coalesce detection calls.
+
+    ``sinks`` are the callers' stage timers (see current_stage_sink); each is
+    handed the batch's timer, whose stages cover every text in it.
+    """
+    timer = lid_metrics.StageTimer()
+    token = set_stage_sink(timer)
+    try:
+        return detect_languages_many_scored(texts)
+    finally:
+        reset_stage_sink(token)
+        timer.observe()
+        for sink in sinks:
+            if sink is not None:
+                sink.batch = (len(texts), timer)
+
+
+def current_stage_sink():
+    """The calling request's stage timer, for a server to pass on to detect_batch."""
+    return get_stage_sink() if get_stage_sink else None
+
+
+def metrics():
+    return lid_metrics.render()
+
+
+def health():
+    return {'status': 'ok', 'supported': list(TOP_20_LANGS)}, 200
+
+
+def ready():
+    """Readiness probe: 200 once the detector can serve (even degraded), else 503."""
+    status = detector_status() if detector_status else {'ready': False, 'mode': None, 'transformer': None}
+    return dict(status), 200 if status['ready'] else 503
+
+
+def reload_models(authorized):
+    """Admin: start a background rebuild of the detector; 202 if started, 409 if one is running."""
+    if not authorized:
+        return {'error': 'Forbidden'}, 403
+    if not start_reload:
+        return {'error': 'Language detection service unavailable'}, 503
+    if RELOAD_VIA_MASTER:
+        # Reloading here would only reach the worker that got this request
+        os.kill(os.getppid(), signal.SIGHUP)
+        return {'state': 'signalled', 'scope': 'master', 'started': True}, 202
+    started = start_reload()
+    return dict(reload_status(), started=started), 202 if started else 409
+
+
+def reload_progress(authorized):
+    """Admin: state of the last reload (see bv2.reload_status); under lid_server only
+    what this worker was forked with, as the master's reload state is not shared."""
+    if not authorized:
+        return {'error': 'Forbidden'}, 403
+    if not reload_status:
+        return {'error': 'Language detection service unavailable'}, 503
+    status = reload_status()
+    if RELOAD_VIA_MASTER:
+        return {'state': 'unknown', 'scope': 'worker', 'generation': status['generation'],
+                'mode': status['mode'], 'tunables': status['tunables']}, 200
+    return status, 200
+
+
+def start_loading():
+    """Start building the detector in the background, so /ready can turn 200 without a first request."""
+    if start_detector:
+        start_detector()
+
+
+def detect(data, detect_fn=None, trace=False):
+    """Basic language detection without preprocessing"""
+    detect_fn = detect_fn or detect_languages_scored
+
+    text = (data or {}).get('text', '')
+    if not text or not detect_fn:
+        return {'languages': [], 'supported': list(TOP_20_LANGS)}, 200
+
+    timer = lid_metrics.StageTimer()
+    try:
+        result, mode = _run_detection(detect_fn, text, timer)
+        # result: List[Tuple[segment, lang, confidence, margin]]
+        languages = []
+        for segment, lang, confidence, margin in result:
+            if lang in TOP_20_LANGS:
+                languages.append({'segment': segment, 'language': lang,
+                                  'confidence': confidence, 'margin': margin})
+        payload = {'languages': languages, 'mode': mode}
+        if trace:
+            payload['trace'] = _trace_info(timer, raw_detection=result)
+        return payload, 200
+    except Exception as e:
+        logger.exception("detect failed")
+        return {'error': str(e), 'languages': []}, 500
+    finally:
+        timer.observe()
+
+
+def detect_and_preprocess(data, detect_fn=None, trace=False):
+    """Complete pipeline: prelangid -> bv2 -> postlangid"""
+    detect_fn = detect_fn or detect_languages_scored
+
+    text = (data or {}).get('text', '')
+    if not text:
+        return {'error': 'No text provided', 'languages': []}, 400
+
+    if not detect_fn:
+        return {'error': 'Language detection service unavailable', 'languages': []}, 503
+
+    timer = lid_metrics.StageTimer()
+    try:
+        # STEP 1: Pre-language-id processing
+        with timer.stage('prelangid'):
+            precleaned_text = prelangid_clean(text)
+
+        # Check if text is empty after cleaning
+        if not precleaned_text.strip():
+            return {
+                'languages': [],
+                'message': 'Text became empty after preprocessing',
+                'original_text': text
+            }, 200
+
+        # STEP 2: Send cleaned text to bv2 for language detection
+        detection_result, mode = _run_detection(detect_fn, precleaned_text, timer)
+
+        # STEP 3: Post-language-id processing for each detected segment
+        # (segments in unsupported languages are skipped)
+        processed_languages = []
+        with timer.stage('postlangid'):
+            for segment, detected_lang, confidence, margin in detection_result:
+                if detected_lang in TOP_20_LANGS:
+                    # Apply language-specific post-processing
+                    cleaned_segment = postlangid_process(segment, detected_lang, lang_preprocessors)
+
+                    processed_languages.append({
+                        'original_segment': segment,
+                        'language': detected_lang,
+                        'confidence': confidence,
+                        'margin': margin,
+                        'cleaned_segment': cleaned_segment,
+                        'segment_length': len(cleaned_segment)
+                    })
+
+        payload = {
+            'languages': processed_languages,
+            'mode': mode,
+            'preprocessing_info': {
+                'original_length': len(text),
+                'precleaned_length': len(precleaned_text),
+                'segments_processed': len(processed_languages)
+            }
+        }
+        if trace:
+            payload['trace'] = _trace_info(
+                timer,
+                original_text=text,
+                precleaned_text=precleaned_text,
+                raw_detection=detection_result
+            )
+        return payload, 200
+    except Exception as e:
+        logger.exception("detect_and_preprocess failed")
+        return {'error': str(e), 'languages': []}, 500
+    finally:
+        timer.observe()
+
+
+def process_pipeline(data, detect_fn=None, trace=False):
+    """Alternative endpoint with more detailed pipeline information
+
+    ``step_2_detection.raw_detection`` lists ``[segment, language, confidence, margin]``
+    per segment (it was ``[segment, language]`` before confidences were added).
+    """
+    detect_fn = detect_fn or detect_languages_scored
+
+    text = (data or {}).get('text', '')
+    options = (data or {}).get('options', {})
+
+    # Extract options for prelangid_clean
+    remove_emojis = options.get('remove_emojis', False)
+    normalize_unicode_chars = options.get('normalize_unicode', True)
+    preserve_hashtag_text = options.get('preserve_hashtags', False)
+    preserve_mention_text = options.get('preserve_mentions', False)
+
+    if not text:
+        return {'error': 'No text provided'}, 400
+
+    if not detect_fn:
+        return {'error': 'Language detection service unavailable'}, 503
+
+    pipeline_info = {
+        'step_1_prelangid': {},
+        'step_2_detection': {},
+        'step_3_postlangid': {},
+        'final_result': []
+    }
+
+    timer = lid_metrics.StageTimer()
+    try:
+        # STEP 1: Pre-language-id processing with custom options
+        original_text = text
+        with timer.stage('prelangid'):
+            precleaned_text = prelangid_clean(
+                text,
+                preserve_hashtag_text=preserve_hashtag_text,
+                preserve_mention_text=preserve_mention_text
+            )
+
+        pipeline_info['step_1_prelangid'] = {
+            'original_text': original_text,
+            'cleaned_text': precleaned_text,
+            'original_length': len(original_text),
+            'cleaned_length': len(precleaned_text),
+            'options_used': options
+        }
+
+        # STEP 2: Language detection via bv2
+        detection_result, mode = _run_detection(detect_fn, precleaned_text, timer)
+        pipeline_info['step_2_detection'] = {
+            'mode': mode,
+            'input_text': precleaned_text,
+            'detected_segments': len(detection_result),
+            'raw_detection': detection_result
+        }
+
+        # STEP 3: Post-language-id processing
+        final_segments = []
+        with timer.stage('postlangid'):
+            for segment, detected_lang, confidence, margin in detection_result:
+                if detected_lang in TOP_20_LANGS:
+                    cleaned_segment = postlangid_process(segment, detected_lang, lang_preprocessors)
+
+                    segment_info = {
+                        'original_segment': segment,
+                        'language': detected_lang,
+                        'confidence': confidence,
+                        'margin': margin,
+                        'final_cleaned_segment': cleaned_segment,
+                        'processing_steps': {
+                            'input_length': len(segment),
+                            'output_length': len(cleaned_segment)
+                        }
+                    }
+                    final_segments.append(segment_info)
+
+        pipeline_info['step_3_postlangid'] = {
+            'processed_segments': len(final_segments)
+        }
+        pipeline_info['final_result'] = final_segments
+        if trace:
+            pipeline_info['trace'] = _trace_info(timer)
+
+        return pipeline_info, 200
+
+    except Exception as e:
+        logger.exception("process_pipeline failed")
+        return {'error': str(e), 'pipeline_info': pipeline_info}, 500
+    finally:
+        timer.observe()
@@ -0,0 +1,278 @@
+"""
+Instrumentation for the language detection service.
+
+Counters and histograms are sharded per thread: the request path only touches
+its own thread's values, and /metrics merges the shards when it renders the
+Prometheus text exposition format. No locks are taken on the hot path. Values
+owned by the detector itself (cache hit counts, batch sizes, debug counters)
+are read by collectors at scrape time.
+
+Each process keeps its own registry, so under the pre-fork launcher a scrape
+reports the worker that served it.
+"""
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Seconds; covers cached hits (~10us) up to slow transformer passes
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class _Sharded:
+    """Per-thread storage for a metric; shards of finished threads are folded into ``_retired``.
+
+    Folding happens whenever a thread registers a shard as well as at scrape time,
+    so a server that starts a thread per request keeps one shard per live thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # (weakref to owning thread, shard)
+        self._retired = {}
+        self._lock = threading.Lock()  # taken once per thread and at scrape time only
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def _merge_value(self, into, value):
+        raise NotImplementedError
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._fold_finished()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _fold_finished(self):
+        """Merge the shards of finished threads into ``_retired`` (caller holds ``_lock``)."""
+        live = []
+        for ref, shard in self._shards:
+            thread = ref()
+            if thread is None or not thread.is_alive():
+                for labels, value in list(shard.items()):
+                    self._merge_value(self._retired.setdefault(labels, self._new_value()), value)
+            else:
+                live.append((ref, shard))
+        self._shards = live
+
+    def _slot(self, labels):
+        shard = self._shard()
+        value = shard.get(labels)
+        if value is None:
+            value = shard[labels] = self._new_value()
+        return value
+
+    def collect(self):
+        """Merged {labels: value} over every thread that ever recorded."""
+        with self._lock:
+            self._fold_finished()
+            merged = {}
+            for labels, value in self._retired.items():
+                self._merge_value(merged.setdefault(labels, self._new_value()), value)
+            for _, shard in self._shards:
+                for labels, value in list(shard.items()):
+                    self._merge_value(merged.setdefault(labels, self._new_value()), value)
+        return merged
+
+
+class Counter(_Sharded):
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _new_value(self):
+        return [0]
+
+    def _merge_value(self, into, value):
+        into[0] += value[0]
+
+    def inc(self, amount=1, labels=()):
+        self._slot(labels)[0] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, (value,) in sorted(self.collect().items()):
+            lines.append(f"{self.name}{format_labels(_label_pairs(self.labelnames, labels))} {value}")
+        return lines
+
+
+class Histogram(_Sharded):
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_value(self):
+        # [per-bucket counts (+Inf last), sum, count]
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def _merge_value(self, into, value):
+        counts = into[0]
+        for i, c in enumerate(value[0]):
+            counts[i] += c
+        into[1] += value[1]
+        into[2] += value[2]
+
+    def observe(self, value, labels=()):
+        slot = self._slot(labels)
+        slot[0][bisect_left(self.buckets, value)] += 1
+        slot[1] += value
+        slot[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.collect().items()):
+            base = _label_pairs(self.labelnames, labels)
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(base + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(base)} {total}")
+            lines.append(f"{self.name}_count{format_labels(base)} {count}")
+        return lines
+
+
+def histogram_lines(name, labels, counts_by_value, buckets):
+    """Histogram sample lines from a {observed value: count} mapping."""
+    counts = [0] * (len(buckets) + 1)
+    total = 0.0
+    for value, count in counts_by_value.items():
+        counts[bisect_left(buckets, value)] += count
+        total += value * count
+    lines = []
+    cumulative = 0
+    for bound, c in zip(tuple(buckets) + (float('inf'),), counts):
+        cumulative += c
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f"{name}_bucket{format_labels(labels + [('le', le)])} {cumulative}")
+    lines.append(f"{name}_sum{format_labels(labels)} {total}")
+    lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    return lines
+
+
+def _label_pairs(names, values):
+    return list(zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, render_fn):
+        """Add a callable returning exposition lines, evaluated at scrape time."""
+        self._metrics.append(_Collector(render_fn))
+        return render_fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class _Collector:
+    def __init__(self, render_fn):
+        self.render = render_fn
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'lid_requests_total', 'HTTP requests handled, by route and status.', ('route', 'status')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'lid_request_seconds', 'HTTP request latency by route.', ('route',)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'lid_stage_seconds', 'Wall time per language-detection pipeline stage.', ('stage',)))
+TOKENS = REGISTRY.register(Counter(
+    'lid_tokens_total', 'Tokens run through the detection pipeline (document cache hits excluded).'))
+SEGMENTS = REGISTRY.register(Counter(
+    'lid_segments_total', 'Detected segments returned, by language.', ('language',)))
+DOCUMENTS = REGISTRY.register(Counter(
+    'lid_documents_total',
+    'Documents detected, by path: script census, document-level fastText early exit, or full per-token pipeline.',
+    ('path',)))
+
+
+def observe_request(route, status, seconds):
+    REQUESTS.inc(1, (route, str(status)))
+    REQUEST_SECONDS.observe(seconds, (route,))
+
+
+def count_segments(languages):
+    for lang in languages:
+        SEGMENTS.inc(1, (lang,))
+
+
+class StageTimer:
+    """Collects stage wall times for one request; also usable as a bv2 stage sink."""
+
+    def __init__(self):
+        self.timings = {}
+        self.counts = {}
+        # (size, StageTimer) of the micro-batch this request's detection ran in
+        self.batch = None
+
+    def record(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def observe(self):
+        for stage, seconds in self.timings.items():
+            STAGE_SECONDS.observe(seconds, (stage,))
+        tokens = self.counts.get('tokens')
+        if tokens:
+            TOKENS.inc(tokens)
+        documents = self.counts.get('documents')
+        if documents:
+            script = self.counts.get('script_fast_path', 0)
+            document = self.counts.get('doc_fast_path', 0)
+            for path, n in (('script', script), ('document', document), ('full', documents - script - document)):
+                if n:
+                    DOCUMENTS.inc(n, (path,))
+
+    def as_ms(self):
+        return {stage: round(seconds * 1000.0, 3) for stage, seconds in self.timings.items()}
+
+
+def render():
+    return REGISTRY.render()
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
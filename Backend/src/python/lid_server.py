@@ -0,0 +1,197 @@
+"""
+Production launcher for the language detection service.
+
+Loads the read-only models (XLM-R, fastText, jieba, spaCy) once in the gunicorn
+master and then forks the workers, so model pages are shared copy-on-write
+instead of being loaded N times. The master periodically logs resident vs shared
+memory for every worker.
+
+SIGHUP to the master (which POST /admin/reload sends from a worker) rebuilds the
+detector in the master from the model files and POLYLANGID_CONFIG, then gunicorn
+forks fresh workers from it and gracefully stops the old ones. The rebuild runs
+inside gunicorn's signal handling, so for as long as it takes (seconds, minutes
+with the transformer) the master neither reaps nor respawns workers nor reacts to
+other signals; the old workers keep serving meanwhile. A failed rebuild is
+logged and the new workers fork from the current detector.
+
+Run with:
+    python src/python/lid_server.py [--workers 4] [--preload-langs en,es,fr] [--asgi]
+
+Environment (flags take precedence):
+    LID_BIND                     bind address (default 0.0.0.0:5001)
+    LID_WORKERS                  worker processes (default CPU count)
+    LID_PRELOAD_LANGS            spaCy languages to preload, "all" or "none" (default all)
+    LID_TORCH_THREADS            torch intra-op threads per worker (default 1)
+    LID_MEMORY_REPORT_INTERVAL   seconds between memory reports, 0 disables (default 60)
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+logger = logging.getLogger("lid_server")
+
+
+def parse_langs(value):
+    value = (value or '').strip().lower()
+    if value in ('', 'all'):
+        return None
+    if value == 'none':
+        return []
+    return [lang.strip() for lang in value.split(',') if lang.strip()]
+
+
+def preload_models(langs=None):
+    """Load every shared model in the current (master) process."""
+    started = time.perf_counter()
+    from src.services.languagedetectionandpreprocessing import bv2
+    from src.services.languagedetectionandpreprocessing import postlangidprocessing
+
+    bv2.get_detector()
+    # With POLYLANGID_BACKGROUND_LOAD the transformer is still loading on a thread;
+    # workers fork from the fully loaded detector
+    bv2.wait_for_models()
+    bv2.load_dependencies()
+    postlangidprocessing.load_dependencies()
+    loaded = postlangidprocessing.preload_spacy_models(langs)
+    logger.info(f"Models preloaded in {time.perf_counter() - started:.1f}s (spaCy: {loaded})")
+
+
+def freeze_heap():
+    """Move everything allocated so far out of the collector's reach.
+
+    Otherwise the first GC pass in each worker touches every inherited object
+    header and un-shares the pages the master just loaded.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def read_memory(pid):
+    """Resident, proportional, shared and private memory of a process in kB (Linux)."""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        'rss_kb': fields.get('Rss', 0),
+        'pss_kb': fields.get('Pss', 0),
+        'shared_kb': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'private_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def memory_report(pids):
+    report = {}
+    for pid in pids:
+        mem = read_memory(pid)
+        if mem is not None:
+            report[pid] = mem
+    return report
+
+
+def log_memory_report(pids):
+    report = memory_report(pids)
+    for pid, mem in sorted(report.items()):
+        share = (mem['shared_kb'] / mem['rss_kb'] * 100) if mem['rss_kb'] else 0.0
+        logger.info(
+            f"worker {pid}: rss={mem['rss_kb'] // 1024}MB shared={mem['shared_kb'] // 1024}MB "
+            f"private={mem['private_kb'] // 1024}MB pss={mem['pss_kb'] // 1024}MB ({share:.0f}% shared)"
+        )
+    return report
+
+
+def build_options(args):
+    torch_threads = int(os.environ.get('LID_TORCH_THREADS', '1'))
+    report_interval = float(os.environ.get('LID_MEMORY_REPORT_INTERVAL', '60'))
+
+    def post_fork(server, worker):
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except Exception:
+            pass
+
+    def on_reload(server):
+        # SIGHUP: gunicorn forks the new workers right after this returns
+        from src.services.languagedetectionandpreprocessing import bv2
+        gc.unfreeze()  # lets the replaced detector be collected
+        try:
+            if not bv2.reload_detector():
+                logger.error(f"Detector reload failed, keeping the current one: {bv2.reload_status().get('error')}")
+        except Exception:
+            logger.exception("Detector reload failed")
+        finally:
+            freeze_heap()
+
+    def when_ready(server):
+        if report_interval <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(report_interval)
+                log_memory_report(list(server.WORKERS.keys()))
+
+        threading.Thread(target=loop, name='lid-memory-report', daemon=True).start()
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'preload_app': True,
+        'timeout': 120,
+        'post_fork': post_fork,
+        'on_reload': on_reload,
+        'when_ready': when_ready,
+    }
+    if args.asgi:
+        options['worker_class'] = 'uvicorn.workers.UvicornWorker'
+    return options
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-fork language detection server')
+    parser.add_argument('--bind', default=os.environ.get('LID_BIND', '0.0.0.0:5001'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('LID_WORKERS', str(os.cpu_count() or 1))))
+    parser.add_argument('--preload-langs', default=os.environ.get('LID_PRELOAD_LANGS', 'all'),
+                        help='comma-separated spaCy languages to load before forking, "all" or "none"')
+    parser.add_argument('--asgi', action='store_true', help='serve the ASGI app with uvicorn workers')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    from gunicorn.app.base import BaseApplication
+
+    class LIDApplication(BaseApplication):
+        def load_config(self):
+            for key, value in build_options(args).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs once in the master because preload_app is set
+            preload_models(parse_langs(args.preload_langs))
+            import lid_handlers
+            lid_handlers.RELOAD_VIA_MASTER = True
+            if args.asgi:
+                import languagedetection_asgi as module
+            else:
+                import languagedectection as module
+            freeze_heap()
+            return module.app
+
+    LIDApplication().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,87 +2,126 @@
 
 from __future__ import annotations
 
-import os, re, math, string, logging, unicodedata
+import os, re, sys, json, math, mmap, time, zlib, atexit, string, struct, hashlib, inspect, logging, threading, unicodedata
+import importlib, importlib.util
+import contextvars, multiprocessing
+from contextlib import contextmanager
 from functools import lru_cache
-from collections import Counter, defaultdict
-from typing import List, Tuple, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, OrderedDict, defaultdict, deque
+from itertools import islice
+from typing import List, Tuple, Dict, Optional, Iterable, Iterator, Callable
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 
 # ------------------------------
 # Dependencies (graceful degrade)
 # ------------------------------
 
-missing = []
-try:
-    from transformers.pipelines import pipeline
-except Exception:
-    pipeline = None
-    missing.append('transformers')
+# transformers (with torch) alone takes seconds to import, so the heavy optional
+# packages are imported on first use. `missing` starts as the packages that are not
+# installed (found without importing them) and gains any whose import later fails.
 
-try:
-    import torch
-    _torch_available = True
-    _torch_cuda = torch.cuda.is_available()
-except Exception:
-    _torch_available = False
-    _torch_cuda = False
-    missing.append('torch')
+_DEPENDENCIES = {
+    'transformers': 'transformers', 'onnxruntime': 'onnxruntime', 'torch': 'torch',
+    'fasttext': 'fasttext', 'jieba': 'jieba', 'janome': 'janome', 'pythainlp': 'pythainlp',
+    'pyvi': 'pyvi', 'Sastrawi': 'Sastrawi',
+}
 
-try:
-    import fasttext
-except Exception:
-    fasttext = None
-    missing.append('fasttext')
+def _installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
 
-try:
-    import jieba
-    _jieba_available = True
-except Exception:
-    jieba = None
-    _jieba_available = False
-    missing.append('jieba')
+missing = [name for name, module in _DEPENDENCIES.items() if not _installed(module)]
 
 try:
-    from janome.tokenizer import Tokenizer as JanomeTokenizer
-    _janome = JanomeTokenizer()
-    _janome_available = True
+    import numpy as np
 except Exception:
-    _janome_available = False
-    _janome = None
-    missing.append('janome')
+    np = None
+    missing.append('numpy')
 
-try:
-    from pythainlp.tokenize import word_tokenize as thai_tokenize
-    _thai_available = True
-except Exception:
-    _thai_available = False
-    thai_tokenize = None
-    missing.append('pythainlp')
+_lazy: Dict[str, object] = {}
+_lazy_lock = threading.RLock()
 
-# Vietnamese tokenizer (pyvi)
-try:
-    from pyvi import ViTokenizer as _ViTokenizer
-    def vi_tokenize_to_list(text: str) -> List[str]:
-        try:
-            return [x for x in _ViTokenizer.tokenize(text).split() if x.strip()]
-        except Exception:
-            return []
-    _vi_tokenizer_available = True
-except Exception:
-    _vi_tokenizer_available = False
-    vi_tokenize_to_list = None # type: ignore
-    missing.append('pyvi')
+def _optional(name: str, load: Callable[[], object]) -> object:
+    """``load()`` on first call, cached; None (and ``name`` in missing) if it fails."""
+    try:
+        return _lazy[name]
+    except KeyError:
+        pass
+    with _lazy_lock:
+        if name not in _lazy:
+            value = None
+            if name not in missing:
+                try:
+                    value = load()
+                except Exception as e:
+                    logger.warning(f"Optional dependency {name} failed to import: {e}")
+                    missing.append(name)
+            _lazy[name] = value
+        return _lazy[name]
 
-# Indonesian stemmer (Sastrawi)
-try:
-    from Sastrawi.Stemmer.StemmerFactory import StemmerFactory
-    _id_stemmer_factory = StemmerFactory()
-    _id_stemmer = _id_stemmer_factory.create_stemmer()
-    _id_stemmer_available = True
-except Exception:
-    _id_stemmer_available = False
-    _id_stemmer = None
-    missing.append('Sastrawi')
+def _transformers():
+    """The transformers package; its pipelines submodule is imported only by _pipeline()."""
+    return _optional('transformers', lambda: importlib.import_module('transformers'))
+
+def _pipeline():
+    tf = _transformers()
+    return tf and _optional('transformers.pipelines', lambda: importlib.import_module('transformers.pipelines').pipeline)
+
+def _torch():
+    return _optional('torch', lambda: importlib.import_module('torch'))
+
+def _torch_cuda() -> bool:
+    torch = _torch()
+    return bool(_optional('torch.cuda', lambda: torch is not None and torch.cuda.is_available()))
+
+def _onnxruntime():
+    return _optional('onnxruntime', lambda: importlib.import_module('onnxruntime'))
+
+def _fasttext():
+    return _optional('fasttext', lambda: importlib.import_module('fasttext'))
+
+def _jieba():
+    return _optional('jieba', lambda: importlib.import_module('jieba'))
+
+def _janome():
+    """A Janome tokenizer (building it loads the dictionary)."""
+    return _optional('janome', lambda: importlib.import_module('janome.tokenizer').Tokenizer())
+
+def _thai_tokenize():
+    return _optional('pythainlp', lambda: importlib.import_module('pythainlp.tokenize').word_tokenize)
+
+def _vi_tokenizer():
+    """pyvi's ViTokenizer (Vietnamese word segmentation)."""
+    return _optional('pyvi', lambda: importlib.import_module('pyvi').ViTokenizer)
+
+def vi_tokenize_to_list(text: str) -> List[str]:
+    tokenizer = _vi_tokenizer()
+    if tokenizer is None:
+        return []
+    try:
+        return [x for x in tokenizer.tokenize(text).split() if x.strip()]
+    except Exception:
+        return []
+
+def _id_stemmer():
+    """Sastrawi's Indonesian stemmer."""
+    return _optional('Sastrawi', lambda: importlib.import_module('Sastrawi.Stemmer.StemmerFactory').StemmerFactory().create_stemmer())
+
+def load_dependencies() -> List[str]:
+    """Import every optional dependency now, and load jieba's dictionary (e.g. in a
+    prefork master, before the workers fork); returns the ones that are unavailable."""
+    for load in (_transformers, _torch, _torch_cuda, _onnxruntime, _fasttext, _janome,
+                 _thai_tokenize, _vi_tokenizer, _id_stemmer):
+        load()
+    jieba = _jieba()
+    if jieba is not None:
+        try:
+            jieba.initialize()
+        except Exception as e:
+            logger.warning(f"jieba initialization failed: {e}")
+    return sorted(missing)
 
 logger = logging.getLogger("D1_EnhancedPolyLangID")
 logging.basicConfig(level=logging.INFO)
@@ -99,16 +138,41 @@ TOP_20_LANGS = {
     'id','de','ja','tr','ko','it','th','vi','pl','nl'
 }
 
-TRANSFORMER_MODEL = "papluca/xlm-roberta-base-language-detection"
+TRANSFORMER_MODEL = os.environ.get("POLYLANGID_TRANSFORMER_MODEL", "papluca/xlm-roberta-base-language-detection")
 FASTTEXT_PATH_DEFAULT = os.environ.get(
     "POLYLANGID_FASTTEXT_PATH",
     os.path.join(os.path.dirname(__file__), "lid.176.ftz")
 )
 FASTTEXT_FALLBACK_PATH = os.environ.get("POLYLANGID_FASTTEXT_FALLBACK","")
 TRANSFORMER_FP16 = True
-TRANSFORMER_BATCH_SIZE = 64 if _torch_cuda else 16
+# Tokens per transformer batch on CPU; on CUDA ModelManager uses TRANSFORMER_BATCH_SIZE_CUDA
+TRANSFORMER_BATCH_SIZE = 16
+TRANSFORMER_BATCH_SIZE_CUDA = 64
+# Direct-logits path: tokenizer + model called without the HF pipeline, padded to
+# the longest item with a max_length sized for single tokens (sentences get more)
+TRANSFORMER_DIRECT = os.environ.get("POLYLANGID_TRANSFORMER_DIRECT", "1") != "0"
+TRANSFORMER_MAX_LENGTH = int(os.environ.get("POLYLANGID_TRANSFORMER_MAX_LENGTH", "16"))
+TRANSFORMER_SENTENCE_MAX_LENGTH = 128
+# Backend for the direct path: "torch", "onnx" (ONNX Runtime, fp32) or "onnx-int8"
+# (dynamic int8 quantization, CPU). ONNX files are exported from TRANSFORMER_MODEL
+# into TRANSFORMER_ONNX_DIR on first use; once there, torch is no longer needed.
+TRANSFORMER_BACKEND = os.environ.get("POLYLANGID_TRANSFORMER_BACKEND", "torch")
+TRANSFORMER_ONNX_DIR = os.environ.get("POLYLANGID_ONNX_DIR", os.path.join(os.path.dirname(__file__), "onnx"))
 FASTTEXT_TOP_K = 5
 FASTTEXT_TOP_K_SHORT = 3
+# fastText engine: "fasttext" (the compiled binding), "numpy" (NumpyFastText: no
+# binding, scores only the supported languages, vectorised over a batch) or
+# "auto" (the binding when installed, else NumPy)
+FASTTEXT_ENGINE = os.environ.get("POLYLANGID_FASTTEXT_ENGINE", "auto")
+# Per-token distributions: "ensemble" (heuristics + fastText + transformer, fused)
+# or "fast" (DistilledTokenModel imitating that fusion; the transformer is not
+# loaded). Built with benchmarks/lid_distill.py.
+TOKEN_BACKEND = os.environ.get("POLYLANGID_TOKEN_BACKEND", "ensemble")
+DISTILLED_PATH = os.environ.get("POLYLANGID_DISTILLED_PATH", os.path.join(os.path.dirname(__file__), "distilled.npz"))
+DISTILLED_TOP_K = 3
+# Precomputed per-token distributions for frequent tokens (benchmarks/lid_lexicon.py);
+# used when the file exists, before any model runs
+LEXICON_PATH = os.environ.get("POLYLANGID_LEXICON_PATH", os.path.join(os.path.dirname(__file__), "lexicon.bin"))
 
 # Enhanced smoothing parameters
 SWITCH_PENALTY = 0.22  # Reduced from 0.25 for better flow
@@ -132,6 +196,69 @@ LANG_PRIMARY_SCRIPT = {
 SCRIPT_MISMATCH_PENALTY = 0.28
 SCRIPT_MISMATCH_LEN_THRESHOLD = 3
 
+# Document-level result cache (0 entries disables it, TTL 0 = no expiry)
+DOC_CACHE_MAX_ENTRIES = int(os.environ.get("POLYLANGID_DOC_CACHE_SIZE", "50000"))
+DOC_CACHE_MAX_BYTES = int(os.environ.get("POLYLANGID_DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DOC_CACHE_TTL = float(os.environ.get("POLYLANGID_DOC_CACHE_TTL", "0"))
+# Warm-start snapshots of the fastText, distilled and document caches (empty path
+# disables). Loaded when the global detector is built, saved at exit and every
+# SNAPSHOT_INTERVAL seconds (0 = exit only); a snapshot taken under other models
+# or heuristics is ignored (see EnhancedDetector.cache_fingerprint).
+SNAPSHOT_PATH = os.environ.get("POLYLANGID_SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL = float(os.environ.get("POLYLANGID_SNAPSHOT_INTERVAL", "0"))
+SNAPSHOT_MAX_ENTRIES = int(os.environ.get("POLYLANGID_SNAPSHOT_MAX_ENTRIES", "100000"))
+SNAPSHOT_VERSION = 1
+# Host-wide token distribution cache shared by worker processes (a memory-mapped
+# file, best on /dev/shm; empty disables). The detector's cache fingerprint is
+# part of the file name, so other models or heuristics get a fresh table.
+SHARED_CACHE_PATH = os.environ.get("POLYLANGID_SHARED_CACHE_PATH", "")
+SHARED_CACHE_SLOTS = int(os.environ.get("POLYLANGID_SHARED_CACHE_SLOTS", str(1 << 18)))
+SHARED_CACHE_STRIPES = 64
+# Build the global detector without the transformer and load it on a background
+# thread; until then detection runs in "degraded" mode (fastText and heuristics)
+BACKGROUND_LOAD = os.environ.get("POLYLANGID_BACKGROUND_LOAD", "0") == "1"
+# Short texts in the scripts whose tokenizers load lazily, run by warm_up
+WARM_UP_TEXTS = (
+    "hello everyone, how are you today", "大家好，今天天气很好", "今日はとても良い天気です",
+    "สวัสดีครับทุกคน", "Selamat pagi semua teman", "xin chào các bạn", "नमस्ते दोस्तों कैसे हो",
+)
+
+# Batch execution: "thread" shares one detector, "process" gives each worker its own
+BATCH_MODE = os.environ.get("POLYLANGID_BATCH_MODE", "thread")
+BATCH_CHUNK_SIZE = int(os.environ.get("POLYLANGID_BATCH_CHUNK_SIZE", "64"))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("POLYLANGID_BATCH_MAX_IN_FLIGHT", "0"))  # 0 = 2 chunks per worker
+
+# Script census fast path: documents whose tokens are all decided by script
+# (Hangul, Thai, Cyrillic, ...) skip model inference and DP
+SCRIPT_FAST_PATH = os.environ.get("POLYLANGID_SCRIPT_FAST_PATH", "1") != "0"
+
+# Confidence-gated cascade: fuse heuristics + fastText first and send only
+# tokens whose fused max probability stays below the threshold to the transformer
+CASCADE_ENABLED = os.environ.get("POLYLANGID_CASCADE", "0") == "1"
+CASCADE_THRESHOLD = float(os.environ.get("POLYLANGID_CASCADE_THRESHOLD", "0.85"))
+
+# Document-level early exit: when every lettered token shares one script and a
+# single fastText call on the whole text clears the threshold, the document is
+# returned as one segment without per-token inference or DP. Same-script Latin
+# text is often code-mixed, so any token fastText gives to another language with
+# at least TOKEN_VETO probability sends the document down the full path. A
+# threshold above 1 disables it; short documents always take the full path.
+DOC_FAST_PATH_THRESHOLD = float(os.environ.get("POLYLANGID_DOC_FAST_PATH_THRESHOLD", "0.95"))
+DOC_FAST_PATH_MIN_TOKENS = int(os.environ.get("POLYLANGID_DOC_FAST_PATH_MIN_TOKENS", "4"))
+DOC_FAST_PATH_TOKEN_VETO = float(os.environ.get("POLYLANGID_DOC_FAST_PATH_TOKEN_VETO", "0.35"))
+
+# Long documents: past WINDOW_TOKENS tokens the per-token path runs over windows
+# of that size overlapping by WINDOW_OVERLAP, so distributions and the DP table
+# stay bounded however long the input is. detect_languages_stream always windows.
+WINDOWED = os.environ.get("POLYLANGID_WINDOWED", "1") != "0"
+WINDOW_TOKENS = max(int(os.environ.get("POLYLANGID_WINDOW_TOKENS", "512")), 8)
+WINDOW_OVERLAP = min(int(os.environ.get("POLYLANGID_WINDOW_OVERLAP", "32")), WINDOW_TOKENS // 4)
+
+# Optional JSON file overriding the detection tunables (TUNABLES below), e.g.
+# {"SWITCH_PENALTY": 0.25, "CASCADE_THRESHOLD": 0.9}; read at import and again
+# by every reload_detector, which is how a running server picks up new values
+CONFIG_PATH = os.environ.get("POLYLANGID_CONFIG", "")
+
 # ------------------------------
 # Enhanced Patterns and Lexicons
 # ------------------------------
@@ -202,6 +329,13 @@ SCRIPT_LANG_MAP = {
     "BENGALI": ["bn"]
 }
 
+# Scripts that settle a token's language on their own: the perfect scripts plus
+# the single-language hard filters applied in _enhanced_disambiguate
+SCRIPT_DETERMINED_LANG = {
+    **{sc: langs[0] for sc, langs in SCRIPT_LANG_MAP.items() if len(langs) == 1},
+    **PERFECT_SCRIPT_MAP,
+}
+
 # Enhanced strong word lists
 STRONG_EN_WORDS = {
     "hello","world","the","this","is","and","of","to","in","it","you","that","he","was","for","on","are","as","with","his","they","i","at","be","have","from","or","one","had","by","but","not","what","all","were","we","when","your","can","said","there","use","an","each","which","she","do","how","their","if","will","up","other","about","out","many","then","them","these","so","some","her","would","make","like","him","into","time","has","look","two","more","write","go","see","number","no","way","could","people","my","than","first","water","been","call","who","oil","its","now","find","long","down","day","did","get","come","made","may","part"
@@ -291,6 +425,17 @@ def get_script(ch: str) -> str:
     except Exception:
         return "UNKNOWN"
 
+# (segment, language, confidence, margin). confidence is the length-weighted mean
+# fused probability of the segment's language over its tokens; margin is how
+# clearly the DP preferred that language at the segment's weakest token, as
+# 1 - exp(-score gap), 0 when post-processing overrode the DP. Both in [0, 1].
+ScoredSegment = Tuple[str, str, float, float]
+
+def _margin_score(gap: float) -> float:
+    if gap <= 0.0:
+        return 0.0
+    return 1.0 - math.exp(-gap) if gap != float('inf') else 1.0
+
 def dominant_script(token: str) -> Optional[str]:
     counts = Counter()
     for ch in token:
@@ -581,10 +726,9 @@ def tokenize(text: str) -> List[str]:
         sc = _char_script(seg[0])
 
         # Japanese: Janome for kana segments
-        if (sc in ('HIRAGANA','KATAKANA') and 
-            _janome_available and _janome):
+        if (sc in ('HIRAGANA','KATAKANA') and _janome()):
             try:
-                jtoks = [str(tok) for tok in _janome.tokenize(seg) if str(tok).strip()]
+                jtoks = [str(tok) for tok in _janome().tokenize(seg) if str(tok).strip()]
                 tokens.extend(jtoks if len(jtoks) > 1 else [seg])
                 continue
             except Exception: 
@@ -593,18 +737,18 @@ def tokenize(text: str) -> List[str]:
         # HAN: prefer Janome with kana context else jieba
         if sc == 'HAN':
             used = False
-            if _janome_available and _janome and _has_kana_context(idx):
+            if _has_kana_context(idx) and _janome():
                 try:
-                    jtoks = [str(tok) for tok in _janome.tokenize(seg) if str(tok).strip()]
+                    jtoks = [str(tok) for tok in _janome().tokenize(seg) if str(tok).strip()]
                     if jtoks: 
                         tokens.extend(jtoks)
                         used = True
                 except Exception: 
                     used = False
             
-            if not used and _jieba_available and jieba:
+            if not used and _jieba():
                 try:
-                    tokens.extend([x for x in jieba.lcut(seg) if x.strip()])
+                    tokens.extend([x for x in _jieba().lcut(seg) if x.strip()])
                     continue
                 except Exception: 
                     pass
@@ -613,9 +757,9 @@ def tokenize(text: str) -> List[str]:
                 continue
 
         # Thai
-        if (sc == 'THAI' and _thai_available and thai_tokenize):
+        if (sc == 'THAI' and _thai_tokenize()):
             try:
-                th = [x for x in thai_tokenize(seg) if x.strip()]
+                th = [x for x in _thai_tokenize()(seg) if x.strip()]
                 tokens.extend(th if len(th) > 1 else [seg])
                 continue
             except Exception: 
@@ -623,7 +767,7 @@ def tokenize(text: str) -> List[str]:
 
         # Vietnamese (pyvi)
         if (sc == 'LATIN' and any(ch in VI_DIACRITICS for ch in seg) and 
-            _vi_tokenizer_available and vi_tokenize_to_list):
+            _vi_tokenizer()):
             try:
                 vi_toks = vi_tokenize_to_list(seg)
                 if len(vi_toks) > 1: 
@@ -633,10 +777,9 @@ def tokenize(text: str) -> List[str]:
                 pass
 
         # Indonesian stemmer to surface roots
-        if (sc == 'LATIN' and _id_stemmer_available and _id_stemmer and 
-            len(seg) > 5):
+        if (sc == 'LATIN' and len(seg) > 5 and _id_stemmer()):
             try:
-                stemmed = _id_stemmer.stem(seg)
+                stemmed = _id_stemmer().stem(seg)
                 if stemmed != seg and stemmed in ID_COMPREHENSIVE_ROOTS:
                     tokens.append(stemmed)
                     continue
@@ -677,57 +820,713 @@ def tokenize(text: str) -> List[str]:
     
     return merged
 
+# ------------------------------
+# Transformer inference backends
+# ------------------------------
+
+def label_columns(id2label: Dict[int, str]) -> Tuple["np.ndarray", List[str]]:
+    """Logit column indices of the supported languages and their codes, in column order."""
+    cols = sorted((int(i), lab.lower()) for i, lab in id2label.items() if lab.lower() in TOP_20_LANGS)
+    return np.array([i for i, _ in cols], dtype=np.int64), [lang for _, lang in cols]
+
+def softmax_columns(logits: "np.ndarray", cols: "np.ndarray") -> "np.ndarray":
+    z = logits[:, cols].astype(np.float32, copy=False)
+    z -= z.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+class TorchClassifier:
+    """Sequence classifier run with PyTorch; ``logits`` returns a float32 array."""
+
+    def __init__(self, model_name: str):
+        tf, torch = _transformers(), _torch()
+        if torch is None or tf is None:
+            raise RuntimeError("torch and transformers are needed")
+        self.torch = torch
+        self.tokenizer = tf.AutoTokenizer.from_pretrained(model_name)
+        model = tf.AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+        if _torch_cuda():
+            model = (model.half() if TRANSFORMER_FP16 else model).to("cuda")
+        self.model = model
+        self.id2label = {int(i): lab for i, lab in model.config.id2label.items()}
+
+    def logits(self, texts: List[str], max_length: int) -> "np.ndarray":
+        enc = self.tokenizer(texts, padding="longest", truncation=True, max_length=max_length, return_tensors="pt")
+        enc = {k: v.to(self.model.device) for k, v in enc.items()}
+        with self.torch.inference_mode():
+            return self.model(**enc).logits.float().cpu().numpy()
+
+def onnx_export_dir(model_name: str, onnx_dir: str=TRANSFORMER_ONNX_DIR) -> str:
+    return os.path.join(onnx_dir, model_name.strip("/").replace("/", "--"))
+
+def export_onnx_classifier(model_name: str, onnx_dir: str=TRANSFORMER_ONNX_DIR, quantize: bool=False) -> str:
+    """Export ``model_name`` to ONNX (plus a dynamically int8-quantized copy when
+    ``quantize``) with its tokenizer and label map alongside; returns the model path.
+    Existing files are reused. Needs torch for the export, onnxruntime to quantize."""
+    out = onnx_export_dir(model_name, onnx_dir)
+    fp32 = os.path.join(out, "model.onnx")
+    if not os.path.exists(fp32):
+        tf, torch = _transformers(), _torch()
+        if torch is None or tf is None:
+            raise RuntimeError("exporting to ONNX needs torch and transformers")
+        os.makedirs(out, exist_ok=True)
+        tokenizer = tf.AutoTokenizer.from_pretrained(model_name)
+        model = tf.AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+        sample = tokenizer(["hello", "bonjour tout le monde"], padding=True, return_tensors="pt")
+        names = [k for k in ("input_ids", "attention_mask") if k in sample]
+        tmp = f"{fp32}.{os.getpid()}.tmp"
+        # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic_axes as-is
+        legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        torch.onnx.export(
+            model, tuple(sample[k] for k in names), tmp,
+            input_names=names, output_names=["logits"], opset_version=14,
+            dynamic_axes={**{k: {0: "batch", 1: "sequence"} for k in names}, "logits": {0: "batch"}},
+            **legacy,
+        )
+        tokenizer.save_pretrained(out)
+        with open(os.path.join(out, "labels.json"), "w", encoding="utf-8") as f:
+            json.dump({str(i): lab for i, lab in model.config.id2label.items()}, f)
+        os.replace(tmp, fp32)
+        logger.info(f"Exported {model_name} to {fp32}")
+    if not quantize:
+        return fp32
+    
+    int8 = os.path.join(out, "model.int8.onnx")
+    if not os.path.exists(int8):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp = f"{int8}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, int8)
+        logger.info(f"Quantized {fp32} to {int8}")
+    return int8
+
+class OnnxClassifier:
+    """The same classifier run with ONNX Runtime on CPU, exported on first use."""
+
+    def __init__(self, model_name: str, onnx_dir: str=TRANSFORMER_ONNX_DIR, quantize: bool=False):
+        ort, tf = _onnxruntime(), _transformers()
+        if ort is None or tf is None:
+            raise RuntimeError("onnxruntime and transformers (for the tokenizer) are needed")
+        path = export_onnx_classifier(model_name, onnx_dir, quantize)
+        out = os.path.dirname(path)
+        self.tokenizer = tf.AutoTokenizer.from_pretrained(out)
+        with open(os.path.join(out, "labels.json"), encoding="utf-8") as f:
+            self.id2label = {int(i): lab for i, lab in json.load(f).items()}
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def logits(self, texts: List[str], max_length: int) -> "np.ndarray":
+        enc = self.tokenizer(texts, padding="longest", truncation=True, max_length=max_length, return_tensors="np")
+        feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+        return self.session.run(["logits"], feed)[0].astype(np.float32)
+
+# ------------------------------
+# NumPy fastText
+# ------------------------------
+
+FASTTEXT_MAGIC = 793712314
+_FT_EOS = "</s>"
+_FT_LOSS_HS, _FT_LOSS_NS, _FT_LOSS_SOFTMAX, _FT_LOSS_OVA = 1, 2, 3, 4
+# fastText's readWord splits on exactly these; str.split() would also split on NBSP etc.
+_FT_SPLIT = re.compile(r"[ \n\t\v\f\r\x00]+")
+# Labels whose probability falls below this are dropped by fastText's predict
+_FT_MIN_PROB = 1e-5
+_U64 = (1 << 64) - 1
+
+def fasttext_hash(data: bytes) -> int:
+    """32-bit FNV-1a as fastText computes it (bytes are sign-extended chars)."""
+    h = 2166136261
+    for c in data:
+        h = ((h ^ (c | 0xFFFFFF00 if c & 0x80 else c)) * 16777619) & 0xFFFFFFFF
+    return h
+
+class _FtReader:
+    """Sequential reader over a fastText .bin/.ftz file."""
+
+    def __init__(self, data: bytes):
+        self.data, self.pos = data, 0
+
+    def unpack(self, fmt: str) -> tuple:
+        vals = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return vals
+
+    def array(self, dtype, count: int) -> "np.ndarray":
+        arr = np.frombuffer(self.data, dtype=dtype, count=count, offset=self.pos)
+        self.pos += arr.nbytes
+        return arr
+
+    def cstr(self) -> bytes:
+        end = self.data.index(b"\0", self.pos)
+        word, self.pos = self.data[self.pos:end], end + 1
+        return word
+
+    def _pq(self) -> Tuple[int, int, int, "np.ndarray"]:
+        dim, nsubq, dsub, lastdsub = self.unpack("<4i")
+        return nsubq, dsub, lastdsub, self.array("<f4", dim * 256)
+
+    def matrix(self, quantized: bool) -> "np.ndarray":
+        """A dense or product-quantized matrix, decoded to dense float32."""
+        if not quantized:
+            m, n = self.unpack("<2q")
+            return self.array("<f4", m * n).reshape(m, n)
+        qnorm, = self.unpack("<?")
+        m, n = self.unpack("<2q")
+        codesize, = self.unpack("<i")
+        codes = self.array(np.uint8, codesize)
+        nsubq, dsub, lastdsub, centroids = self._pq()
+        codes = codes.reshape(m, nsubq)
+        out = np.empty((m, n), dtype=np.float32)
+        for q in range(nsubq):
+            d = lastdsub if q == nsubq - 1 else dsub
+            table = centroids[q * 256 * dsub:q * 256 * dsub + 256 * d].reshape(256, d)
+            out[:, q * dsub:q * dsub + d] = table[codes[:, q]]
+        if qnorm:
+            norm_codes = self.array(np.uint8, m)
+            _, _, _, norms = self._pq()
+            out *= norms[norm_codes][:, None]
+        return out
+
+class NumpyFastText:
+    """fastText supervised-model inference in NumPy, restricted to a label subset.
+
+    Reads the .bin/.ftz file once (product-quantized matrices are decoded to
+    dense float32) and reproduces the C++ input side: whitespace words plus the
+    end-of-line token, each word's vocabulary row and hashed char n-grams, and
+    hashed word n-grams. Only the output rows the chosen labels need are scored:
+    their paths through the Huffman tree for hierarchical softmax, their own rows
+    otherwise. Those probabilities equal the library's for hierarchical softmax and
+    one-vs-all; softmax/negative-sampling models are normalised over the subset.
+    """
+
+    def __init__(self, path: str, labels: Optional[Iterable[str]]=None):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        with open(path, "rb") as f:
+            r = _FtReader(f.read())
+        magic, version = r.unpack("<2i")
+        if magic != FASTTEXT_MAGIC:
+            raise ValueError(f"{path} is not a fastText model")
+        (self.dim, _ws, _epoch, _min_count, _neg, self.word_ngrams, self.loss, model,
+         self.bucket, self.minn, self.maxn, _lr_update, _t) = r.unpack("<12id")
+        if version == 11 and model == 3:
+            self.maxn = 0  # old supervised models had no subwords
+        
+        size, self.nwords, nlabels = r.unpack("<3i")
+        _ntokens, self.pruneidx_size = r.unpack("<2q")
+        self.word2id: Dict[bytes, int] = {}
+        label_names, label_counts = [], []
+        for i in range(size):
+            word = r.cstr()
+            count, kind = r.unpack("<qb")
+            if kind == 0:
+                self.word2id[word] = i
+            else:
+                label_names.append(word.decode("utf-8", "replace"))
+                label_counts.append(count)
+        self.pruneidx: Dict[int, int] = {}
+        if self.pruneidx_size > 0:
+            pairs = r.array("<i4", 2 * self.pruneidx_size).reshape(-1, 2)
+            self.pruneidx = {int(a): int(b) for a, b in pairs}
+        
+        quant_input, = r.unpack("<?")
+        self.input = r.matrix(quant_input)
+        quant_output, = r.unpack("<?")
+        output = r.matrix(quant_input and quant_output)
+        
+        wanted = set(labels) if labels is not None else None
+        rows = [i for i, name in enumerate(label_names)
+                if wanted is None or name.replace("__label__", "") in wanted]
+        self.labels = [label_names[i].replace("__label__", "") for i in rows]
+        if self.loss == _FT_LOSS_HS:
+            nodes, signs = self._hs_paths(label_counts, rows)
+            self._out_rows = output[nodes]
+            self._right, self._left = (signs > 0).astype(np.float32), (signs < 0).astype(np.float32)
+        else:
+            self._out_rows = output[rows]
+        self._word_ids = lru_cache(maxsize=200_000)(self._compute_word_ids)
+
+    @staticmethod
+    def _hs_paths(counts: List[int], rows: List[int]) -> Tuple[List[int], "np.ndarray"]:
+        """Inner nodes on each selected label's Huffman path and the sign of each step.
+        
+        Same tree as fastText's HierarchicalSoftmaxLoss::buildTree; returns the
+        union of path nodes (output rows) and a (labels x nodes) matrix holding
+        +1 for a right step, -1 for a left one and 0 off the path.
+        """
+        osz = len(counts)
+        parent = [-1] * (2 * osz - 1)
+        binary = [False] * (2 * osz - 1)
+        count = list(counts) + [10 ** 15] * (osz - 1)
+        leaf, node = osz - 1, osz
+        for i in range(osz, 2 * osz - 1):
+            mini = [0, 0]
+            for j in range(2):
+                if leaf >= 0 and count[leaf] < count[node]:
+                    mini[j], leaf = leaf, leaf - 1
+                else:
+                    mini[j], node = node, node + 1
+            count[i] = count[mini[0]] + count[mini[1]]
+            parent[mini[0]] = parent[mini[1]] = i
+            binary[mini[1]] = True
+        paths = []
+        for target in rows:
+            steps, cur = [], target
+            while parent[cur] != -1:
+                steps.append((parent[cur] - osz, binary[cur]))
+                cur = parent[cur]
+            paths.append(steps)
+        nodes = sorted({n for steps in paths for n, _ in steps})
+        col = {n: j for j, n in enumerate(nodes)}
+        signs = np.zeros((len(rows), len(nodes)), dtype=np.float32)
+        for i, steps in enumerate(paths):
+            for n, right in steps:
+                signs[i, col[n]] = 1.0 if right else -1.0
+        return nodes, signs
+
+    def _push_hash(self, out: List[int], h: int) -> None:
+        if self.pruneidx_size == 0:
+            return
+        if self.pruneidx_size > 0:
+            h = self.pruneidx.get(h, -1)
+            if h < 0:
+                return
+        out.append(self.nwords + h)
+
+    def _compute_word_ids(self, word: str) -> Tuple[Tuple[int, ...], int]:
+        """Input rows for one word and its 32-bit hash (for word n-grams)."""
+        raw = word.encode("utf-8")
+        wid = self.word2id.get(raw)
+        ids: List[int] = [] if wid is None else [wid]
+        if word != _FT_EOS and self.maxn > 0:
+            w = "<" + word + ">"
+            L = len(w)
+            for i in range(L):
+                for n in range(1, min(self.maxn, L - i) + 1):
+                    if n >= self.minn and not (n == 1 and (i == 0 or i + n == L)):
+                        self._push_hash(ids, fasttext_hash(w[i:i + n].encode("utf-8")) % self.bucket)
+        return tuple(ids), fasttext_hash(raw)
+
+    def _line_ids(self, text: str) -> List[int]:
+        ids: List[int] = []
+        hashes: List[int] = []
+        for word in [w for w in _FT_SPLIT.split(text) if w] + [_FT_EOS]:
+            row, h = self._word_ids(word)
+            ids.extend(row)
+            # int32 hash sign-extended to uint64, as in Dictionary::addWordNgrams
+            hashes.append(h | 0xFFFFFFFF00000000 if h & 0x80000000 else h)
+        for i in range(len(hashes)):
+            h = hashes[i]
+            for j in range(i + 1, min(len(hashes), i + self.word_ngrams)):
+                h = (h * 116049371 + hashes[j]) & _U64
+                self._push_hash(ids, h % self.bucket)
+        return ids
+
+    def hidden(self, texts: List[str]) -> "np.ndarray":
+        """Mean input row per text; a text with no input rows gets a zero row."""
+        per_text = [self._line_ids(t) for t in texts]
+        lengths = np.array([len(ids) for ids in per_text], dtype=np.int64)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        present = lengths > 0
+        if present.any():
+            rows = self.input[np.fromiter((i for ids in per_text for i in ids), dtype=np.int64)]
+            starts = (np.cumsum(lengths) - lengths)[present]
+            out[present] = np.add.reduceat(rows, starts, axis=0) / lengths[present][:, None]
+        return out
+
+    def predict_probs(self, texts: List[str]) -> "np.ndarray":
+        """Probabilities of ``self.labels`` (columns) for each text (rows)."""
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        scores = self.hidden(texts) @ self._out_rows.T
+        if self.loss == _FT_LOSS_HS:
+            # Sum of log(sigmoid(+-x) + 1e-5) along each label's path, like the C++ dfs
+            f = 1.0 / (1.0 + np.exp(-scores))
+            return np.exp(np.log(f + 1e-5) @ self._right.T + np.log(1.0 - f + 1e-5) @ self._left.T)
+        if self.loss == _FT_LOSS_OVA:
+            return 1.0 / (1.0 + np.exp(-scores))
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, text: str, k: int=1) -> Tuple[Tuple[str, ...], "np.ndarray"]:
+        """fasttext.FastText._FastText.predict for one line, over the label subset."""
+        probs = self.predict_probs([text])[0]
+        top = [j for j in np.argsort(-probs, kind="stable")[:k] if probs[j] >= _FT_MIN_PROB]
+        return tuple("__label__" + self.labels[j] for j in top), probs[top]
+
+# ------------------------------
+# Distilled token model
+# ------------------------------
+
+class DistilledTokenModel:
+    """Char n-gram linear model distilled from the ensemble's fused per-token distribution.
+
+    A token's features are the minn..maxn-grams of "<token.lower()>", hashed into
+    ``dim`` buckets with CRC-32 and averaged as in fastText's input layer; one
+    weight row per bucket gives logits over ``langs`` and a softmax the
+    distribution. The empty label "" holds the mass the ensemble left unassigned.
+    Trained and evaluated by benchmarks/lid_distill.py; stored as .npz.
+    """
+
+    def __init__(self, weights: "np.ndarray", bias: "np.ndarray", langs: List[str], minn: int=1, maxn: int=4):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.langs = list(langs)
+        self.dim = self.weights.shape[0]
+        self.minn, self.maxn = minn, maxn
+        self.features = lru_cache(maxsize=200_000)(self._features)
+
+    @classmethod
+    def load(cls, path: str) -> "DistilledTokenModel":
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["weights"], data["bias"], [str(l) for l in data["langs"]],
+                       int(data["minn"]), int(data["maxn"]))
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez_compressed(f, weights=self.weights.astype(np.float16), bias=self.bias,
+                                langs=np.array(self.langs), minn=self.minn, maxn=self.maxn)
+
+    def _features(self, token: str) -> Tuple[int, ...]:
+        w = "<" + token.lower() + ">"
+        return tuple(zlib.crc32(w[i:i + n].encode("utf-8")) % self.dim
+                     for n in range(self.minn, self.maxn + 1) for i in range(len(w) - n + 1))
+
+    def feature_batch(self, tokens: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Concatenated feature ids and the number of features per token."""
+        feats = [self.features(t) for t in tokens]
+        ids = np.fromiter((f for fs in feats for f in fs), dtype=np.int64)
+        return ids, np.array([len(fs) for fs in feats], dtype=np.int64)
+
+    def logits(self, tokens: List[str]) -> "np.ndarray":
+        ids, lengths = self.feature_batch(tokens)
+        out = np.zeros((len(tokens), len(self.langs)), dtype=np.float32)
+        present = lengths > 0
+        if present.any():
+            starts = (np.cumsum(lengths) - lengths)[present]
+            out[present] = np.add.reduceat(self.weights[ids], starts, axis=0) / lengths[present][:, None]
+        return out + self.bias
+
+    def predict_probs(self, tokens: List[str]) -> "np.ndarray":
+        """Distribution over ``langs`` (columns) for each token (rows)."""
+        z = self.logits(tokens)
+        z = np.exp(z - z.max(axis=1, keepdims=True))
+        return z / z.sum(axis=1, keepdims=True)
+
+# ------------------------------
+# Token lexicon
+# ------------------------------
+
+LEXICON_MAGIC = b"PLIDLEX1"
+
+def _align(pos: int, n: int) -> int:
+    return (pos + n - 1) // n * n
+
+def build_lexicon(path: str, entries: Iterable[Tuple[str, Dict[str,float]]], meta: Optional[Dict[str, object]]=None) -> int:
+    """Write a TokenLexicon file for (token, distribution) pairs; returns the entry count.
+
+    Layout: magic, u32 length + JSON header (langs, count, caller's meta),
+    u64 key offsets (count + 1), the UTF-8 keys in byte order, float16 rows
+    (count x langs). Written to a temporary file and renamed into place, so
+    processes that have the old file mapped keep reading it.
+    """
+    table = {tok.encode("utf-8"): dist for tok, dist in entries}
+    keys = sorted(table)
+    langs = sorted({lang for dist in table.values() for lang in dist})
+    col = {lang: j for j, lang in enumerate(langs)}
+    rows = np.zeros((len(keys), len(langs)), dtype="<f2")
+    for i, key in enumerate(keys):
+        for lang, p in table[key].items():
+            rows[i, col[lang]] = p
+    offsets = np.zeros(len(keys) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(k) for k in keys])
+    header = json.dumps({**(meta or {}), "langs": langs, "count": len(keys)}).encode("utf-8")
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(LEXICON_MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(b"\0" * (_align(f.tell(), 8) - f.tell()))
+        f.write(offsets.tobytes())
+        f.write(b"".join(keys))
+        f.write(b"\0" * (_align(f.tell(), 2) - f.tell()))
+        f.write(rows.tobytes())
+    os.replace(tmp, path)
+    return len(keys)
+
+class TokenLexicon:
+    """Read-only token -> distribution table, memory-mapped from a build_lexicon file.
+
+    Lookups binary-search the sorted keys in place; nothing is copied into the
+    process, so every worker mapping the same file shares one page-cache copy.
+    """
+
+    def __init__(self, path: str):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = struct.unpack_from("<8sI", self._mm, 0)
+        if magic != LEXICON_MAGIC:
+            raise ValueError(f"{path} is not a token lexicon")
+        self.meta = json.loads(self._mm[12:12 + header_len].decode("utf-8"))
+        self.langs: List[str] = self.meta["langs"]
+        n = self.meta["count"]
+        pos = _align(12 + header_len, 8)
+        # A memoryview cast indexes to plain ints, which keeps the search loop cheap
+        # (native byte order: the file is little-endian, like every host we run on)
+        self._offsets = memoryview(self._mm)[pos:pos + 8 * (n + 1)].cast("Q")
+        self._keys_at = pos + 8 * (n + 1)
+        rows_at = _align(self._keys_at + self._offsets[n], 2)
+        self._rows = np.frombuffer(self._mm, dtype="<f2", count=n * len(self.langs), offset=rows_at).reshape(n, len(self.langs))
+        self.path = path
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _key(self, i: int) -> bytes:
+        return self._mm[self._keys_at + self._offsets[i]:self._keys_at + self._offsets[i + 1]]
+
+    def find(self, token: str) -> int:
+        """Row index of ``token``, or -1."""
+        key = token.encode("utf-8")
+        lo, hi = 0, len(self._rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self._rows) and self._key(lo) == key else -1
+
+    def get(self, token: str) -> Optional[Dict[str,float]]:
+        """The stored distribution (possibly empty), or None when ``token`` is not listed."""
+        i = self.find(token)
+        if i < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {self.langs[j]: p for j, p in enumerate(self._rows[i].tolist()) if p > 0}
+
 # ------------------------------
 # Model Manager (from b.py)
 # ------------------------------
 
 class ModelManager:
-    def __init__(self, enable_transformer: bool=True, fasttext_path: str=FASTTEXT_PATH_DEFAULT):
+    def __init__(self, enable_transformer: bool=True, fasttext_path: str=FASTTEXT_PATH_DEFAULT,
+                 defer_transformer: bool=False):
         self.transformer = None
+        # "pending"/"loading" (deferred, see load_transformer), "loaded", "failed",
+        # "disabled" (by the caller or the token backend) or "unavailable" (not installed)
+        self.transformer_state = "disabled"
+        self.transformer_load_seconds = 0.0
+        self._transformer_lock = threading.Lock()
+        # Set only on the direct-logits path; the pipeline path leaves these empty
+        self.transformer_backend: Optional[str] = None
+        self.transformer_langs: List[str] = []
+        self._transformer_cols = None
         self.fasttext = None
+        self.fasttext_path: Optional[str] = None
         self._ft_cache: Dict[Tuple[str, Optional[str]], Dict[str,float]] = {}
+        # Plain counters read by the metrics endpoint; no locking on the hot path
+        self.ft_cache_hits = 0
+        self.ft_cache_misses = 0
+        self.batch_sizes: Dict[str, Counter] = {'transformer': Counter(), 'fasttext': Counter()}
+        self.transformer_tokens = 0
+        self.transformer_seconds = 0.0
+        self.cascade_tokens = 0
+        self.cascade_transformer_tokens = 0
+        # "fast" tier: distilled model instead of the fused ensemble
+        self.distilled: Optional[DistilledTokenModel] = None
+        self._fast_cache: Dict[str, Dict[str,float]] = {}
+        self.fast_cache_hits = 0
+        self.fast_cache_misses = 0
+        # In use (lexicon) only while the loaded models match its build (see _attach_lexicon)
+        self.lexicon: Optional[TokenLexicon] = None
+        self._lexicon_file: Optional[TokenLexicon] = None
         
-        self.enable_transformer = enable_transformer and (pipeline is not None)
-        if self.enable_transformer and pipeline is not None:
+        if LEXICON_PATH and os.path.exists(LEXICON_PATH) and np is not None:
             try:
-                device = 0 if (_torch_available and _torch_cuda) else -1
-                if _torch_available and _torch_cuda and TRANSFORMER_FP16:
-                    import torch as _torch_mod
-                    self.transformer = pipeline("text-classification", model=TRANSFORMER_MODEL, device=device, return_all_scores=True, torch_dtype=_torch_mod.float16)
-                else:
-                    self.transformer = pipeline("text-classification", model=TRANSFORMER_MODEL, device=device, return_all_scores=True)
-                logger.info("Transformer loaded")
+                self._lexicon_file = TokenLexicon(LEXICON_PATH)
             except Exception as e:
-                logger.warning(f"Transformer load failed: {e}")
-                self.transformer = None
-                self.enable_transformer = False
-
-        if fasttext is not None:
+                logger.warning(f"Token lexicon load failed: {e}")
+        
+        if TOKEN_BACKEND == "fast":
+            try:
+                self.distilled = DistilledTokenModel.load(DISTILLED_PATH)
+                logger.info(f"Distilled token model loaded: {DISTILLED_PATH}")
+            except Exception as e:
+                logger.warning(f"Distilled token model load failed, using the ensemble: {e}")
+        
+        self.batch_size = TRANSFORMER_BATCH_SIZE
+        self.enable_transformer = enable_transformer and ('transformers' not in missing) and self.distilled is None
+        if self.enable_transformer:
+            self.transformer_state = "pending"
+        elif enable_transformer and self.distilled is None:
+            self.transformer_state = "unavailable"
+        if not defer_transformer:
+            self.load_transformer()
+        
+        engine = FASTTEXT_ENGINE
+        if engine == "auto":
+            engine = "fasttext" if 'fasttext' not in missing else "numpy"
+        fasttext = _fasttext() if engine == "fasttext" else None
+        if (engine == "fasttext" and fasttext is not None) or (engine == "numpy" and np is not None):
+            load = fasttext.load_model if engine == "fasttext" else (lambda path: NumpyFastText(path, TOP_20_LANGS))
             try:
                 if os.path.exists(fasttext_path):
-                    self.fasttext = fasttext.load_model(fasttext_path)
-                    logger.info(f"fastText model loaded: {fasttext_path}")
+                    self.fasttext, self.fasttext_path = load(fasttext_path), fasttext_path
+                    logger.info(f"fastText model loaded ({engine}): {fasttext_path}")
                 elif FASTTEXT_FALLBACK_PATH and os.path.exists(FASTTEXT_FALLBACK_PATH):
-                    self.fasttext = fasttext.load_model(FASTTEXT_FALLBACK_PATH)
-                    logger.info(f"fastText fallback loaded: {FASTTEXT_FALLBACK_PATH}")
+                    self.fasttext, self.fasttext_path = load(FASTTEXT_FALLBACK_PATH), FASTTEXT_FALLBACK_PATH
+                    logger.info(f"fastText fallback loaded ({engine}): {FASTTEXT_FALLBACK_PATH}")
                 else:
                     logger.warning(f"fastText model not found: {fasttext_path}")
             except Exception as e:
                 logger.warning(f"fastText load failed: {e}")
+        self._attach_lexicon()
+
+    def _lexicon_mismatch(self, lexicon: TokenLexicon) -> List[str]:
+        """Where the lexicon's build meta (benchmarks/lid_lexicon.py) differs from the loaded models."""
+        loaded = {
+            'transformer': TRANSFORMER_MODEL if self.transformer is not None else None,
+            'transformer_backend': self.transformer_backend,
+            'fasttext': os.path.basename(self.fasttext_path) if self.fasttext is not None and self.fasttext_path else None,
+            'token_backend': 'fast' if self.distilled is not None else 'ensemble',
+        }
+        built = {key: lexicon.meta.get(key) for key in loaded}
+        if built['fasttext']:
+            built['fasttext'] = os.path.basename(str(built['fasttext']))
+        return [f"{key} {built[key]!r} (loaded: {value!r})" for key, value in loaded.items() if built[key] != value]
+
+    def _attach_lexicon(self) -> None:
+        # Stored distributions are only valid for the models that produced them: a
+        # lexicon built with the transformer stays unused while it is still loading
+        # (degraded mode) or failed, and is picked up once it loads
+        lexicon = self._lexicon_file
+        if lexicon is None:
+            return
+        diff = self._lexicon_mismatch(lexicon)
+        if not diff:
+            if self.lexicon is None:
+                logger.info(f"Token lexicon mapped: {lexicon.path} ({len(lexicon)} tokens)")
+            self.lexicon = lexicon
+            return
+        self.lexicon = None
+        if self.transformer_state in ("pending", "loading"):
+            logger.info(f"Token lexicon {lexicon.path} unused until the transformer loads")
+        else:
+            logger.warning(f"Token lexicon {lexicon.path} not used, built for other models: {'; '.join(diff)}")
+
+    def load_transformer(self) -> bool:
+        """Load the transformer unless that was already tried; True if it is in use.
+        
+        May run on a background thread while other threads score: everything the
+        scoring paths read is set before ``self.transformer``, which they check first.
+        """
+        with self._transformer_lock:
+            if self.transformer_state != "pending":
+                return self.transformer is not None
+            self.transformer_state = "loading"
+            started = time.perf_counter()
+            
+            if TRANSFORMER_DIRECT and np is not None:
+                try:
+                    self._load_transformer_direct(TRANSFORMER_MODEL)
+                    logger.info(f"Transformer loaded (direct logits, {TRANSFORMER_BACKEND})")
+                except Exception as e:
+                    logger.warning(f"Direct transformer load failed, falling back to pipeline: {e}")
+                    self.transformer = self.transformer_backend = None
+            
+            pipeline = _pipeline() if self.transformer is None else None
+            if pipeline is not None:
+                try:
+                    device = 0 if _torch_cuda() else -1
+                    if _torch_cuda() and TRANSFORMER_FP16:
+                        clf = pipeline("text-classification", model=TRANSFORMER_MODEL, device=device, return_all_scores=True, torch_dtype=_torch().float16)
+                    else:
+                        clf = pipeline("text-classification", model=TRANSFORMER_MODEL, device=device, return_all_scores=True)
+                    if _torch_cuda():
+                        self.batch_size = TRANSFORMER_BATCH_SIZE_CUDA
+                    self.transformer = clf
+                    logger.info("Transformer loaded")
+                except Exception as e:
+                    logger.warning(f"Transformer load failed: {e}")
+                    self.transformer = None
+            
+            if self.transformer is None:
+                self.enable_transformer = False
+            self.transformer_state = "loaded" if self.transformer is not None else "failed"
+            self.transformer_load_seconds = time.perf_counter() - started
+            return self.transformer is not None
+
+    def _load_transformer_direct(self, model_name: str) -> None:
+        if TRANSFORMER_BACKEND == "torch":
+            clf = TorchClassifier(model_name)
+        elif TRANSFORMER_BACKEND in ("onnx", "onnx-int8"):
+            clf = OnnxClassifier(model_name, quantize=TRANSFORMER_BACKEND == "onnx-int8")
+        else:
+            raise ValueError(f"unknown transformer backend: {TRANSFORMER_BACKEND}")
+        
+        self._transformer_cols, self.transformer_langs = label_columns(clf.id2label)
+        if not self.transformer_langs:
+            raise ValueError(f"{model_name} has no labels among the supported languages")
+        if TRANSFORMER_BACKEND == "torch" and _torch_cuda():
+            self.batch_size = TRANSFORMER_BATCH_SIZE_CUDA
+        self.transformer_backend = TRANSFORMER_BACKEND
+        self.transformer = clf
+
+    def transformer_probs_array(self, tokens: List[str], max_length: int=TRANSFORMER_MAX_LENGTH) -> "np.ndarray":
+        """Probabilities over ``transformer_langs`` (columns) for each token (rows).
+        
+        Direct-logits path only: the softmax runs over the supported languages'
+        logit columns in one array op, which equals the pipeline's all-label
+        softmax renormalised over the same languages. Rows of a failed batch are zero.
+        """
+        out = np.zeros((len(tokens), len(self.transformer_langs)), dtype=np.float32)
+        if self.transformer_backend is None or not tokens:
+            return out
+        
+        bs = self.batch_size
+        started = time.perf_counter()
+        for i in range(0, len(tokens), bs):
+            batch = tokens[i:i+bs]
+            self.batch_sizes['transformer'][len(batch)] += 1
+            try:
+                out[i:i+len(batch)] = softmax_columns(self.transformer.logits(batch, max_length), self._transformer_cols)
+            except Exception as e:
+                logger.debug(f"transformer batch failed: {e}")
+        
+        self.transformer_seconds += time.perf_counter() - started
+        self.transformer_tokens += len(tokens)
+        return out
 
-    def transformer_probs(self, tokens: List[str]) -> List[Dict[str,float]]:
+    def transformer_probs(self, tokens: List[str], max_length: int=TRANSFORMER_MAX_LENGTH) -> List[Dict[str,float]]:
         if not self.transformer or not tokens:
             return [{} for _ in tokens]
         
+        if self.transformer_backend is not None:
+            langs = self.transformer_langs
+            return [dict(zip(langs, row)) if any(row) else {}
+                    for row in self.transformer_probs_array(tokens, max_length).tolist()]
+        
         results: List[Dict[str,float]] = []
-        bs = TRANSFORMER_BATCH_SIZE
+        bs = self.batch_size
+        started = time.perf_counter()
         
         for i in range(0, len(tokens), bs):
             batch = tokens[i:i+bs]
+            self.batch_sizes['transformer'][len(batch)] += 1
             try:
-                if _torch_available and _torch_cuda:
-                    torch_mod = __import__('torch')
-                    with torch_mod.inference_mode():
+                if _torch_cuda():
+                    with _torch().inference_mode():
                         outs = self.transformer(batch)
                 else:
                     outs = self.transformer(batch)
@@ -753,27 +1552,65 @@ class ModelManager:
                 
                 results.append(dist)
         
+        self.transformer_seconds += time.perf_counter() - started
+        self.transformer_tokens += len(tokens)
         return results
 
+    def transformer_seconds_per_token(self) -> float:
+        return (self.transformer_seconds / self.transformer_tokens) if self.transformer_tokens else 0.0
+
+    def distilled_probs(self, tokens: List[str]) -> List[Dict[str,float]]:
+        """Per-token distributions from the distilled model, thresholded like the fused ones."""
+        missed = [t for t in tokens if t not in self._fast_cache]
+        self.fast_cache_hits += len(tokens) - len(missed)
+        self.fast_cache_misses += len(missed)
+        pending = list(dict.fromkeys(missed))
+        if pending:
+            langs = self.distilled.langs
+            probs = self.distilled.predict_probs(pending)
+            # Top few only: DP cost grows with the square of the candidate count
+            ranked = np.argsort(-probs, axis=1, kind="stable")[:, :DISTILLED_TOP_K + 1]
+            for tok, row, order in zip(pending, probs, ranked):
+                self._fast_cache[tok] = {langs[j]: float(row[j]) for j in order
+                                         if langs[j] and row[j] >= CANDIDATE_KEEP_THRESHOLD}
+        # Copies: later stages edit distributions in place
+        return [dict(self._fast_cache[t]) for t in tokens]
+
+    def fasttext_document_probs(self, text: str) -> Dict[str,float]:
+        """Raw fastText probabilities for a whole document, top-20 languages only (not renormalised)."""
+        if not self.fasttext or not text:
+            return {}
+        try:
+            labels, probs = self.fasttext.predict(text.replace("\n", " "), k=FASTTEXT_TOP_K)
+        except Exception:
+            return {}
+        
+        dist: Dict[str,float] = {}
+        for lab, pr in zip(labels, probs):
+            lang = lab.replace("__label__","")
+            if lang in TOP_20_LANGS:
+                dist[lang] = float(pr)
+        return dist
+
     def fasttext_probs_batch(self, tokens: List[str]) -> List[Dict[str,float]]:
         if not self.fasttext or not tokens:
             return [{} for _ in tokens]
         
-        results: List[Dict[str,float]] = []
+        self.batch_sizes['fasttext'][len(tokens)] += 1
+        if isinstance(self.fasttext, NumpyFastText):
+            return self._numpy_fasttext_probs(tokens)
         
+        results: List[Dict[str,float]] = []
         for token in tokens:
             key = (token, dominant_script(token))
             if key in self._ft_cache:
+                self.ft_cache_hits += 1
                 results.append(self._ft_cache[key])
                 continue
             
+            self.ft_cache_misses += 1
             try:
-                k = FASTTEXT_TOP_K_SHORT if len(token) <= SHORT_TOKEN_MAX_LEN else FASTTEXT_TOP_K
-                sc = dominant_script(token)
-                if sc and sc.upper() in ['DEVANAGARI','BENGALI','THAI','HAN','HIRAGANA','KATAKANA']:
-                    k = min(k+3, 10)
-                
-                labels, probs = self.fasttext.predict(token, k=k)
+                labels, probs = self.fasttext.predict(token, k=self._fasttext_k(token, key[1]))
                 dist: Dict[str,float] = {}
                 total = 0.0
                 
@@ -795,16 +1632,533 @@ class ModelManager:
         
         return results
 
+    @staticmethod
+    def _fasttext_k(token: str, sc: Optional[str]) -> int:
+        k = FASTTEXT_TOP_K_SHORT if len(token) <= SHORT_TOKEN_MAX_LEN else FASTTEXT_TOP_K
+        if sc and sc.upper() in ['DEVANAGARI','BENGALI','THAI','HAN','HIRAGANA','KATAKANA']:
+            k = min(k+3, 10)
+        return k
+
+    def _numpy_fasttext_probs(self, tokens: List[str]) -> List[Dict[str,float]]:
+        """fasttext_probs_batch for NumpyFastText: cache misses are scored in one
+        vectorised call. The top k is taken among the supported languages rather
+        than among all model labels, then renormalised as before."""
+        keys = [(token, dominant_script(token)) for token in tokens]
+        results: List[Optional[Dict[str,float]]] = [self._ft_cache.get(key) for key in keys]
+        # Distinct missing keys -> positions, so repeats in the batch are scored once
+        pending: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        for i, r in enumerate(results):
+            if r is None:
+                pending.setdefault(keys[i], []).append(i)
+        # Counted per position, like the other caches: a repeat of a missing token misses too
+        missed = sum(len(positions) for positions in pending.values())
+        self.ft_cache_hits += len(tokens) - missed
+        self.ft_cache_misses += missed
+        if not pending:
+            return results
+        
+        try:
+            probs = self.fasttext.predict_probs([token for token, _ in pending])
+        except Exception:
+            return [r if r is not None else {} for r in results]
+        labels = self.fasttext.labels
+        ranked = np.argsort(-probs, axis=1, kind="stable")
+        for (key, positions), row, order in zip(pending.items(), probs, ranked):
+            top = [j for j in order[:self._fasttext_k(*key)] if row[j] >= _FT_MIN_PROB]
+            total = float(row[top].sum())
+            dist = {labels[j]: float(row[j]) / total for j in top} if total > 0 else {}
+            self._ft_cache[key] = dist
+            for i in positions:
+                results[i] = dist
+        return results
+
+# ------------------------------
+# Stage instrumentation
+# ------------------------------
+
+# Optional per-context receiver of stage timings: any object with
+# record(stage, seconds) and count(name, n). Unset (the default) costs one
+# None check per stage.
+_stage_sink: contextvars.ContextVar = contextvars.ContextVar("polylangid_stage_sink", default=None)
+
+def set_stage_sink(sink) -> contextvars.Token:
+    return _stage_sink.set(sink)
+
+def get_stage_sink():
+    return _stage_sink.get()
+
+def reset_stage_sink(token: contextvars.Token) -> None:
+    _stage_sink.reset(token)
+
+def _lap(sink, stage: str, t0: float) -> float:
+    sink.record(stage, time.perf_counter() - t0)
+    # Restart the clock after record() so sink overhead isn't charged to the next stage
+    return time.perf_counter()
+
+# Stage names in pipeline order, for reports
+PIPELINE_STAGES = (
+    'tokenize', 'script_census', 'doc_classify', 'prefuse', 'inference', 'fallback', 'unknown_injection', 'disambiguate',
+    'dp', 'sentence_guess', 'fill_unknowns', 'latin_consolidation', 'span_merge',
+)
+
+class StageProfiler:
+    """Stage sink that aggregates wall time and call counts over many documents."""
+
+    def __init__(self, root: str="detect_languages"):
+        self.root = root
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Counter = Counter()
+        self.counts: Counter = Counter()
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def count(self, name: str, n: int=1) -> None:
+        self.counts[name] += n
+
+    def _ordered(self) -> List[str]:
+        known = [s for s in PIPELINE_STAGES if s in self.calls]
+        return known + sorted(s for s in self.calls if s not in PIPELINE_STAGES)
+
+    def as_dict(self) -> Dict[str, object]:
+        total = sum(self.seconds.values())
+        docs = self.counts.get('documents', 0)
+        return {
+            'documents': docs,
+            'tokens': self.counts.get('tokens', 0),
+            'total_seconds': total,
+            'stages': {
+                stage: {
+                    'seconds': self.seconds[stage],
+                    'calls': self.calls[stage],
+                    'mean_ms': self.seconds[stage] / self.calls[stage] * 1000.0,
+                    'per_doc_ms': (self.seconds[stage] / docs * 1000.0) if docs else 0.0,
+                    'share': (self.seconds[stage] / total) if total else 0.0,
+                }
+                for stage in self._ordered()
+            },
+        }
+
+    def collapsed_stacks(self) -> str:
+        """Brendan Gregg's folded format (``root;stage microseconds``) for flamegraph.pl / speedscope."""
+        return "".join(f"{self.root};{stage} {int(round(self.seconds[stage] * 1e6))}\n"
+                       for stage in self._ordered())
+
+    def dump(self, path: str, fmt: Optional[str]=None) -> None:
+        """Write the profile as JSON, or as folded stacks when ``fmt`` (or the suffix) says so."""
+        fmt = fmt or ("collapsed" if path.endswith((".folded", ".collapsed", ".txt")) else "json")
+        with open(path, "w", encoding="utf-8") as f:
+            if fmt == "collapsed":
+                f.write(self.collapsed_stacks())
+            else:
+                json.dump(self.as_dict(), f, indent=2)
+
+@contextmanager
+def profile_stages(profiler: Optional[StageProfiler]=None) -> Iterator[StageProfiler]:
+    """Profile every detection run in this context::
+
+        with profile_stages() as prof:
+            for text in texts:
+                detect_languages(text)
+        prof.dump("profile.json")
+
+    Document cache hits skip the pipeline and are not counted.
+    """
+    profiler = profiler if profiler is not None else StageProfiler()
+    token = set_stage_sink(profiler)
+    try:
+        yield profiler
+    finally:
+        reset_stage_sink(token)
+
+# ------------------------------
+# Document result cache
+# ------------------------------
+
+class DocumentCache:
+    """LRU cache of detect_languages results keyed by a hash of the NFC text.
+
+    Bounded by entry count and by an estimate of the memory held by the cached
+    segments; entries optionally expire after ``ttl`` seconds. ``invalidate()``
+    bumps a generation number so results computed against the old models are
+    never written back after a reload.
+    """
+
+    def __init__(self, max_entries: int=DOC_CACHE_MAX_ENTRIES, max_bytes: int=DOC_CACHE_MAX_BYTES,
+                 ttl: float=DOC_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[bytes, Tuple[float, int, Tuple[ScoredSegment, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        norm = unicodedata.normalize('NFC', text)
+        return hashlib.blake2b(norm.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    @staticmethod
+    def _entry_size(result: Tuple[ScoredSegment, ...]) -> int:
+        # Key + tuple overhead plus the segment strings and two floats; language codes are interned.
+        return 128 + sum(sys.getsizeof(seg) + 112 for seg, *_ in result)
+
+    def get(self, key: bytes) -> Optional[Tuple[ScoredSegment, ...]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, result = entry
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                self.bytes -= size
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: bytes, result: List[ScoredSegment], generation: Optional[int]=None) -> None:
+        value = tuple(result)
+        size = self._entry_size(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (expires, size, value)
+            self.bytes += size
+            while self._data and (len(self._data) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, old_size, _) = self._data.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self.bytes = 0
+
+    def snapshot(self, limit: int) -> List[Tuple[bytes, Tuple[ScoredSegment, ...]]]:
+        """Up to ``limit`` live entries, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._data.items())[-limit:] if limit > 0 else []
+        return [(key, result) for key, (expires, _, result) in items if not expires or expires >= now]
+
+    def restore(self, items: Iterable[Tuple[bytes, List[ScoredSegment]]]) -> int:
+        count = 0
+        for key, result in items:
+            self.put(key, result)
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / total) if total else 0.0,
+        }
+
+# ------------------------------
+# Shared token cache
+# ------------------------------
+
+try:
+    import fcntl
+except ImportError:  # Windows: no POSIX record locks, no shared cache
+    fcntl = None
+
+class SharedTokenCache:
+    """Token -> distribution cache in a memory-mapped file shared by every process on the host.
+
+    Fixed-size records in a set-associative table: a 64-bit hash of the token
+    picks a set of ``ways`` slots. Reads take no lock; every record carries a
+    CRC-32, so one torn by a concurrent write reads as a miss. Writers hold one of
+    SHARED_CACHE_STRIPES stripe locks (a thread lock plus a POSIX record lock on
+    the file) and replace the oldest record of the set, which bounds the table at
+    its slot count. Distributions keep their top 8 languages, as float32.
+    Every process with the table open holds a shared lock on its last header
+    byte, so a new table only removes older ones that no process still uses.
+    Tables on one path share the descriptor and the mapping (which holds a
+    descriptor of its own) within a process, as closing any descriptor of a file
+    drops all of the process's POSIX locks on it; close() releases them with the
+    last of those tables.
+    """
+
+    MAGIC = b"PLIDSHC1"
+    HEADER_SIZE = 4096
+    _HEADER = struct.Struct("<8sIII")
+    # key hash, write time, count, language indexes, probabilities | CRC-32: 64 bytes
+    _BODY = struct.Struct("<QIB8s8f7x")
+    RECORD_SIZE = _BODY.size + 4
+    _LIVE_BYTE = HEADER_SIZE - 1
+    # path -> [fd, mapping, stripe locks, open tables] for the tables open in this process
+    # (POSIX locks never conflict within one process, so the thread locks must be shared)
+    _files: Dict[str, list] = {}
+    _files_lock = threading.Lock()
+
+    def __init__(self, path: str, fingerprint: str, slots: int=1 << 18, ways: int=4,
+                 langs: Iterable[str]=TOP_20_LANGS):
+        if fcntl is None:
+            raise RuntimeError("the shared token cache needs POSIX file locks")
+        self.langs = sorted(langs)
+        self._lang_index = {lang: i for i, lang in enumerate(self.langs)}
+        self.ways = ways
+        self.sets = max(1, slots // ways)
+        table = hashlib.sha256(json.dumps([fingerprint, self.sets, ways, self.RECORD_SIZE, self.langs]).encode("utf-8"))
+        # One file per detector configuration: a new deploy starts a fresh table
+        # instead of reading (or truncating) one that old processes still map
+        self.path = f"{path}.{table.hexdigest()[:16]}"
+        size = self.HEADER_SIZE + self.sets * ways * self.RECORD_SIZE
+        
+        with SharedTokenCache._files_lock:
+            entry = SharedTokenCache._files.get(self.path)
+            if entry is None:
+                fd = self._open_file(path, size)
+                entry = [fd, mmap.mmap(fd, size), [threading.Lock() for _ in range(SHARED_CACHE_STRIPES)], 0]
+                SharedTokenCache._files[self.path] = entry
+            entry[3] += 1
+        self._fd, self._locks = entry[0], entry[2]
+        self._mm: Optional[mmap.mmap] = entry[1]
+        self.hits = self.misses = self.stores = 0
+
+    def _open_file(self, base: str, size: int) -> int:
+        """Open (creating or resetting if needed) the table file and take its live lock."""
+        header = self._HEADER.pack(self.MAGIC, self.sets, self.ways, self.RECORD_SIZE)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Creation and clear() lock the stripe bytes, leaving the live byte alone
+            fcntl.lockf(fd, fcntl.LOCK_EX, SHARED_CACHE_STRIPES, 0)
+            try:
+                if os.fstat(fd).st_size != size or os.pread(fd, len(header), 0) != header:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, header, 0)
+                    self._remove_stale(base, os.fstat(fd).st_mtime)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, SHARED_CACHE_STRIPES, 0)
+            fcntl.lockf(fd, fcntl.LOCK_SH, 1, self._LIVE_BYTE)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def close(self) -> None:
+        """Let go of the table; the last table on its path in this process also unmaps
+        it and closes the file, which releases the live lock. Idempotent. Lookups on
+        a closed table miss and stores to it are dropped, so requests still holding
+        it finish."""
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            if self._mm is None:
+                return
+            self._mm = None
+            with SharedTokenCache._files_lock:
+                entry = SharedTokenCache._files[self.path]
+                entry[3] -= 1
+                if entry[3] == 0:
+                    del SharedTokenCache._files[self.path]
+                    entry[1].close()
+                    os.close(self._fd)
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def _remove_stale(self, base: str, created: float) -> None:
+        # Workers of one deploy can run different configurations side by side
+        # (degraded and full while the transformer loads), so only tables older
+        # than this one whose header no process has locked are unlinked
+        folder, prefix = os.path.split(base)
+        mine = set(SharedTokenCache._files)
+        for name in os.listdir(folder or "."):
+            other = os.path.join(folder, name)
+            if (not name.startswith(os.path.basename(prefix) + ".") or other == self.path
+                    or other in mine or name.endswith(".tmp")):
+                continue
+            try:
+                fd = os.open(other, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                if os.fstat(fd).st_mtime > created:
+                    continue
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, self.HEADER_SIZE, 0)
+                os.unlink(other)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _hash(token: str) -> int:
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+        return h or 1  # 0 marks an empty slot
+
+    def _set_offset(self, h: int) -> int:
+        return self.HEADER_SIZE + (h % self.sets) * self.ways * self.RECORD_SIZE
+
+    def get(self, token: str) -> Optional[Dict[str,float]]:
+        h = self._hash(token)
+        base = self._set_offset(h)
+        mm = self._mm
+        try:
+            block = mm[base:base + self.ways * self.RECORD_SIZE]
+        except (TypeError, ValueError):  # closed meanwhile
+            return None
+        body = self._BODY.size
+        for off in range(0, len(block), self.RECORD_SIZE):
+            if int.from_bytes(block[off:off + 8], "little") != h:
+                continue
+            if zlib.crc32(block[off:off + body]) != int.from_bytes(block[off + body:off + self.RECORD_SIZE], "little"):
+                return None
+            _, _, n, idx, *probs = self._BODY.unpack_from(block, off)
+            return {self.langs[idx[i]]: probs[i] for i in range(n)}
+        return None
+
+    def lookup(self, tokens: List[str]) -> List[Optional[Dict[str,float]]]:
+        """get() for each token, counted in the hit/miss statistics."""
+        found = [self.get(t) for t in tokens]
+        hits = sum(1 for d in found if d is not None)
+        self.hits += hits
+        self.misses += len(found) - hits
+        return found
+
+    def put(self, token: str, dist: Dict[str,float]) -> bool:
+        top = sorted(dist.items(), key=lambda kv: -kv[1])[:8]
+        if any(lang not in self._lang_index for lang, _ in top):
+            return False
+        h = self._hash(token)
+        idx = bytes(self._lang_index[lang] for lang, _ in top).ljust(8, b"\0")
+        probs = [p for _, p in top] + [0.0] * (8 - len(top))
+        body = self._BODY.pack(h, int(time.time()) & 0xFFFFFFFF, len(top), idx, *probs)
+        record = body + zlib.crc32(body).to_bytes(4, "little")
+        
+        base = self._set_offset(h)
+        stripe = (h % self.sets) % SHARED_CACHE_STRIPES
+        with self._locks[stripe]:
+            if self._mm is None:
+                return False
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                slot, oldest = 0, None
+                for i in range(self.ways):
+                    off = base + i * self.RECORD_SIZE
+                    key, stamp = struct.unpack_from("<QI", self._mm, off)
+                    if key == h or key == 0:
+                        slot = i
+                        break
+                    if oldest is None or stamp < oldest:
+                        slot, oldest = i, stamp
+                off = base + slot * self.RECORD_SIZE
+                self._mm[off:off + self.RECORD_SIZE] = record
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        self.stores += 1
+        return True
+
+    def clear(self) -> None:
+        """Empty the table for every process using it."""
+        if self._mm is None:
+            return
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, SHARED_CACHE_STRIPES, 0)
+        try:
+            self._mm[self.HEADER_SIZE:] = bytes(len(self._mm) - self.HEADER_SIZE)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, SHARED_CACHE_STRIPES, 0)
+
+    def __len__(self) -> int:
+        """Occupied records, from a scan of the key column (0 without numpy)."""
+        if np is None or self._mm is None:
+            return 0
+        keys = np.frombuffer(self._mm, dtype=np.uint64, offset=self.HEADER_SIZE)[::self.RECORD_SIZE // 8]
+        return int(np.count_nonzero(keys))
+
+    def stats(self) -> Dict[str, object]:
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'entries': len(self),
+                'slots': self.sets * self.ways, 'path': self.path}
+
+# ------------------------------
+# Span merging
+# ------------------------------
+
+class _SpanBuilder:
+    """Joins runs of same-language, same-script tokens into segments, handing each
+    segment back as soon as the next token closes it. A segment's confidence is the
+    length-weighted mean of its tokens' and its margin the weakest token's."""
+
+    def __init__(self):
+        self.lang: Optional[str] = None
+        self.buf: List[str] = []
+        self.weight = self.conf_sum = 0.0
+        self.margin = 1.0
+
+    def add(self, tok: str, lang: str, conf: float, margin: float) -> Optional[ScoredSegment]:
+        out = None
+        if self.lang is None:
+            self.lang, self.buf = lang, [tok]
+        else:
+            tok_script = dominant_script(tok)
+            prev_script = dominant_script(self.buf[-1])
+            if lang == self.lang and (not tok_script or not prev_script or tok_script == prev_script):
+                self.buf.append(tok)
+            else:
+                out = self._segment()
+                self.lang, self.buf = lang, [tok]
+                self.weight = self.conf_sum = 0.0
+                self.margin = 1.0
+        w = len(tok)
+        self.weight += w
+        self.conf_sum += conf * w
+        self.margin = min(self.margin, margin)
+        return out
+
+    def close(self) -> Optional[ScoredSegment]:
+        return self._segment() if self.buf and self.lang is not None else None
+
+    def _segment(self) -> Optional[ScoredSegment]:
+        seg = " ".join(self.buf).strip()
+        if not seg:
+            return None
+        return (seg, self.lang, round(self.conf_sum / self.weight, 4), round(self.margin, 4))
+
 # ------------------------------
 # Enhanced Core Detector
 # ------------------------------
 
 class EnhancedDetector:
-    def __init__(self, enable_transformer: bool=True, fasttext_path: str=FASTTEXT_PATH_DEFAULT):
-        self.model_mgr = ModelManager(enable_transformer, fasttext_path)
+    def __init__(self, enable_transformer: bool=True, fasttext_path: str=FASTTEXT_PATH_DEFAULT,
+                 defer_transformer: bool=False):
+        # defer_transformer: serve in "degraded" mode until load_transformer() runs
+        self.model_mgr = ModelManager(enable_transformer, fasttext_path, defer_transformer)
+        # The tunables this detector was built under (see reload_detector)
+        self.tunables: Dict[str, object] = current_tunables()
+        self.retired = False
+        self._retire_lock = threading.Lock()
         self._token_cache: Dict[str, Dict[str,float]] = {}
+        self.doc_cache: Optional[DocumentCache] = DocumentCache() if DOC_CACHE_MAX_ENTRIES > 0 else None
+        self.shared_cache: Optional[SharedTokenCache] = self._open_shared_cache()
+        # Per instance, so a replaced detector's entries (and models) go with it
+        self._pre_fuse_token = lru_cache(maxsize=8192)(self._compute_pre_fuse_token)
         
         self.debug_counters = {
+            'script_fast_path': 0,
+            'doc_fast_path': 0,
             'id_boost': 0,
             'ja_han_force': 0,
             'problematic_word_fix': 0,
@@ -877,8 +2231,7 @@ class EnhancedDetector:
         
         return {k:v for k,v in fused.items() if v >= CANDIDATE_KEEP_THRESHOLD}
 
-    @lru_cache(maxsize=8192)
-    def _pre_fuse_token(self, token: str) -> Dict[str,float]:
+    def _compute_pre_fuse_token(self, token: str) -> Dict[str,float]:
         tk = token.strip()
         if not tk or tk.isdigit() or all(c in string.punctuation for c in tk):
             return {}
@@ -934,8 +2287,8 @@ class EnhancedDetector:
         
         # Indonesian stem boost
         try:
-            if _id_stemmer_available and _id_stemmer:
-                stem = _id_stemmer.stem(lower)
+            if _id_stemmer():
+                stem = _id_stemmer().stem(lower)
                 if stem and stem != lower and stem in ID_COMPREHENSIVE_ROOTS:
                     fused['id'] = max(fused.get('id', 0.0), 0.85)
                     if 'en' in fused and fused['en'] < 0.80:
@@ -958,36 +2311,78 @@ class EnhancedDetector:
         
         return fused
 
-    def _apply_models_and_fuse(self, tokens: List[str], pre: List[Dict[str,float]]) -> List[Dict[str,float]]:
-        t_dists = self.model_mgr.transformer_probs(tokens) if self.model_mgr.transformer else [{} for _ in tokens]
-        f_dists = self.model_mgr.fasttext_probs_batch(tokens) if self.model_mgr.fasttext else [{} for _ in tokens]
+    def _apply_models_and_fuse(self, tokens: List[str], pre: List[Dict[str,float]],
+                               model_dists: Optional[Tuple[Dict[str, Dict[str,float]], Dict[str, Dict[str,float]]]]=None) -> List[Dict[str,float]]:
+        if model_dists is not None:
+            # Distributions precomputed for a whole micro-batch (detect_languages_many);
+            # under the cascade, confident tokens simply have no transformer entry
+            t_lookup, f_lookup = model_dists
+            out = [self._fuse_token(tok, pre_d, t_lookup.get(tok, {}), f_lookup[tok]) if tok in f_lookup else None
+                   for tok, pre_d in zip(tokens, pre)]
+            # The batch skipped tokens already in the lexicon or the shared cache; one
+            # evicted from the cache since then gets its own model pass here instead
+            # of being fused (and stored again) without any model input
+            late = [i for i, d in enumerate(out) if d is None]
+            if late:
+                for i, dist in zip(late, self._apply_models_and_fuse([tokens[i] for i in late], [pre[i] for i in late])):
+                    out[i] = dist
+            return out # type: ignore
+        else:
+            f_dists = self.model_mgr.fasttext_probs_batch(tokens) if self.model_mgr.fasttext else [{} for _ in tokens]
+            if CASCADE_ENABLED and self.model_mgr.transformer:
+                out = [self._fuse_token(tok, pre_d, {}, fprob) for tok, pre_d, fprob in zip(tokens, pre, f_dists)]
+                uncertain = [i for i, d in enumerate(out) if max(d.values(), default=0.0) < CASCADE_THRESHOLD]
+                t_dists = self.model_mgr.transformer_probs([tokens[i] for i in uncertain])
+                for i, tprob in zip(uncertain, t_dists):
+                    out[i] = self._fuse_token(tokens[i], pre[i], tprob, f_dists[i])
+                self._record_cascade(len(tokens), len(uncertain))
+                return out
+            t_dists = self.model_mgr.transformer_probs(tokens) if self.model_mgr.transformer else [{} for _ in tokens]
         
-        out = []
-        for tok, pre_d, tprob, fprob in zip(tokens, pre, t_dists, f_dists):
-            lower = tok.lower()
-            fused = self._fuse(tok, tprob, fprob, pattern_hint_scores(lower), 
-                             script_candidate_score(tok), char_pattern_score(lower))
+        return [self._fuse_token(tok, pre_d, tprob, fprob)
+                for tok, pre_d, tprob, fprob in zip(tokens, pre, t_dists, f_dists)]
+
+    def _fuse_token(self, tok: str, pre_d: Dict[str,float], tprob: Dict[str,float],
+                    fprob: Dict[str,float]) -> Dict[str,float]:
+        lower = tok.lower()
+        fused = self._fuse(tok, tprob, fprob, pattern_hint_scores(lower), 
+                         script_candidate_score(tok), char_pattern_score(lower))
+        
+        # Blend in pre-fused heuristic distribution
+        if pre_d:
+            alpha = 0.22
+            keys = set(fused.keys()) | set(pre_d.keys())
+            mixed: Dict[str,float] = {}
             
-            # Blend in pre-fused heuristic distribution
-            if pre_d:
-                alpha = 0.22
-                keys = set(fused.keys()) | set(pre_d.keys())
-                mixed: Dict[str,float] = {}
-                
-                for k in keys:
-                    mixed[k] = fused.get(k,0.0)*(1.0 - alpha) + pre_d.get(k,0.0)*alpha
-                
-                tot = sum(mixed.values())
-                if tot > 0:
-                    inv = 1.0/tot
-                    for k in list(mixed.keys()):
-                        mixed[k] *= inv
-                
-                fused = {k:v for k,v in mixed.items() if v >= CANDIDATE_KEEP_THRESHOLD}
+            for k in keys:
+                mixed[k] = fused.get(k,0.0)*(1.0 - alpha) + pre_d.get(k,0.0)*alpha
             
-            out.append(fused)
+            tot = sum(mixed.values())
+            if tot > 0:
+                inv = 1.0/tot
+                for k in list(mixed.keys()):
+                    mixed[k] *= inv
+            
+            fused = {k:v for k,v in mixed.items() if v >= CANDIDATE_KEEP_THRESHOLD}
         
-        return out
+        return fused
+
+    def _cascade_uncertain(self, tokens: List[str], f_dists: List[Dict[str,float]]) -> List[str]:
+        """Tokens whose heuristics + fastText fusion is not confident enough to skip the transformer."""
+        return [tok for tok, fprob in zip(tokens, f_dists)
+                if max(self._fuse_token(tok, self._pre_fuse_token(tok), {}, fprob).values(), default=0.0)
+                < CASCADE_THRESHOLD]
+
+    def _record_cascade(self, total: int, routed: int) -> None:
+        mgr = self.model_mgr
+        mgr.cascade_tokens += total
+        mgr.cascade_transformer_tokens += routed
+        sink = _stage_sink.get()
+        if sink is not None:
+            sink.count('cascade_tokens', total)
+            sink.count('transformer_tokens', routed)
+            # Estimated from the transformer's running per-token cost
+            sink.count('transformer_saved_seconds', (total - routed) * mgr.transformer_seconds_per_token())
 
     def _adaptive_unknown_injection(self, dists: List[Dict[str,float]], tokens: List[str]) -> List[Dict[str,float]]:
         n = len(tokens)
@@ -1345,13 +2740,25 @@ class EnhancedDetector:
         ]
         return any(a in g and b in g for g in groups)
 
-    def _enhanced_dp(self, dists: List[Dict[str,float]], tokens: List[str]) -> List[str]:
+    def _enhanced_dp(self, dists: List[Dict[str,float]], tokens: List[str],
+                     margins_out: Optional[List[float]]=None) -> List[str]:
+        """Viterbi over per-token distributions. When ``margins_out`` is given it
+        receives, per token, the gap between the best complete path through the
+        chosen label and the best through any other label at that position
+        (forward + backward max-marginals), mapped to [0, 1) by _margin_score."""
         n = len(dists)
         if n == 0: return []
         
         if n == 1:
             d0 = dists[0]
-            if not d0: return ["unknown"]
+            if not d0:
+                if margins_out is not None: margins_out.append(0.0)
+                return ["unknown"]
+            if margins_out is not None:
+                ranked = sorted(d0.values(), reverse=True)
+                second = ranked[1] if len(ranked) > 1 else 0.0
+                margins_out.append(_margin_score(math.log(max(ranked[0], MIN_LANG_SCORE))
+                                                 - math.log(max(second, MIN_LANG_SCORE))))
             return [max(d0.items(), key=lambda x: x[1])[0]]
         
         langs = set()
@@ -1365,6 +2772,8 @@ class EnhancedDetector:
         
         dp = [[float('-inf')]*L for _ in range(n)]
         par = [[-1]*L for _ in range(n)]
+        # Edge scores (emission - transition) per step, kept for the backward pass
+        steps: List[List[List[float]]] = []
         
         # Initialize
         if dists[0]:
@@ -1378,6 +2787,7 @@ class EnhancedDetector:
             cur = dists[i]
             cur_tok = tokens[i]
             prev_tok = tokens[i-1]
+            edges = [[float('-inf')]*L for _ in range(L)] if margins_out is not None else None
             
             for ci, cl in enumerate(langs):
                 cs = cur.get(cl, MIN_LANG_SCORE)
@@ -1413,21 +2823,41 @@ class EnhancedDetector:
                     
                     emission_adj = clog - (SCRIPT_MISMATCH_PENALTY if mismatch else 0.0)
                     score = dp[i-1][pj] + emission_adj - trans
+                    if edges is not None:
+                        edges[pj][ci] = emission_adj - trans
                     
                     if score > dp[i][ci]:
                         dp[i][ci] = score
                         par[i][ci] = pj
+            if edges is not None:
+                steps.append(edges)
         
         # Backtrack
         best = max(range(L), key=lambda j: dp[n-1][j])
         path = []
+        path_idx = []
         cur = best
         
         for i in range(n-1, -1, -1):
             path.append(langs[cur])
+            path_idx.append(cur)
             cur = par[i][cur] if par[i][cur] != -1 else cur
         
         path.reverse()
+        if margins_out is not None:
+            path_idx.reverse()
+            # Backward pass: the best continuation from each label, so a token's
+            # margin also reflects the tokens after it, not only those before
+            marginals: List[List[float]] = [dp[n-1]] * n
+            bwd = [0.0] * L
+            for i in range(n - 1, 0, -1):
+                edges = steps[i-1]
+                bwd = [max(e + b for e, b in zip(edges[pj], bwd)) for pj in range(L)]
+                marginals[i-1] = [f + b for f, b in zip(dp[i-1], bwd)]
+            for i, ci in enumerate(path_idx):
+                row = marginals[i]
+                other = max((v for j, v in enumerate(row) if j != ci), default=float('-inf'))
+                margins_out.append(_margin_score(row[ci] - other))
         return [p if p is not None else 'unknown' for p in path]
 
     def _enhanced_transition(self, pl: str, cl: str, prev_tok: str, cur_tok: str) -> float:
@@ -1575,7 +3005,11 @@ class EnhancedDetector:
         # Full sentence models as fallback
         text = " ".join(tokens).strip()
         
-        if self.model_mgr.transformer:
+        if self.model_mgr.transformer_backend is not None:
+            dist = self.model_mgr.transformer_probs([text], TRANSFORMER_SENTENCE_MAX_LENGTH)[0]
+            if dist:
+                return max(dist.items(), key=lambda x: x[1])[0]
+        elif self.model_mgr.transformer:
             try:
                 outs = self.model_mgr.transformer(text)
                 if outs and isinstance(outs, list):
@@ -1657,19 +3091,512 @@ class EnhancedDetector:
         
         return res
 
+    def _script_census(self, tokens: List[str]) -> Optional[List[str]]:
+        """Per-token languages when every token's script decides it, else None.
+        
+        Documents with tokens without letters (digits, punctuation, emoji) take
+        the full pipeline: fastText and the DP label those by context (``123``
+        comes out ``en`` next to English), which the census cannot reproduce.
+        """
+        chosen: List[str] = []
+        for tok in tokens:
+            sc = dominant_script(tok)
+            lang = SCRIPT_DETERMINED_LANG.get(sc.upper()) if sc is not None else None
+            if lang is None or lang not in TOP_20_LANGS:
+                return None
+            chosen.append(lang)
+        return chosen
+
+    def _document_fast_path(self, tokens: List[str]) -> Optional[ScoredSegment]:
+        """The whole document as one segment when its lettered tokens share a script
+        and fastText's document-level label clears DOC_FAST_PATH_THRESHOLD with no
+        token vetoing it (DOC_FAST_PATH_TOKEN_VETO), else None."""
+        if (self.model_mgr.fasttext is None or DOC_FAST_PATH_THRESHOLD > 1.0
+                or len(tokens) < DOC_FAST_PATH_MIN_TOKENS):
+            return None
+        script = None
+        for tok in tokens:
+            sc = dominant_script(tok)
+            if sc is None:
+                continue
+            if script is None:
+                script = sc
+            elif sc != script:
+                return None
+        if script is None:
+            return None
+        
+        text = " ".join(tokens)
+        ranked = sorted(self.model_mgr.fasttext_document_probs(text).items(), key=lambda x: x[1], reverse=True)
+        if not ranked or ranked[0][1] < DOC_FAST_PATH_THRESHOLD:
+            return None
+        lang, p = ranked[0]
+        # fastText must agree with the script (no Latin text labelled ru, say)
+        if lang not in SCRIPT_LANG_MAP.get(script.upper(), [lang]):
+            return None
+        # Code-mixed text can still score high as a whole, and Latin script says
+        # nothing about the language: no token may be claimed by another one
+        lettered = [tok for tok in tokens if dominant_script(tok) is not None]
+        for dist in self.model_mgr.fasttext_probs_batch(lettered):
+            top = max(dist.items(), key=lambda x: x[1], default=None)
+            if top is not None and top[0] != lang and top[1] >= DOC_FAST_PATH_TOKEN_VETO:
+                return None
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        margin = _margin_score(math.log(max(p, MIN_LANG_SCORE)) - math.log(max(second, MIN_LANG_SCORE)))
+        
+        self.debug_counters['doc_fast_path'] += 1
+        sink = _stage_sink.get()
+        if sink is not None:
+            sink.count('doc_fast_path', 1)
+        return (text, lang, round(p, 4), round(margin, 4))
+
+    def _merge_spans(self, tokens: List[str], chosen: List[str], confidence: List[float],
+                     margins: List[float]) -> List[ScoredSegment]:
+        spans = _SpanBuilder()
+        merged: List[ScoredSegment] = []
+        for item in zip(tokens, chosen, confidence, margins):
+            seg = spans.add(*item)
+            if seg is not None:
+                merged.append(seg)
+        seg = spans.close()
+        if seg is not None:
+            merged.append(seg)
+        return merged
+
+    @staticmethod
+    def _stitch_point(prev: List[str], cur: List[str]) -> int:
+        """Where to switch from the earlier window's labels to the later one's inside
+        their overlap: the position nearest the middle at which both Viterbi paths
+        agree, so the stitched path never takes a transition neither window chose."""
+        mid = len(prev) // 2
+        agree = [j for j, (a, b) in enumerate(zip(prev, cur)) if a == b]
+        return min(agree, key=lambda j: abs(j - mid)) if agree else mid
+
+    def _iter_windows(self, tokens: Iterable[str],
+                      model_dists: Optional[Tuple[Dict[str, Dict[str,float]], Dict[str, Dict[str,float]]]]=None
+                      ) -> Iterator[ScoredSegment]:
+        """Label ``tokens`` in windows of WINDOW_TOKENS overlapping by WINDOW_OVERLAP and
+        yield merged segments as they close.
+        
+        Only one window's distributions and DP table are alive at a time. The
+        last WINDOW_OVERLAP tokens of a window are held back and settled by the
+        next window at the stitch point, which gives both sides some context.
+        """
+        step = WINDOW_TOKENS - WINDOW_OVERLAP
+        spans = _SpanBuilder()
+        sink = _stage_sink.get()
+        it = iter(tokens)
+        window = list(islice(it, WINDOW_TOKENS))
+        held: List[Tuple[str, str, float, float]] = []  # previous window's labels for this window's head
+        
+        while window:
+            chosen = self._script_census(window) if SCRIPT_FAST_PATH else None
+            if chosen is not None:
+                confidence = margins = [1.0] * len(chosen)
+            else:
+                chosen, confidence, margins = self._label_tokens(window, model_dists)
+            labelled = list(zip(window, chosen, confidence, margins))
+            
+            fresh = list(islice(it, step))
+            t0 = time.perf_counter() if sink is not None else 0.0
+            cut = self._stitch_point([h[1] for h in held], chosen[:len(held)]) if held else 0
+            settled = len(window) if not fresh else max(len(window) - WINDOW_OVERLAP, cut)
+            for item in held[:cut] + labelled[cut:settled]:
+                seg = spans.add(*item)
+                if seg is not None:
+                    yield seg
+            if sink is not None: _lap(sink, 'span_merge', t0)
+            
+            held = labelled[settled:]
+            window = window[settled:] + fresh
+            if not fresh:
+                break
+        
+        seg = spans.close()
+        if seg is not None:
+            yield seg
+
+    def _iter_tokens(self, text: str) -> Iterator[str]:
+        """tokenize() over whitespace-aligned chunks of ``text``, so no token list
+        for the whole input is ever built."""
+        sink = _stage_sink.get()
+        chunk = WINDOW_TOKENS * 16
+        pos, n = 0, len(text)
+        while pos < n:
+            end = min(pos + chunk, n)
+            if end < n:
+                cut = max(text.rfind(" ", pos, end), text.rfind("\n", pos, end))
+                if cut > pos:
+                    end = cut
+            t0 = time.perf_counter() if sink is not None else 0.0
+            tokens = tokenize(unicodedata.normalize('NFC', text[pos:end]))
+            if sink is not None:
+                _lap(sink, 'tokenize', t0)
+                sink.count('tokens', len(tokens))
+            yield from tokens
+            pos = end
+
+    def detect_languages_stream(self, text: str) -> Iterator[ScoredSegment]:
+        """Scored segments of ``text`` in order, yielded as each window is settled.
+        
+        Memory stays bounded by the window size rather than the input length,
+        for inputs too long to detect in one piece. The document cache is bypassed.
+        """
+        if not text or not text.strip():
+            return
+        sink = _stage_sink.get()
+        if sink is not None:
+            sink.count('documents', 1)
+        yield from self._iter_windows(self._iter_tokens(text))
+
+    def _open_shared_cache(self) -> Optional[SharedTokenCache]:
+        if not SHARED_CACHE_PATH:
+            return None
+        try:
+            shared = SharedTokenCache(SHARED_CACHE_PATH, self.cache_fingerprint(), SHARED_CACHE_SLOTS)
+            logger.info(f"Shared token cache: {shared.path}")
+            return shared
+        except Exception as e:
+            logger.warning(f"Shared token cache unavailable: {e}")
+            return None
+
+    @property
+    def mode(self) -> str:
+        """"full", "fast" (distilled token model), "degraded" (fastText and
+        heuristics only while the transformer is still loading, or after its load
+        failed) or "no-transformer" (the same models, for good: transformers is not
+        installed)."""
+        mgr = self.model_mgr
+        if mgr.distilled is not None:
+            return "fast"
+        if mgr.transformer_state == "unavailable":
+            return "no-transformer"
+        if mgr.transformer is None and mgr.transformer_state != "disabled":
+            return "degraded"
+        return "full"
+
+    def load_transformer(self) -> bool:
+        """Finish a deferred transformer load (see ModelManager.load_transformer).
+        
+        Results cached in degraded mode are dropped once the transformer is in use,
+        the shared token cache reopens under the new cache fingerprint and a token
+        lexicon built with the transformer comes into use.
+        A retired detector (replaced by reload_detector meanwhile) is left as it is.
+        """
+        if self.retired or self.model_mgr.transformer_state != "pending":
+            return self.model_mgr.transformer is not None
+        if not self.model_mgr.load_transformer():
+            return False
+        
+        with self._retire_lock:
+            # Its caches are gone and the shared table may be the replacement's now
+            if self.retired:
+                return False
+            self.model_mgr._attach_lexicon()
+            degraded_shared, self.shared_cache = self.shared_cache, None
+            self.invalidate_caches()
+            if degraded_shared is not None:
+                degraded_shared.close()
+                self.shared_cache = self._open_shared_cache()
+        logger.info(f"Transformer in use after {self.model_mgr.transformer_load_seconds:.1f}s; caches invalidated")
+        return True
+
+    def invalidate_caches(self) -> None:
+        """Drop every cached distribution and result; call after models or weights change."""
+        if self.doc_cache is not None:
+            self.doc_cache.invalidate()
+        self.model_mgr._ft_cache.clear()
+        self.model_mgr._fast_cache.clear()
+        self._token_cache.clear()
+        if self.shared_cache is not None:
+            self.shared_cache.clear()
+        self._pre_fuse_token.cache_clear()
+
+    def retire(self) -> None:
+        """Drop the caches of a detector that has been replaced (see reload_detector).
+        Unlike invalidate_caches this leaves the shared token cache's contents alone,
+        which the replacement may be using, and only closes this detector's handle.
+        A background transformer load still running on it finishes without touching
+        any cache."""
+        with self._retire_lock:
+            self.retired = True
+            if self.doc_cache is not None:
+                self.doc_cache.invalidate()
+            self.model_mgr._ft_cache.clear()
+            self.model_mgr._fast_cache.clear()
+            self._token_cache.clear()
+            if self.shared_cache is not None:
+                self.shared_cache.close()
+                self.shared_cache = None
+            self._pre_fuse_token.cache_clear()
+
+    def cache_fingerprint(self) -> str:
+        """Stamp for persisted caches: changes with the models loaded, their files
+        and settings, the optional tokenizers present and this module's source."""
+        mgr = self.model_mgr
+        
+        def file_id(path: Optional[str]) -> Optional[List[object]]:
+            try:
+                st = os.stat(path)
+                return [os.path.abspath(path), st.st_size, int(st.st_mtime)]
+            except (OSError, TypeError):
+                return None
+        
+        with open(__file__, "rb") as f:
+            source = hashlib.sha256(f.read()).hexdigest()
+        parts = {
+            'source': source,
+            'missing': sorted(missing),
+            'transformer': [TRANSFORMER_MODEL, mgr.transformer_backend, TRANSFORMER_MAX_LENGTH] if mgr.transformer else None,
+            'fasttext': [type(mgr.fasttext).__name__, file_id(mgr.fasttext_path)] if mgr.fasttext else None,
+            'distilled': file_id(DISTILLED_PATH) if mgr.distilled is not None else None,
+            'lexicon': file_id(mgr.lexicon.path) if mgr.lexicon is not None else None,
+            'config': [FASTTEXT_TOP_K, FASTTEXT_TOP_K_SHORT, CANDIDATE_KEEP_THRESHOLD, CASCADE_ENABLED,
+                       CASCADE_THRESHOLD, SCRIPT_FAST_PATH, DOC_FAST_PATH_THRESHOLD, DOC_FAST_PATH_MIN_TOKENS,
+                       DOC_FAST_PATH_TOKEN_VETO, WINDOWED, WINDOW_TOKENS, WINDOW_OVERLAP, DISTILLED_TOP_K],
+            'tunables': self.tunables,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def save_snapshot(self, path: str, max_entries: int=SNAPSHOT_MAX_ENTRIES) -> int:
+        """Write the most recent cache entries to ``path`` (atomically); returns the entry count."""
+        mgr = self.model_mgr
+        ft = list(mgr._ft_cache.items())[-max_entries:] if max_entries > 0 else []
+        fast = list(mgr._fast_cache.items())[-max_entries:] if max_entries > 0 else []
+        docs = self.doc_cache.snapshot(max_entries) if self.doc_cache is not None else []
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'fingerprint': self.cache_fingerprint(),
+            'saved_at': time.time(),
+            'fasttext': [[tok, script, dist] for (tok, script), dist in ft],
+            'distilled': [[tok, dist] for tok, dist in fast],
+            'documents': [[key.hex(), [list(seg) for seg in result]] for key, result in docs],
+        }
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return len(ft) + len(fast) + len(docs)
+
+    def load_snapshot(self, path: str) -> int:
+        """Fill the caches from a save_snapshot file; returns the entry count (0 if stale)."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get('version') != SNAPSHOT_VERSION or data.get('fingerprint') != self.cache_fingerprint():
+            logger.info(f"Cache snapshot {path} was taken under another configuration; ignored")
+            return 0
+        
+        mgr = self.model_mgr
+        for tok, script, dist in data.get('fasttext', []):
+            mgr._ft_cache.setdefault((tok, script), dist)
+        for tok, dist in data.get('distilled', []):
+            mgr._fast_cache.setdefault(tok, dist)
+        docs = 0
+        if self.doc_cache is not None:
+            docs = self.doc_cache.restore((bytes.fromhex(key), [tuple(seg) for seg in result])
+                                          for key, result in data.get('documents', []))
+        # The pre-fuse lru_cache cannot be filled directly; replaying its most
+        # recent tokens is cheap once their fastText entries are back
+        recent = list(dict.fromkeys(tok for tok, _ in mgr._ft_cache))
+        for tok in recent[-(self._pre_fuse_token.cache_info().maxsize or 0):]:
+            self._pre_fuse_token(tok)
+        return len(data.get('fasttext', [])) + len(data.get('distilled', [])) + docs
+
+    def warm_up(self) -> None:
+        """Run a few short texts through every stage so lazily initialised
+        tokenizers (jieba, Janome, PyThaiNLP, the transformer's) load now."""
+        for text in WARM_UP_TEXTS:
+            self._detect_languages_uncached(text)
+        if self.model_mgr.transformer:
+            self.model_mgr.transformer_probs(["warm", "up"])
+
     def detect_languages(self, text: str) -> List[Tuple[str,str]]:
+        return [(seg, lang) for seg, lang, _, _ in self.detect_languages_scored(text)]
+
+    def detect_languages_scored(self, text: str) -> List[ScoredSegment]:
+        """Like detect_languages, with (confidence, margin) per segment; see ScoredSegment."""
         if not text or not text.strip():
             return []
         
+        cache = self.doc_cache
+        if cache is None:
+            return self._detect_languages_uncached(text)
+        
+        key = cache.key(text)
+        hit = cache.get(key)
+        if hit is not None:
+            return list(hit)
+        
+        generation = cache.generation
+        result = self._detect_languages_uncached(text)
+        cache.put(key, result, generation)
+        return result
+
+    def detect_languages_many(self, texts: List[str]) -> List[List[Tuple[str,str]]]:
+        return [[(seg, lang) for seg, lang, _, _ in res] for res in self.detect_languages_many_scored(texts)]
+
+    def detect_languages_many_scored(self, texts: List[str]) -> List[List[ScoredSegment]]:
+        """Detect several documents with one model pass over their distinct tokens."""
+        results: List[Optional[List[ScoredSegment]]] = [None] * len(texts)
+        cache = self.doc_cache
+        todo: Dict[bytes, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            if not text or not text.strip():
+                results[i] = []
+                continue
+            key = DocumentCache.key(text)
+            if key in todo:
+                todo[key].append(i)
+                continue
+            hit = cache.get(key) if cache is not None else None
+            if hit is not None:
+                results[i] = list(hit)
+            else:
+                todo[key] = [i]
+        
+        if todo:
+            sink = _stage_sink.get()
+            t0 = time.perf_counter() if sink is not None else 0.0
+            generation = cache.generation if cache is not None else None
+            token_lists = {key: tokenize(unicodedata.normalize('NFC', texts[idxs[0]])) for key, idxs in todo.items()}
+            if sink is not None:
+                t0 = _lap(sink, 'tokenize', t0)
+                sink.count('documents', len(token_lists))
+                sink.count('tokens', sum(len(toks) for toks in token_lists.values()))
+            # Documents the script census or the document classifier settle never reach the token models
+            decided: Dict[bytes, List[ScoredSegment]] = {}
+            pending: List[List[str]] = []
+            for key, toks in token_lists.items():
+                if not toks or (SCRIPT_FAST_PATH and self._script_census(toks) is not None):
+                    continue
+                seg = self._document_fast_path(toks)
+                if seg is not None:
+                    decided[key] = [seg]
+                else:
+                    pending.append(toks)
+            if sink is not None: t0 = _lap(sink, 'doc_classify', t0)
+            # The fast tier has no shared model pass: the distilled model runs per document
+            vocab = [] if self.model_mgr.distilled is not None else list(dict.fromkeys(t for toks in pending for t in toks))
+            if self.model_mgr.lexicon is not None or self.shared_cache is not None:
+                vocab = [t for t in vocab if not self._is_stored(t)]
+            f_dists = self.model_mgr.fasttext_probs_batch(vocab) if self.model_mgr.fasttext else [{} for _ in vocab]
+            if CASCADE_ENABLED and self.model_mgr.transformer:
+                t_vocab = self._cascade_uncertain(vocab, f_dists)
+                self._record_cascade(len(vocab), len(t_vocab))
+            else:
+                t_vocab = vocab if self.model_mgr.transformer else []
+            t_dists = self.model_mgr.transformer_probs(t_vocab)
+            model_dists = (dict(zip(t_vocab, t_dists)), dict(zip(vocab, f_dists)))
+            if sink is not None: _lap(sink, 'inference', t0)
+            
+            for key, idxs in todo.items():
+                res = decided.get(key) or self._detect_tokens(texts[idxs[0]], token_lists[key], model_dists)
+                if cache is not None:
+                    cache.put(key, res, generation)
+                for i in idxs:
+                    results[i] = list(res)
+        
+        return results # type: ignore
+
+    def _detect_languages_uncached(self, text: str) -> List[ScoredSegment]:
+        sink = _stage_sink.get()
+        t0 = time.perf_counter() if sink is not None else 0.0
         tokens = tokenize(unicodedata.normalize('NFC', text))
+        if sink is not None:
+            _lap(sink, 'tokenize', t0)
+            sink.count('documents', 1)
+            sink.count('tokens', len(tokens))
+        return self._detect_tokens(text, tokens)
+
+    def _detect_tokens(self, text: str, tokens: List[str],
+                       model_dists: Optional[Tuple[Dict[str, Dict[str,float]], Dict[str, Dict[str,float]]]]=None) -> List[ScoredSegment]:
         if not tokens:
-            return [(text.strip(), "unknown")]
+            return [(text.strip(), "unknown", 0.0, 0.0)]
+        
+        sink = _stage_sink.get()
+        t0 = time.perf_counter() if sink is not None else 0.0
+        
+        # Script census: skip the models entirely when script settles every token
+        if SCRIPT_FAST_PATH:
+            chosen = self._script_census(tokens)
+            if chosen is not None:
+                self.debug_counters['script_fast_path'] += 1
+                sure = [1.0] * len(chosen)
+                merged = self._merge_spans(tokens, chosen, sure, sure)
+                if sink is not None:
+                    sink.count('script_fast_path', 1)
+                    _lap(sink, 'script_census', t0)
+                return merged
+            if sink is not None: t0 = _lap(sink, 'script_census', t0)
+        
+        # Document-level early exit; detect_languages_many runs it before batching (model_dists given)
+        if model_dists is None:
+            seg = self._document_fast_path(tokens)
+            if sink is not None: t0 = _lap(sink, 'doc_classify', t0)
+            if seg is not None:
+                return [seg]
+
+        # Long documents go through overlapping windows so working memory stays bounded
+        if WINDOWED and len(tokens) > WINDOW_TOKENS:
+            return list(self._iter_windows(tokens, model_dists))
+        
+        chosen, confidence, margins = self._label_tokens(tokens, model_dists)
+        t0 = time.perf_counter() if sink is not None else 0.0
+        
+        # Merge adjacent spans
+        merged = self._merge_spans(tokens, chosen, confidence, margins)
+        if sink is not None: _lap(sink, 'span_merge', t0)
+        return merged
+
+    def token_distributions(self, tokens: List[str],
+                            model_dists: Optional[Tuple[Dict[str, Dict[str,float]], Dict[str, Dict[str,float]]]]=None
+                            ) -> List[Dict[str,float]]:
+        """Context-free per-token distributions: heuristics, models, fusion and the
+        low-confidence fallback, or the distilled model in the "fast" tier.
+        Tokens in the lexicon or the shared cache take the stored distribution and
+        skip all of that; the rest are computed once each and shared."""
+        lexicon, shared = self.model_mgr.lexicon, self.shared_cache
+        if lexicon is None and shared is None:
+            return self._compute_token_distributions(tokens, model_dists)
+        
+        found = [lexicon.get(t) for t in tokens] if lexicon is not None else [None] * len(tokens)
+        if shared is not None:
+            unlisted = [i for i, d in enumerate(found) if d is None]
+            for i, d in zip(unlisted, shared.lookup([tokens[i] for i in unlisted])):
+                found[i] = d
+        misses = list(dict.fromkeys(t for t, d in zip(tokens, found) if d is None))
+        computed: Dict[str, Dict[str,float]] = {}
+        if misses:
+            computed = dict(zip(misses, self._compute_token_distributions(misses, model_dists)))
+            if shared is not None:
+                for tok, dist in computed.items():
+                    shared.put(tok, dist)
+        # Copies: later stages edit distributions in place
+        return [d if d is not None else dict(computed[t]) for t, d in zip(tokens, found)]
+
+    def _is_stored(self, token: str) -> bool:
+        lexicon, shared = self.model_mgr.lexicon, self.shared_cache
+        return (lexicon is not None and lexicon.find(token) >= 0) or (shared is not None and shared.get(token) is not None)
+
+    def _compute_token_distributions(self, tokens: List[str],
+                                     model_dists: Optional[Tuple[Dict[str, Dict[str,float]], Dict[str, Dict[str,float]]]]=None
+                                     ) -> List[Dict[str,float]]:
+        sink = _stage_sink.get()
+        t0 = time.perf_counter() if sink is not None else 0.0
+        
+        if self.model_mgr.distilled is not None:
+            fused = self.model_mgr.distilled_probs(tokens)
+            if sink is not None: _lap(sink, 'inference', t0)
+            return fused
         
         # Pre-fuse with enhanced heuristics
         pre = [self._pre_fuse_token(t) for t in tokens]
+        if sink is not None: t0 = _lap(sink, 'prefuse', t0)
         
         # Apply models and fuse
-        fused = self._apply_models_and_fuse(tokens, pre)
+        fused = self._apply_models_and_fuse(tokens, pre, model_dists)
+        if sink is not None: t0 = _lap(sink, 'inference', t0)
         
         # Heuristic fallback for low-confidence tokens
         for i, dist in enumerate(fused):
@@ -1682,15 +3609,30 @@ class EnhancedDetector:
                 if fb:
                     tot = sum(fb.values())
                     fused[i] = {k: v/tot for k, v in fb.items()}
+        if sink is not None: _lap(sink, 'fallback', t0)
+        return fused
+
+    def _label_tokens(self, tokens: List[str],
+                      model_dists: Optional[Tuple[Dict[str, Dict[str,float]], Dict[str, Dict[str,float]]]]=None
+                      ) -> Tuple[List[str], List[float], List[float]]:
+        """Per-token languages, confidences and DP margins from the full heuristic + model + DP path."""
+        fused = self.token_distributions(tokens, model_dists)
+        sink = _stage_sink.get()
+        t0 = time.perf_counter() if sink is not None else 0.0
         
         # Unknown injection (conservative)
         fused = self._adaptive_unknown_injection(fused, tokens)
+        if sink is not None: t0 = _lap(sink, 'unknown_injection', t0)
         
         # Enhanced disambiguation
         fused = self._enhanced_disambiguate(fused, tokens)
+        if sink is not None: t0 = _lap(sink, 'disambiguate', t0)
         
         # Enhanced DP smoothing
-        chosen = self._enhanced_dp(fused, tokens)
+        margins: List[float] = []
+        chosen = self._enhanced_dp(fused, tokens, margins)
+        dp_path = list(chosen)
+        if sink is not None: t0 = _lap(sink, 'dp', t0)
         
         # Post-processing
         unk_ratio = sum(1 for c in chosen if c == 'unknown') / len(chosen)
@@ -1705,70 +3647,519 @@ class EnhancedDetector:
                     maxp = max(fused[i].values()) if fused[i] else 0.0
                     new.append(guess if maxp < 0.08 else c)
                 chosen = new
+            if sink is not None: t0 = _lap(sink, 'sentence_guess', t0)
         
         # Fill remaining unknowns
         chosen = self._fill_unknowns(tokens, chosen, fused)
+        if sink is not None: t0 = _lap(sink, 'fill_unknowns', t0)
         
         # Conservative Latin consolidation
         chosen = self._latin_consolidation(tokens, chosen)
+        if sink is not None: t0 = _lap(sink, 'latin_consolidation', t0)
         
-        # Merge adjacent spans
-        merged: List[Tuple[str,str]] = []
-        cur_lang, buf = None, []
-        
-        for tok, lang in zip(tokens, chosen):
-            tok_script = dominant_script(tok)
-            prev_script = dominant_script(buf[-1]) if buf else None
-            
-            if cur_lang is None:
-                cur_lang, buf = lang, [tok]
-            elif lang == cur_lang and (not tok_script or not prev_script or tok_script == prev_script):
-                buf.append(tok)
-            else:
-                merged.append((" ".join(buf), cur_lang))
-                cur_lang, buf = lang, [tok]
-        
-        if buf and cur_lang is not None:
-            merged.append((" ".join(buf), cur_lang))
-        
-        return [(seg.strip(), lang) for seg, lang in merged if seg.strip()]
+        # Labels changed after the DP keep no DP margin
+        confidence = [fused[i].get(lang, 0.0) for i, lang in enumerate(chosen)]
+        margins = [m if lang == dp_lang else 0.0 for m, lang, dp_lang in zip(margins, chosen, dp_path)]
+        return chosen, confidence, margins
 
 # ------------------------------
 # Global API
 # ------------------------------
 
 _global_detector: Optional[EnhancedDetector] = None
+_detector_lock = threading.Lock()
+# Arguments the global detector was built with, reused by reload_detector
+_detector_args: Tuple[bool, str] = (True, FASTTEXT_PATH_DEFAULT)
+# Set once the global detector has its final models (transformer loaded or given up)
+_models_loaded = threading.Event()
 
 def get_detector(enable_transformer: bool=True, fasttext_path: str=FASTTEXT_PATH_DEFAULT) -> EnhancedDetector:
-    global _global_detector
+    global _global_detector, _detector_args
     if _global_detector is None:
-        _global_detector = EnhancedDetector(enable_transformer, fasttext_path)
+        with _detector_lock:
+            if _global_detector is None:
+                det = EnhancedDetector(enable_transformer, fasttext_path, defer_transformer=BACKGROUND_LOAD)
+                _global_detector, _detector_args = det, (enable_transformer, fasttext_path)
+                if det.model_mgr.transformer_state == "pending":
+                    _start_transformer_load(det)
+                else:
+                    _models_loaded.set()
+                    if SNAPSHOT_PATH:
+                        _start_snapshots(det)
     return _global_detector
 
+def _start_transformer_load(det: EnhancedDetector) -> None:
+    def run() -> None:
+        try:
+            det.load_transformer()
+        except Exception as e:
+            logger.warning(f"Background transformer load failed: {e}")
+        # Snapshots are keyed to the final models, so they start only now (a
+        # detector retired by a reload meanwhile has been replaced by one that has them)
+        if SNAPSHOT_PATH and not det.retired:
+            _start_snapshots(det)
+        _models_loaded.set()
+    threading.Thread(target=run, name="polylangid-transformer-load", daemon=True).start()
+
+def _wait_for_transformer_load() -> None:
+    # The child of a fork during the load would get no loader thread and
+    # half-imported modules, so forks wait for the load to finish
+    det = _global_detector
+    if det is not None and det.model_mgr.transformer_state in ("pending", "loading"):
+        _models_loaded.wait()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_wait_for_transformer_load)
+
+def start_detector(enable_transformer: bool=True, fasttext_path: str=FASTTEXT_PATH_DEFAULT) -> None:
+    """Build the global detector on a background thread, so a server can answer
+    readiness probes (detector_status) while it loads."""
+    if _global_detector is None:
+        threading.Thread(target=get_detector, args=(enable_transformer, fasttext_path),
+                         name="polylangid-detector-load", daemon=True).start()
+
+def wait_for_models(timeout: Optional[float]=None) -> bool:
+    """Block until the global detector has its final models; False on timeout."""
+    return _models_loaded.wait(timeout)
+
+def detector_status() -> Dict[str, object]:
+    """Readiness of the global detector: ``ready`` once it can serve (possibly
+    degraded), its ``mode`` (see EnhancedDetector.mode) and the transformer's load state."""
+    det = _global_detector
+    if det is None:
+        return {'ready': False, 'mode': None, 'transformer': None}
+    mgr = det.model_mgr
+    return {
+        'ready': True,
+        'mode': det.mode,
+        'transformer': mgr.transformer_state,
+        'transformer_load_seconds': round(mgr.transformer_load_seconds, 3),
+        'fasttext': mgr.fasttext is not None,
+    }
+
+_snapshot_stop = threading.Event()
+_snapshot_mark: Optional[Tuple[int, int, int]] = None
+
+def _cache_mark(det: EnhancedDetector) -> Tuple[int, int, int]:
+    # Changes whenever a cache gains entries
+    mgr = det.model_mgr
+    return (mgr.ft_cache_misses, len(mgr._fast_cache), det.doc_cache.misses if det.doc_cache is not None else 0)
+
+def save_cache_snapshot(path: Optional[str]=None) -> int:
+    """Snapshot the global detector's caches to ``path`` (default SNAPSHOT_PATH)."""
+    global _snapshot_mark
+    path = path or SNAPSHOT_PATH
+    if _global_detector is None or not path:
+        return 0
+    try:
+        mark = _cache_mark(_global_detector)
+        saved = _global_detector.save_snapshot(path)
+        _snapshot_mark = mark
+        return saved
+    except Exception as e:
+        logger.warning(f"Cache snapshot save failed: {e}")
+        return 0
+
+def load_cache_snapshot(path: Optional[str]=None) -> int:
+    """Fill the global detector's caches from ``path`` (default SNAPSHOT_PATH)."""
+    path = path or SNAPSHOT_PATH
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        return get_detector().load_snapshot(path)
+    except Exception as e:
+        logger.warning(f"Cache snapshot load failed: {e}")
+        return 0
+
+def _autosave_snapshot() -> None:
+    # Only when something was added: a pre-fork master never serves, and must not
+    # overwrite its workers' snapshots with the caches it loaded at startup
+    if _global_detector is not None and _cache_mark(_global_detector) != _snapshot_mark:
+        save_cache_snapshot()
+
+def _start_snapshot_thread() -> None:
+    def loop() -> None:
+        while not _snapshot_stop.wait(SNAPSHOT_INTERVAL):
+            _autosave_snapshot()
+    threading.Thread(target=loop, name="polylangid-snapshot", daemon=True).start()
+
+def _warm_start(det: EnhancedDetector) -> None:
+    if SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH):
+        try:
+            loaded = det.load_snapshot(SNAPSHOT_PATH)
+            logger.info(f"Cache snapshot loaded: {SNAPSHOT_PATH} ({loaded} entries)")
+        except Exception as e:
+            logger.warning(f"Cache snapshot load failed: {e}")
+    det.warm_up()
+
+def _start_snapshots(det: EnhancedDetector) -> None:
+    global _snapshot_mark
+    _warm_start(det)
+    _snapshot_mark = _cache_mark(det)
+    # atexit handlers survive fork; the periodic thread has to be restarted in children
+    atexit.register(_autosave_snapshot)
+    if SNAPSHOT_INTERVAL > 0:
+        _start_snapshot_thread()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_start_snapshot_thread)
+
 def detect_languages(text: str) -> List[Tuple[str,str]]:
     det = get_detector()
     return det.detect_languages(text)
 
+def detect_languages_many(texts: List[str]) -> List[List[Tuple[str,str]]]:
+    det = get_detector()
+    return det.detect_languages_many(texts)
+
+def detect_languages_scored(text: str) -> List[ScoredSegment]:
+    det = get_detector()
+    return det.detect_languages_scored(text)
+
+def detect_languages_many_scored(texts: List[str]) -> List[List[ScoredSegment]]:
+    det = get_detector()
+    return det.detect_languages_many_scored(texts)
+
+def detect_languages_stream(text: str) -> Iterator[ScoredSegment]:
+    det = get_detector()
+    return det.detect_languages_stream(text)
+
+def invalidate_caches() -> None:
+    """Invalidate the global detector's caches (model or weight reload hook)."""
+    if _global_detector is not None:
+        _global_detector.invalidate_caches()
+
+def cache_stats() -> Dict[str, float]:
+    if _global_detector is None or _global_detector.doc_cache is None:
+        return {}
+    return _global_detector.doc_cache.stats()
+
+def detector_stats() -> Dict[str, object]:
+    """Snapshot of the global detector's caches and counters (empty until it is built)."""
+    det = _global_detector
+    if det is None:
+        return {}
+    mgr = det.model_mgr
+    prefuse = det._pre_fuse_token.cache_info()
+    caches = {
+        'fasttext': {'hits': mgr.ft_cache_hits, 'misses': mgr.ft_cache_misses, 'entries': len(mgr._ft_cache)},
+        'prefuse': {'hits': prefuse.hits, 'misses': prefuse.misses, 'entries': prefuse.currsize},
+    }
+    if mgr.distilled is not None:
+        caches['distilled'] = {'hits': mgr.fast_cache_hits, 'misses': mgr.fast_cache_misses,
+                               'entries': len(mgr._fast_cache)}
+    if mgr.lexicon is not None:
+        caches['lexicon'] = {'hits': mgr.lexicon.hits, 'misses': mgr.lexicon.misses, 'entries': len(mgr.lexicon)}
+    if det.shared_cache is not None:
+        caches['shared'] = det.shared_cache.stats()
+    if det.doc_cache is not None:
+        caches['document'] = det.doc_cache.stats()
+    return {
+        'mode': det.mode,
+        'caches': caches,
+        'batch_sizes': {model: dict(sizes) for model, sizes in mgr.batch_sizes.items()},
+        'cascade': {
+            'tokens': mgr.cascade_tokens,
+            'transformer_tokens': mgr.cascade_transformer_tokens,
+            'transformer_seconds_per_token': mgr.transformer_seconds_per_token(),
+        },
+        'debug_counters': dict(det.debug_counters),
+    }
+
+# ------------------------------
+# Hot reload
+# ------------------------------
+
+# Detection tunables reload_detector re-reads from CONFIG_PATH. Everything else
+# (model paths and backends, cache sizes, batching) is fixed at import. The
+# environment is not re-read either: a running process cannot see changes to it.
+TUNABLES = (
+    "SWITCH_PENALTY", "SHORT_SWITCH_EXTRA", "SCRIPT_MISMATCH_PENALTY",
+    "UNKNOWN_RATIO_FALLBACK", "UNKNOWN_MIN_PROB", "UNKNOWN_INJECT_MAXP_THRESHOLD",
+    "UNKNOWN_NEIGHBOR_FILL_THRESHOLD", "CANDIDATE_KEEP_THRESHOLD",
+    "SCRIPT_FAST_PATH", "CASCADE_ENABLED", "CASCADE_THRESHOLD",
+    "DOC_FAST_PATH_THRESHOLD", "DOC_FAST_PATH_MIN_TOKENS", "DOC_FAST_PATH_TOKEN_VETO",
+    "WINDOWED", "WINDOW_TOKENS", "WINDOW_OVERLAP",
+)
+_tunable_defaults: Dict[str, object] = {name: globals()[name] for name in TUNABLES}
+
+def read_tunables(path: str=CONFIG_PATH) -> Dict[str, object]:
+    """The import-time tunables overridden by the JSON object in ``path``.
+    Raises OSError or ValueError (unknown name, wrong type, bad JSON)."""
+    values = dict(_tunable_defaults)
+    if not path:
+        return values
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{path}: expected a JSON object")
+    for name, value in overrides.items():
+        if name not in values:
+            raise ValueError(f"{path}: unknown tunable {name!r}")
+        kind = type(values[name])
+        ok = isinstance(value, bool) if kind is bool else (
+            not isinstance(value, bool) and isinstance(value, int if kind is int else (int, float)))
+        if not ok:
+            raise ValueError(f"{path}: {name} must be {kind.__name__}")
+        values[name] = kind(value)
+    values["WINDOW_TOKENS"] = max(values["WINDOW_TOKENS"], 8) # type: ignore
+    values["WINDOW_OVERLAP"] = min(values["WINDOW_OVERLAP"], values["WINDOW_TOKENS"] // 4) # type: ignore
+    return values
+
+def current_tunables() -> Dict[str, object]:
+    return {name: globals()[name] for name in TUNABLES}
+
+if CONFIG_PATH:
+    try:
+        globals().update(read_tunables())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Tunables config ignored: {e}")
+
+_reload_lock = threading.Lock()
+_reload_status: Dict[str, object] = {'state': 'idle', 'generation': 0, 'seconds': None, 'finished_at': None, 'error': None}
+
+def reload_detector() -> bool:
+    """Rebuild the global detector from the model files now on disk and swap it in.
+    
+    The replacement is built and warmed while the current detector keeps serving;
+    the swap is a single assignment, so each call into this module runs entirely on
+    one detector or the other. The old detector's caches are dropped afterwards,
+    and a process pool is retired so new workers fork from the replacement.
+    
+    The TUNABLES are re-read from CONFIG_PATH first and recorded on the new
+    detector (``tunables``). They are module globals, so the current detector
+    uses them too for the rest of its life; a failed reload restores the old values.
+    Only this process reloads: under lid_server the master reloads on SIGHUP and
+    forks fresh workers.
+    
+    Returns False, leaving the current detector in place, when a reload is already
+    running, the build fails, or a detector that had the transformer would be
+    replaced by one without it.
+    """
+    global _global_detector, _snapshot_mark
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    try:
+        _reload_status.update(state='reloading', error=None)
+        started = time.perf_counter()
+        old = _global_detector
+        old_tunables = current_tunables()
+        try:
+            if old is not None and SNAPSHOT_PATH:
+                save_cache_snapshot()
+            globals().update(read_tunables())
+            new = EnhancedDetector(*_detector_args)
+            if old is not None and old.mode == "full" and new.mode != "full":
+                raise RuntimeError(f"replacement detector came up in {new.mode} mode")
+            _warm_start(new)
+        except Exception as e:
+            globals().update(old_tunables)
+            logger.warning(f"Detector reload failed, keeping the current one: {e}")
+            _reload_status.update(state='failed', error=str(e), finished_at=time.time())
+            return False
+        
+        with _detector_lock:
+            _global_detector = new
+        _models_loaded.set()
+        if SNAPSHOT_PATH:
+            _snapshot_mark = _cache_mark(new)
+        if old is not None:
+            old.retire()
+        _retire_process_pool()
+        
+        seconds = time.perf_counter() - started
+        _reload_status.update(state='idle', generation=_reload_status['generation'] + 1,
+                              seconds=round(seconds, 3), finished_at=time.time())
+        logger.info(f"Detector reloaded in {seconds:.1f}s (mode {new.mode})")
+        return True
+    finally:
+        _reload_lock.release()
+
+def start_reload() -> bool:
+    """reload_detector on a background thread; False if a reload is already running."""
+    if _reload_lock.locked():
+        return False
+    _reload_status['state'] = 'reloading'
+    threading.Thread(target=reload_detector, name="polylangid-reload", daemon=True).start()
+    return True
+
+def reload_status() -> Dict[str, object]:
+    """State of the last reload ("idle", "reloading" or "failed"), with the number of
+    completed reloads (``generation``), its duration and the current detector's mode and tunables."""
+    status = dict(_reload_status)
+    status['mode'] = _global_detector.mode if _global_detector is not None else None
+    status['tunables'] = _global_detector.tunables if _global_detector is not None else None
+    return status
+
 # ------------------------------
 # Batch processing support
 # ------------------------------
 
-def batch_detect_languages(texts: List[str], max_workers: int=4) -> List[List[Tuple[str,str]]]:
-    if not texts: return []
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_key: Optional[Tuple[int, bool, str]] = None
+_process_pool_lock = threading.Lock()
+
+def _process_worker_init(enable_transformer: bool, fasttext_path: str) -> None:
+    # Detection is GIL-bound Python, so one interpreter per core; keep torch
+    # from oversubscribing the box with its own intra-op threads.
+    if 'torch' not in missing:
+        try:
+            _torch().set_num_threads(1)
+        except Exception:
+            pass
+    get_detector(enable_transformer, fasttext_path)
+
+def _detect_chunk(texts: List[str]) -> List[List[Tuple[str,str]]]:
+    det = get_detector()
+    return [det.detect_languages(t) for t in texts]
+
+def _get_process_pool(max_workers: int, enable_transformer: bool=True,
+                      fasttext_path: str=FASTTEXT_PATH_DEFAULT) -> ProcessPoolExecutor:
+    global _process_pool, _process_pool_key
+    key = (max_workers, enable_transformer, fasttext_path)
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_key != key:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=True)
+            # Fork where available: a detector already built in the parent (and
+            # the fastText/transformer weights behind it) is inherited
+            # copy-on-write instead of being reloaded by every worker.
+            ctx = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx,
+                                                initializer=_process_worker_init,
+                                                initargs=(enable_transformer, fasttext_path))
+            _process_pool_key = key
+        return _process_pool
+
+def _retire_process_pool() -> None:
+    # Queued chunks still finish on the old workers; the next batch forks new ones
+    global _process_pool, _process_pool_key
+    with _process_pool_lock:
+        pool, _process_pool, _process_pool_key = _process_pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+def shutdown_process_pool() -> None:
+    global _process_pool, _process_pool_key
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True)
+        _process_pool, _process_pool_key = None, None
+
+atexit.register(shutdown_process_pool)
+
+def _detect_chunk_unique(texts: List[str]) -> List[List[Tuple[str,str]]]:
+    """Detect a chunk, running each distinct text once."""
+    seen: Dict[str, List[Tuple[str,str]]] = {}
+    det = get_detector()
+    out = []
+    for t in texts:
+        if t not in seen:
+            seen[t] = det.detect_languages(t)
+        out.append(seen[t])
+    return out
+
+def iter_detect_languages(texts: Iterable[str], chunk_size: int=BATCH_CHUNK_SIZE,
+                          max_in_flight: Optional[int]=None, max_workers: Optional[int]=None,
+                          mode: Optional[str]=None,
+                          progress: Optional[Callable[[int], None]]=None) -> Iterator[List[Tuple[str,str]]]:
+    """Stream detection results for ``texts`` in input order.
+
+    Inputs are pulled lazily in chunks of ``chunk_size`` and at most
+    ``max_in_flight`` chunks are queued on the executor at a time, so a long
+    backfill holds a bounded window of inputs and outputs. ``progress`` is
+    called with the number of documents completed so far after each chunk.
+    """
+    mode = mode or BATCH_MODE
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if mode == "process" else 4
+    if max_in_flight is None:
+        max_in_flight = BATCH_MAX_IN_FLIGHT or 2 * max_workers
+    max_in_flight = max(1, max_in_flight)
+    chunk_size = max(1, chunk_size)
     
     det = get_detector()
-    results: List[Optional[List[Tuple[str,str]]]] = [None] * len(texts)
+    # In process mode the workers' caches are private, so the parent answers
+    # repeats from its own document cache and only ships the misses.
+    cache = det.doc_cache if mode == "process" else None
     
-    def process(idx: int):
-        return idx, det.detect_languages(texts[idx])
+    if mode == "process":
+        executor = _get_process_pool(max_workers)
+        owned = False
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        owned = True
     
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futs = [ex.submit(process, i) for i in range(len(texts))]
-        for fut in as_completed(futs):
-            idx, res = fut.result()
-            results[idx] = res
+    window: "deque[Tuple[List[Optional[List[Tuple[str,str]]]], List[Tuple[Optional[bytes], List[int]]], Optional[Future], Optional[int]]]" = deque()
+    done = 0
+    
+    def submit(chunk: List[str]) -> None:
+        results: List[Optional[List[Tuple[str,str]]]] = [None] * len(chunk)
+        todo: List[Tuple[Optional[bytes], List[int]]] = []
+        by_key: Dict[bytes, List[int]] = {}
+        for i, text in enumerate(chunk):
+            if not text or not text.strip():
+                results[i] = []
+            elif cache is None:
+                todo.append((None, [i]))
+            else:
+                by_key.setdefault(DocumentCache.key(text), []).append(i)
+        for key, idxs in by_key.items():
+            hit = cache.get(key)
+            if hit is not None:
+                for i in idxs:
+                    results[i] = list(hit)
+            else:
+                todo.append((key, idxs))
+        generation = cache.generation if cache is not None else None
+        fut = executor.submit(_detect_chunk_unique, [chunk[idxs[0]] for _, idxs in todo]) if todo else None
+        window.append((results, todo, fut, generation))
+    
+    def collect() -> List[Optional[List[Tuple[str,str]]]]:
+        nonlocal done
+        results, todo, fut, generation = window.popleft()
+        if fut is not None:
+            for (key, idxs), res in zip(todo, fut.result()):
+                if key is not None:
+                    cache.put(key, res, generation)
+                for i in idxs:
+                    results[i] = list(res)
+        done += len(results)
+        if progress is not None:
+            progress(done)
+        return results
+    
+    try:
+        chunk: List[str] = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) >= chunk_size:
+                if len(window) >= max_in_flight:
+                    yield from collect()
+                submit(chunk)
+                chunk = []
+        if chunk:
+            if len(window) >= max_in_flight:
+                yield from collect()
+            submit(chunk)
+        while window:
+            yield from collect()
+    finally:
+        for _, _, fut, _ in window:
+            if fut is not None:
+                fut.cancel()
+        if owned:
+            executor.shutdown(wait=True)
+
+def batch_detect_languages(texts: List[str], max_workers: Optional[int]=None, mode: Optional[str]=None,
+                           chunk_size: int=BATCH_CHUNK_SIZE) -> List[List[Tuple[str,str]]]:
+    if not texts: return []
     
-    return results # type: ignore
+    mode = mode or BATCH_MODE
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if mode == "process" else 4
+    # Small batches still get spread over every worker
+    chunk_size = max(1, min(chunk_size, -(-len(texts) // max_workers)))
+    return list(iter_detect_languages(texts, chunk_size=chunk_size, max_workers=max_workers, mode=mode))
 
 if __name__ == "__main__":
     # Example usage
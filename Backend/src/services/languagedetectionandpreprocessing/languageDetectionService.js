@@ -6,12 +6,14 @@ const LANGUAGE_API_URL = process.env.LANGUAGE_API_URL || 'http://127.0.0.1:5001'
 
 /**
  * Detects language and returns the most relevant language and cleaned segment using the LID service.
+ * `confidence` and `margin` (both 0..1) come from the detector for the chosen segment;
+ * they are 0 when the 'en' default is returned because nothing was detected.
  * @param {string} text
- * @returns {Promise<{language: string, confidence: number, cleaned_segment: string}>}
+ * @returns {Promise<{language: string, confidence: number, margin: number, cleaned_segment: string}>}
  */
 async function detectLanguage(text) {
   if (!text || !text.trim()) {
-    return { language: 'en', confidence: 1, cleaned_segment: text };
+    return { language: 'en', confidence: 0, margin: 0, cleaned_segment: text };
   }
   try {
     const res = await axios.post(`${LANGUAGE_API_URL}/detect_and_preprocess`, { text }, { timeout: 5000 });
@@ -26,15 +28,16 @@ async function detectLanguage(text) {
       }
       return {
         language: best.language || 'en',
-        confidence: 1, // The Python API does not return confidence, so default to 1
+        confidence: typeof best.confidence === 'number' ? best.confidence : 0,
+        margin: typeof best.margin === 'number' ? best.margin : 0,
         cleaned_segment: best.cleaned_segment || ''
       };
     } else {
-      return { language: 'en', confidence: 1, cleaned_segment: text };
+      return { language: 'en', confidence: 0, margin: 0, cleaned_segment: text };
     }
   } catch (err) {
     console.error('Language detection failed:', err.message);
-    return { language: 'en', confidence: 1, cleaned_segment: text };
+    return { language: 'en', confidence: 0, margin: 0, cleaned_segment: text };
   }
 }
 
@@ -7,6 +7,7 @@ import re
 import unicodedata
 import os
 import string
+import importlib
 
 # Optional imports with fallbacks
 try:
@@ -19,49 +20,82 @@ try:
 except ImportError:
     SpellChecker = None
 
-try:
-    import spacy
-    # Try to load spacy models with fallbacks
-    spacy_models = {}
-    model_mapping = {
-        'en': 'en_core_web_sm',
-        'es': 'es_core_news_sm', 
-        'fr': 'fr_core_news_sm',
-        'de': 'de_core_news_sm',
-        'it': 'it_core_news_sm',
-        'pt': 'pt_core_news_sm'
-    }
-    
-    for lang, model_name in model_mapping.items():
+# spaCy, jieba, MeCab and KoNLPy take seconds to import (KoNLPy pulls in a JVM
+# bridge), so they are imported on first use, or up front via load_dependencies()
+_optional_modules = {}
+
+
+def _import_optional(name, load):
+    """What ``load()`` returns, or None when the package is not installed; imported once"""
+    if name not in _optional_modules:
         try:
-            spacy_models[lang] = spacy.load(model_name)
-        except OSError:
-            print(f"[WARNING] SpaCy model {model_name} not found for {lang}")
-            spacy_models[lang] = None
-            
-except ImportError:
-    spacy = None
-    spacy_models = {}
+            _optional_modules[name] = load()
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
 
-try:
-    import snowballstemmer
-except ImportError:
-    snowballstemmer = None
 
-try:
-    import jieba
-except ImportError:
-    jieba = None
+def get_spacy():
+    return _import_optional('spacy', lambda: importlib.import_module('spacy'))
+
+
+def get_jieba():
+    return _import_optional('jieba', lambda: importlib.import_module('jieba'))
+
+
+def get_mecab():
+    return _import_optional('MeCab', lambda: importlib.import_module('MeCab'))
+
+
+def get_okt():
+    """KoNLPy's Okt class (not an instance)"""
+    return _import_optional('konlpy', lambda: importlib.import_module('konlpy.tag').Okt)
+
+
+def load_dependencies():
+    """Import every optional tokenizer now, e.g. in a pre-fork master; returns what is missing"""
+    return sorted(name for name, get in (('spacy', get_spacy), ('jieba', get_jieba),
+                                         ('MeCab', get_mecab), ('konlpy', get_okt)) if get() is None)
+
+
+# SpaCy pipelines are loaded on first use, or up front via preload_spacy_models()
+SPACY_MODEL_NAMES = {
+    'en': 'en_core_web_sm',
+    'es': 'es_core_news_sm', 
+    'fr': 'fr_core_news_sm',
+    'de': 'de_core_news_sm',
+    'it': 'it_core_news_sm',
+    'pt': 'pt_core_news_sm'
+}
+spacy_models = {}
+
+
+def get_spacy_model(lang):
+    """Return the spaCy pipeline for a language, loading it on first use"""
+    if lang not in spacy_models:
+        nlp = None
+        model_name = SPACY_MODEL_NAMES.get(lang)
+        spacy = get_spacy() if model_name else None
+        if spacy:
+            try:
+                nlp = spacy.load(model_name)
+            except OSError:
+                print(f"[WARNING] SpaCy model {model_name} not found for {lang}")
+        spacy_models[lang] = nlp
+    return spacy_models[lang]
+
+
+def preload_spacy_models(langs=None):
+    """Load spaCy pipelines ahead of time (all supported languages by default)"""
+    for lang in (SPACY_MODEL_NAMES if langs is None else langs):
+        get_spacy_model(lang)
+    return {lang: nlp is not None for lang, nlp in spacy_models.items()}
 
-try:
-    import MeCab
-except ImportError:
-    MeCab = None
 
 try:
-    from konlpy.tag import Okt
+    import snowballstemmer
 except ImportError:
-    Okt = None
+    snowballstemmer = None
 
 
 def load_txt_stopwords(filepath):
@@ -144,9 +178,9 @@ def preprocess_en(text):
     """English preprocessing"""
     text = text.lower()
     
-    if spacy_models.get('en'):
+    nlp = get_spacy_model('en')
+    if nlp:
         try:
-            nlp = spacy_models['en']
             doc = nlp(text)
             tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         except Exception:
@@ -170,9 +204,9 @@ def preprocess_fr(text):
     """French preprocessing"""
     text = text.lower()
     
-    if spacy_models.get('fr'):
+    nlp = get_spacy_model('fr')
+    if nlp:
         try:
-            nlp = spacy_models['fr']
             doc = nlp(text)
             tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         except Exception:
@@ -195,9 +229,9 @@ def preprocess_de(text):
     """German preprocessing"""
     text = text.lower()
     
-    if spacy_models.get('de'):
+    nlp = get_spacy_model('de')
+    if nlp:
         try:
-            nlp = spacy_models['de']
             doc = nlp(text)
             tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         except Exception:
@@ -220,9 +254,9 @@ def preprocess_es(text):
     """Spanish preprocessing"""
     text = text.lower()
     
-    if spacy_models.get('es'):
+    nlp = get_spacy_model('es')
+    if nlp:
         try:
-            nlp = spacy_models['es']
             doc = nlp(text)
             tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         except Exception:
@@ -245,9 +279,9 @@ def preprocess_it(text):
     """Italian preprocessing"""
     text = text.lower()
     
-    if spacy_models.get('it'):
+    nlp = get_spacy_model('it')
+    if nlp:
         try:
-            nlp = spacy_models['it']
             doc = nlp(text)
             tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         except Exception:
@@ -270,9 +304,9 @@ def preprocess_pt(text):
     """Portuguese preprocessing"""
     text = text.lower()
     
-    if spacy_models.get('pt'):
+    nlp = get_spacy_model('pt')
+    if nlp:
         try:
-            nlp = spacy_models['pt']
             doc = nlp(text)
             tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         except Exception:
@@ -317,6 +351,7 @@ def preprocess_ru(text):
 
 def preprocess_zh(text):
     """Chinese preprocessing"""
+    jieba = get_jieba()
     if jieba:
         try:
             tokens = list(jieba.cut(text))
@@ -335,6 +370,7 @@ def preprocess_zh(text):
 
 def preprocess_ja(text):
     """Japanese preprocessing"""
+    MeCab = get_mecab()
     if MeCab:
         try:
             tagger = MeCab.Tagger()
@@ -353,6 +389,7 @@ def preprocess_ja(text):
 
 def preprocess_ko(text):
     """Korean preprocessing"""
+    Okt = get_okt()
     if Okt:
         try:
             okt = Okt()
@@ -0,0 +1,126 @@
+"""Tests for the Python language detection service (bv2 and the shared handlers).
+
+Run from Backend/ with ``python -m pytest tests``. Detectors are built without
+the transformer, from the fastText model shipped next to bv2.py.
+"""
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BACKEND, os.path.join(BACKEND, 'src', 'python')]
+
+from src.services.languagedetectionandpreprocessing import bv2  # noqa: E402
+import lid_handlers  # noqa: E402
+import lid_metrics  # noqa: E402
+
+
+def _detector(monkeypatch, **env):
+    """A transformer-less detector installed as bv2's global one."""
+    for name, value in env.items():
+        monkeypatch.setattr(bv2, name, value)
+    det = bv2.EnhancedDetector(enable_transformer=False)
+    monkeypatch.setattr(bv2, '_global_detector', det)
+    return det
+
+
+@pytest.fixture
+def distilled_path(tmp_path):
+    langs = ['en', 'fr', '']
+    rng = np.random.default_rng(0)
+    model = bv2.DistilledTokenModel(rng.normal(size=(256, len(langs))), np.zeros(len(langs)), langs)
+    path = str(tmp_path / 'distilled.npz')
+    model.save(path)
+    return path
+
+
+def test_metrics_render_in_fast_tier(monkeypatch, distilled_path):
+    det = _detector(monkeypatch, TOKEN_BACKEND='fast', DISTILLED_PATH=distilled_path)
+    assert det.model_mgr.distilled is not None
+    det.detect_languages_scored('hello hello world bonjour')
+    det.detect_languages_scored('bonjour world')
+
+    body = lid_handlers.metrics()
+    assert 'lid_cache_requests_total{cache="distilled",result="hit"} 2' in body
+    assert 'lid_cache_requests_total{cache="distilled",result="miss"} 4' in body
+    assert 'lid_cache_entries{cache="distilled"} 3' in body
+    assert 'lid_detector_mode{mode="fast"} 1' in body
+
+
+def test_metric_shards_track_live_threads():
+    counter = lid_metrics.Counter('test_total', 'Test counter.')
+    for _ in range(50):
+        worker = threading.Thread(target=counter.inc)
+        worker.start()
+        worker.join()
+    counter.inc()
+
+    assert len(counter._shards) <= 2
+    assert counter.collect() == {(): [51]}
+
+
+def _live_lock_held(path):
+    """Whether some process holds the table's live lock (checked from a child process)."""
+    probe = ('import fcntl, os, sys\n'
+             'fd = os.open(sys.argv[1], os.O_RDWR)\n'
+             'try:\n'
+             '    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, int(sys.argv[2]))\n'
+             'except OSError:\n'
+             '    sys.exit(1)\n')
+    return subprocess.run([sys.executable, '-c', probe, path, str(bv2.SharedTokenCache._LIVE_BYTE)]).returncode == 1
+
+
+def _open_fds(path):
+    """Descriptors this process holds on ``path``."""
+    fds = []
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            fds.append(os.readlink(f'/proc/self/fd/{fd}'))
+        except OSError:
+            pass
+    return fds.count(path)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc/self/fd')
+def test_retired_detector_closes_shared_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(bv2, 'SHARED_CACHE_PATH', str(tmp_path / 'tokens'))
+    monkeypatch.setattr(bv2, 'SHARED_CACHE_SLOTS', 1024)
+    old = _detector(monkeypatch)
+    new = bv2.EnhancedDetector(enable_transformer=False)
+    path = new.shared_cache.path
+    assert old.shared_cache.path == path
+    held = _open_fds(path)
+    assert held > 0
+
+    old.retire()
+    assert old.shared_cache is None
+    assert _open_fds(path) == held
+    assert _live_lock_held(path)
+    new.detect_languages_scored('hello world')
+    assert new.shared_cache.stats()['entries'] > 0
+
+    new.retire()
+    assert _open_fds(path) == 0
+    assert not _live_lock_held(path)
+
+
+def test_reload_progress_from_worker_is_unknown(monkeypatch):
+    monkeypatch.setattr(lid_handlers, 'RELOAD_VIA_MASTER', True)
+    status, code = lid_handlers.reload_progress(authorized=True)
+    assert code == 200
+    assert status['state'] == 'unknown' and status['scope'] == 'worker'
+    assert 'generation' in status
+
+
+def test_fasttext_cache_counts_repeats_per_position(monkeypatch):
+    mgr = _detector(monkeypatch).model_mgr
+    if not isinstance(mgr.fasttext, bv2.NumpyFastText):
+        pytest.skip('needs the NumPy fastText reader')
+    mgr.fasttext_probs_batch(['hola', 'hola', 'mundo'])
+    assert (mgr.ft_cache_hits, mgr.ft_cache_misses) == (0, 3)
+    mgr.fasttext_probs_batch(['hola', 'mundo'])
+    assert (mgr.ft_cache_hits, mgr.ft_cache_misses) == (2, 3)